@@ -12,6 +12,8 @@ from langchain_core.messages import (
 )
 from pydantic import BaseModel
 
+from browser_use.agent.message_manager.token_counter import TokenCounter, get_token_counter
+from browser_use.agent.message_manager.utils import estimate_image_tokens
 from browser_use.agent.message_manager.views import MessageMetadata
 from browser_use.agent.prompts import AgentMessagePrompt
 from browser_use.agent.views import ActionResult, AgentOutput, AgentStepInfo, MessageManagerState
@@ -29,6 +31,8 @@ class MessageManagerSettings(BaseModel):
 	message_context: Optional[str] = None
 	sensitive_data: Optional[Dict[str, str]] = None
 	available_file_paths: Optional[List[str]] = None
+	model_name: Optional[str] = None
+	token_cache_size: int = 1024
 
 
 class MessageManager:
@@ -38,11 +42,15 @@ class MessageManager:
 		system_message: SystemMessage,
 		settings: MessageManagerSettings = MessageManagerSettings(),
 		state: MessageManagerState = MessageManagerState(),
+		token_counter: Optional[TokenCounter] = None,
 	):
 		self.task = task
 		self.settings = settings
 		self.state = state
 		self.system_prompt = system_message
+		self.token_counter = token_counter or get_token_counter(
+			settings.model_name, settings.estimated_characters_per_token, settings.token_cache_size
+		)
 
 		# Only initialize messages if state is empty
 		if len(self.state.history.messages) == 0:
@@ -223,7 +231,7 @@ class MessageManager:
 		if isinstance(message.content, list):
 			for item in message.content:
 				if 'image_url' in item:
-					tokens += self.settings.image_tokens
+					tokens += self._count_image_tokens(item)
 				elif isinstance(item, dict) and 'text' in item:
 					tokens += self._count_text_tokens(item['text'])
 		else:
@@ -233,10 +241,16 @@ class MessageManager:
 			tokens += self._count_text_tokens(msg)
 		return tokens
 
+	def _count_image_tokens(self, item: dict) -> int:
+		"""Estimate the tokens of an image message part from its dimensions, image_tokens if unknown"""
+		image_url = item['image_url']
+		if isinstance(image_url, dict):
+			image_url = image_url.get('url', '')
+		return estimate_image_tokens(image_url, self.settings.image_tokens, self.settings.model_name)
+
 	def _count_text_tokens(self, text: str) -> int:
 		"""Count tokens in a text string"""
-		tokens = len(text) // self.settings.estimated_characters_per_token  # Rough estimate if no tokenizer available
-		return tokens
+		return self.token_counter.count(text)
 
 	def cut_messages(self):
 		"""Get current message list, potentially trimmed to max tokens"""
@@ -252,11 +266,13 @@ class MessageManager:
 			for item in msg.message.content:
 				if 'image_url' in item:
 					msg.message.content.remove(item)
-					diff -= self.settings.image_tokens
-					msg.metadata.tokens -= self.settings.image_tokens
-					self.state.history.current_tokens -= self.settings.image_tokens
+					image_tokens = self._count_image_tokens(item)
+					diff -= image_tokens
+					msg.metadata.tokens -= image_tokens
+					self.state.history.current_tokens -= image_tokens
 					logger.debug(
-						f'Removed image with {self.settings.image_tokens} tokens - total tokens now: {self.state.history.current_tokens}/{self.settings.max_input_tokens}'
+						f'Removed image with {image_tokens} tokens - total tokens now: '
+						f'{self.state.history.current_tokens}/{self.settings.max_input_tokens}'
 					)
 				elif 'text' in item and isinstance(item, dict):
 					text += item['text']
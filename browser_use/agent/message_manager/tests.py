@@ -1,9 +1,14 @@
+import threading
+from unittest.mock import Mock
+
 import pytest
 from langchain_anthropic import ChatAnthropic
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_openai import AzureChatOpenAI, ChatOpenAI
 
 from browser_use.agent.message_manager.service import MessageManager, MessageManagerSettings
+from browser_use.agent.message_manager.token_counter import TiktokenCounter, TokenCounter, get_token_counter
+from browser_use.agent.message_manager.utils import estimate_image_tokens, get_image_mime_type
 from browser_use.agent.views import ActionResult
 from browser_use.browser.views import BrowserState, TabInfo
 from browser_use.dom.views import DOMElementNode, DOMTextNode
@@ -234,4 +239,106 @@ def test_token_overflow_handling_with_real_flow(message_manager: MessageManager,
 		assert message_manager.state.history.current_tokens == total_tokens
 
 
+def test_image_tokens_estimated_from_dimensions():
+	"""Test that image tokens are estimated from the screenshot dimensions instead of the fixed image_tokens"""
+	import base64
+	import struct
+
+	def png(width: int, height: int) -> str:
+		header = b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + struct.pack('>II', width, height)
+		return base64.b64encode(header + b'\x08\x02\x00\x00\x00').decode()
+
+	def jpeg(width: int, height: int) -> str:
+		app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00' + bytes(9)
+		sof0 = b'\xff\xc0' + struct.pack('>HBHH', 17, 8, height, width) + bytes(12)
+		return base64.b64encode(b'\xff\xd8' + app0 + sof0).decode()
+
+	assert get_image_mime_type(jpeg(10, 10)) == 'image/jpeg'
+	assert get_image_mime_type(png(10, 10)) == 'image/png'
+	# 1280x1100 is scaled to 893x768, 2x2 tiles
+	assert estimate_image_tokens(f'data:image/png;base64,{png(1280, 1100)}', 800) == 85 + 170 * 4
+	assert estimate_image_tokens(f'data:image/jpeg;base64,{jpeg(512, 256)}', 800) == 85 + 170 * 1
+	assert estimate_image_tokens('https://example.com/image.png', 800) == 800
+	# Anthropic models bill the pixels, 1000x500 costs 667 tokens and 1280x1100 is capped at 1600
+	assert estimate_image_tokens(f'data:image/png;base64,{png(1000, 500)}', 800, 'claude-3-5-sonnet-latest') == 667
+	assert estimate_image_tokens(f'data:image/png;base64,{png(1280, 1100)}', 800, 'claude-3-5-sonnet-latest') == 1600
+
+	message_manager = MessageManager(
+		task='Test task',
+		system_message=SystemMessage(content='Test actions'),
+		settings=MessageManagerSettings(image_tokens=800),
+	)
+	message = HumanMessage(
+		content=[
+			{'type': 'text', 'text': ''},
+			{'type': 'image_url', 'image_url': {'url': f'data:image/jpeg;base64,{jpeg(640, 400)}'}},
+		]
+	)
+	assert message_manager._count_tokens(message) == 85 + 170 * 2
+
+
+def test_token_counter_caches_counts():
+	"""Test that a custom token counter is used and that repeated texts are only counted once"""
+
+	class WordCounter(TokenCounter):
+		def __init__(self):
+			super().__init__(cache_size=2)
+			self.counted = []
+
+		def _count(self, text: str) -> int:
+			self.counted.append(text)
+			return len(text.split())
+
+	counter = WordCounter()
+	message_manager = MessageManager(
+		task='Test task',
+		system_message=SystemMessage(content='Test actions'),
+		token_counter=counter,
+	)
+	assert message_manager._count_text_tokens('one two three') == 3
+	assert message_manager._count_text_tokens('one two three') == 3
+	assert counter.counted.count('one two three') == 1
+	# Least recently used texts are evicted
+	counter.count('a')
+	counter.count('b')
+	counter.count('one two three')
+	assert counter.counted.count('one two three') == 2
+
+	# Models without a tokenizer fall back to the character estimate
+	assert get_token_counter('claude-3-5-sonnet', characters_per_token=4).count('x' * 40) == 10
+
+
+def test_tiktoken_encoding_is_loaded_lazily(monkeypatch):
+	"""
+	Test that the tiktoken encoding is loaded in the background by the first count, that counts do not wait for a slow
+	download but estimate meanwhile, and that a failed load falls back to the estimate
+	"""
+	tiktoken = pytest.importorskip('tiktoken')
+	download = threading.Event()
+
+	def get_encoding(name):
+		if not download.wait(5):
+			raise ConnectionError(f'Cannot download {name}')
+		return Mock(encode=lambda text, disallowed_special: text.split())
+
+	monkeypatch.setattr(tiktoken, 'get_encoding', Mock(side_effect=get_encoding))
+	counter = get_token_counter('gpt-4o', characters_per_token=1)
+	assert isinstance(counter, TiktokenCounter)
+	tiktoken.get_encoding.assert_not_called()
+
+	counter.load_timeout = 0.05
+	assert counter.count('one two three four') == 18
+	tiktoken.get_encoding.assert_called_once_with('o200k_base')
+	download.set()
+	assert counter._loaded.wait(5)
+	assert counter.count('one two three four') == 4
+	assert counter.count('one two three four five') == 5
+
+	monkeypatch.setattr(tiktoken, 'get_encoding', Mock(side_effect=ConnectionError('Offline')))
+	counter = get_token_counter('gpt-4o', characters_per_token=4)
+	assert counter.count('x' * 40) == 10
+	assert counter.count('y' * 40) == 10
+	tiktoken.get_encoding.assert_called_once_with('o200k_base')
+
+
 # pytest -s browser_use/agent/message_manager/tests.py
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCounter:
+	"""
+	Counts the tokens of message texts. The base class estimates them from the number of characters,
+	subclasses implement _count with a real tokenizer.
+
+	Counts are cached by the hash of the text, so the system prompt, task and history messages
+	that are counted over and over again only get tokenized once.
+	"""
+
+	def __init__(self, characters_per_token: float = 3, cache_size: int = 1024):
+		self.characters_per_token = characters_per_token
+		self.cache_size = cache_size
+		self._cache: OrderedDict[bytes, int] = OrderedDict()
+
+	def count(self, text: str) -> int:
+		"""Count the tokens of a text"""
+		if not text:
+			return 0
+
+		key = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+		tokens = self._cache.get(key)
+		if tokens is not None:
+			self._cache.move_to_end(key)
+			return tokens
+
+		tokens = self._count(text)
+		self._cache[key] = tokens
+		if len(self._cache) > self.cache_size:
+			self._cache.popitem(last=False)
+		return tokens
+
+	def _count(self, text: str) -> int:
+		return int(len(text) // self.characters_per_token)
+
+
+class TiktokenCounter(TokenCounter):
+	"""
+	Exact token counts with the BPE encoding of an OpenAI model. tiktoken downloads the encoding file on first use,
+	which can hang without a network. The encoding is loaded in a background thread started by the first count, which
+	waits for it at most load_timeout seconds. Until the encoding is loaded, or if it cannot be loaded, texts are
+	counted with the character based estimate, and estimates are not cached.
+	"""
+
+	def __init__(self, encoding_name: str, characters_per_token: float = 3, cache_size: int = 1024, load_timeout: float = 2.0):
+		super().__init__(characters_per_token=characters_per_token, cache_size=cache_size)
+		self.encoding_name = encoding_name
+		self.load_timeout = load_timeout
+		self._encoding: Any = None
+		self._loader: Optional[threading.Thread] = None
+		self._loaded = threading.Event()
+
+	def count(self, text: str) -> int:
+		if self._get_encoding() is None:
+			return super()._count(text)
+		return super().count(text)
+
+	def _get_encoding(self) -> Any:
+		"""The encoding if it is loaded, starts loading it on the first call"""
+		if self._loader is None:
+			self._loader = threading.Thread(target=self._load_encoding, name='tiktoken-loader', daemon=True)
+			self._loader.start()
+			self._loaded.wait(self.load_timeout)
+		return self._encoding
+
+	def _load_encoding(self) -> None:
+		try:
+			import tiktoken
+
+			self._encoding = tiktoken.get_encoding(self.encoding_name)
+		except Exception as e:
+			logger.debug(f'Failed to load tiktoken encoding {self.encoding_name}, estimating tokens: {e}')
+		finally:
+			self._loaded.set()
+
+	def _count(self, text: str) -> int:
+		return len(self._encoding.encode(text, disallowed_special=()))
+
+
+def get_token_counter(model_name: Optional[str], characters_per_token: float = 3, cache_size: int = 1024) -> TokenCounter:
+	"""
+	Get the token counter for a model: the tiktoken encoding for OpenAI models if tiktoken is installed (the `tokenizer`
+	extra), otherwise the character based estimate.
+	"""
+	if model_name:
+		try:
+			from tiktoken.model import encoding_name_for_model
+
+			encoding_name = encoding_name_for_model(model_name)
+			return TiktokenCounter(encoding_name, characters_per_token=characters_per_token, cache_size=cache_size)
+		except (ImportError, KeyError):
+			# tiktoken not installed or not an OpenAI model
+			pass
+
+	return TokenCounter(characters_per_token=characters_per_token, cache_size=cache_size)
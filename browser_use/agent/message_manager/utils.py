@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import base64
+import binascii
 import json
 import logging
+import math
 import os
+import struct
 from typing import Any, Optional, Type
 
 from langchain_core.messages import (
@@ -102,6 +106,111 @@ def save_conversation(input_messages: list[BaseMessage], response: Any, target:
 		_write_response_to_file(f, response)
 
 
+def get_image_format(data: bytes) -> Optional[str]:
+	"""Detect the format of a PNG, JPEG or WebP image from its first bytes"""
+	if data[:8] == b'\x89PNG\r\n\x1a\n':
+		return 'png'
+	if data[:3] == b'\xff\xd8\xff':
+		return 'jpeg'
+	if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+		return 'webp'
+	return None
+
+
+def get_image_size(data: bytes) -> Optional[tuple[int, int]]:
+	"""Read (width, height) from the header of a PNG, JPEG or WebP image without decoding it"""
+	image_format = get_image_format(data)
+	if image_format == 'png' and len(data) >= 24:
+		width, height = struct.unpack('>II', data[16:24])
+		return width, height
+
+	if image_format == 'jpeg':
+		# Walk the segments until the start of frame, which holds the dimensions
+		offset = 2
+		while offset + 9 <= len(data):
+			if data[offset] != 0xFF:
+				return None
+			marker = data[offset + 1]
+			if marker == 0xFF:
+				offset += 1
+				continue
+			if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+				height, width = struct.unpack('>HH', data[offset + 5 : offset + 9])
+				return width, height
+			offset += 2 + struct.unpack('>H', data[offset + 2 : offset + 4])[0]
+		return None
+
+	if image_format == 'webp' and len(data) >= 30:
+		chunk = data[12:16]
+		if chunk == b'VP8 ':
+			width, height = struct.unpack('<HH', data[26:30])
+			return width & 0x3FFF, height & 0x3FFF
+		if chunk == b'VP8L':
+			bits = int.from_bytes(data[21:25], 'little')
+			return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+		if chunk == b'VP8X':
+			return int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+
+	return None
+
+
+def _decode_image_header(image_b64: str, length: int = 4096) -> bytes:
+	"""Decode only the start of a base64 image, enough for the format and dimensions"""
+	try:
+		return base64.b64decode(image_b64[: length - length % 4])
+	except (binascii.Error, ValueError):
+		return b''
+
+
+def get_image_mime_type(image_b64: str) -> str:
+	"""Mime type of a base64 encoded screenshot, PNG if it can not be detected"""
+	return f'image/{get_image_format(_decode_image_header(image_b64, 16)) or "png"}'
+
+
+def estimate_image_tokens(image_url: str, default_tokens: int, model_name: Optional[str] = None) -> int:
+	"""
+	Estimate the tokens of an image from its dimensions, with the image pricing of the model's provider.
+	Anthropic models bill the pixels of the image, every other model is estimated with the OpenAI tiles.
+	Images that are not base64 data URLs or whose dimensions can not be read count as default_tokens.
+	"""
+	if not image_url.startswith('data:') or ',' not in image_url:
+		return default_tokens
+
+	image_b64 = image_url.split(',', 1)[1]
+	size = get_image_size(_decode_image_header(image_b64))
+	if size is None and len(image_b64) > 4096:
+		size = get_image_size(_decode_image_header(image_b64, len(image_b64)))
+	if size is None or 0 in size:
+		return default_tokens
+
+	width, height = size
+	if model_name and 'claude' in model_name.lower():
+		return _anthropic_image_tokens(width, height)
+	return _openai_image_tokens(width, height)
+
+
+def _openai_image_tokens(width: float, height: float) -> int:
+	"""
+	The image is fit into 2048x2048, its shortest side scaled down to 768px and every 512px tile costs 170 tokens,
+	plus 85 base tokens.
+	"""
+	scale = min(1.0, 2048 / max(width, height))
+	width, height = width * scale, height * scale
+	scale = min(1.0, 768 / min(width, height))
+	width, height = width * scale, height * scale
+	tiles = math.ceil(width / 512) * math.ceil(height / 512)
+	return 85 + 170 * tiles
+
+
+def _anthropic_image_tokens(width: float, height: float) -> int:
+	"""
+	The image costs width * height / 750 tokens. Images with a long edge above 1568px or above about 1600 tokens are
+	scaled down to fit, so the count is capped there.
+	"""
+	scale = min(1.0, 1568 / max(width, height))
+	return min(math.ceil(width * scale * height * scale / 750), 1600)
+
+
 def _write_messages_to_file(f: Any, messages: list[BaseMessage]) -> None:
 	"""Write messages to conversation file"""
 	for message in messages:
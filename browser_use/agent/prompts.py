@@ -5,6 +5,8 @@ from typing import TYPE_CHECKING, List, Optional
 
 from langchain_core.messages import HumanMessage, SystemMessage
 
+from browser_use.agent.message_manager.utils import get_image_mime_type
+
 if TYPE_CHECKING:
 	from browser_use.agent.views import ActionResult, AgentStepInfo
 	from browser_use.browser.views import BrowserState
@@ -92,6 +94,8 @@ class AgentMessagePrompt:
 				)
 			else:
 				elements_text = f'{elements_text}\n[End of page]'
+			if self.state.truncated:
+				elements_text = f'{elements_text}\n... the page is too large, only part of its elements are listed ...'
 		else:
 			elements_text = 'empty page'
 
@@ -130,7 +134,9 @@ Interactive elements from top layer of the current page inside the viewport:
 					{'type': 'text', 'text': state_description},
 					{
 						'type': 'image_url',
-						'image_url': {'url': f'data:image/png;base64,{self.state.screenshot}'},  # , 'detail': 'low'
+						'image_url': {
+							'url': f'data:{get_image_mime_type(self.state.screenshot)};base64,{self.state.screenshot}'
+						},  # , 'detail': 'low'
 					},
 				]
 			)
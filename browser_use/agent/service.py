@@ -44,6 +44,7 @@ from browser_use.dom.history_tree_processor.service import (
 	DOMHistoryElement,
 	HistoryTreeProcessor,
 )
+from browser_use.dom.views import get_index_remap
 from browser_use.telemetry.service import ProductTelemetry
 from browser_use.telemetry.views import (
 	AgentEndTelemetryEvent,
@@ -192,6 +193,7 @@ class Agent(Generic[Context]):
 				message_context=self.settings.message_context,
 				sensitive_data=sensitive_data,
 				available_file_paths=self.settings.available_file_paths,
+				model_name=self.model_name,
 			),
 			state=self.state.message_manager_state,
 		)
@@ -479,6 +481,7 @@ class Agent(Generic[Context]):
 			tabs=state.tabs,
 			interacted_element=interacted_elements,
 			screenshot=state.screenshot,
+			screenshot_unchanged=state.screenshot_unchanged,
 		)
 
 		history_item = AgentHistory(model_output=model_output, result=result, state=state_history, metadata=metadata)
@@ -648,7 +651,10 @@ class Agent(Generic[Context]):
 		actions: list[ActionModel],
 		check_for_new_elements: bool = True,
 	) -> list[ActionResult]:
-		"""Execute multiple actions"""
+		"""
+		Execute multiple actions. Indices refer to the state the actions were chosen in; indexed actions stop the batch
+		when new elements appeared, and elements with an identity are followed to their index in the current state.
+		"""
 		results = []
 
 		cached_selector_map = await self.browser_context.get_selector_map()
@@ -657,16 +663,36 @@ class Agent(Generic[Context]):
 		await self.browser_context.remove_highlights()
 
 		for i, action in enumerate(actions):
-			if action.get_index() is not None and i != 0:
-				new_state = await self.browser_context.get_state()
-				new_path_hashes = set(e.hash.branch_path_hash for e in new_state.selector_map.values())
+			index = action.get_index()
+			if index is not None and i != 0:
+				if await self.browser_context.has_unchanged_interactive_elements():
+					# No interactive element was added or removed since the last state, its indices are still valid
+					new_selector_map = await self.browser_context.get_selector_map()
+				else:
+					new_selector_map = (await self.browser_context.get_state()).selector_map
+				new_path_hashes = set(e.hash.branch_path_hash for e in new_selector_map.values())
 				if check_for_new_elements and not new_path_hashes.issubset(cached_path_hashes):
-					# next action requires index but there are new elements on the page
+					# next action requires index but there are new elements on the page, e.g. a modal over the target
 					msg = f'Something new appeared after action {i} / {len(actions)}'
 					logger.info(msg)
 					results.append(ActionResult(extracted_content=msg, include_in_memory=True))
 					break
 
+				target = cached_selector_map.get(index)
+				if target is not None and target.element_id is not None:
+					# The element keeps its identity across states, follow it to its index in the new state
+					new_index = get_index_remap(cached_selector_map, new_selector_map).get(index)
+					if new_index is None:
+						msg = f'Element {index} is gone after action {i} / {len(actions)}'
+						logger.info(msg)
+						results.append(ActionResult(extracted_content=msg, include_in_memory=True))
+						break
+					if new_index != index:
+						logger.debug(f'Element {index} moved to index {new_index} after action {i} / {len(actions)}')
+						# The actions of the model output are kept in the history with their original index
+						action = action.model_copy(deep=True)
+						action.set_index(new_index)
+
 			await self._raise_if_stopped_or_paused()
 
 			result = await self.controller.act(
@@ -840,7 +866,7 @@ class Agent(Generic[Context]):
 		if not historical_element or not current_state.element_tree:
 			return action
 
-		current_element = HistoryTreeProcessor.find_history_element_in_tree(historical_element, current_state.element_tree)
+		current_element = HistoryTreeProcessor.find_history_element_in_index(historical_element, current_state.element_index)
 
 		if not current_element or current_element.highlight_index is None:
 			return None
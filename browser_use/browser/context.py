@@ -5,14 +5,17 @@ Playwright browser on steroids.
 import asyncio
 import base64
 import gc
+import hashlib
+import io
 import json
 import logging
 import os
 import re
 import time
 import uuid
+import weakref
 from dataclasses import dataclass, field
-from typing import TYPE_CHECKING, Optional, TypedDict
+from typing import TYPE_CHECKING, Literal, Optional, TypedDict
 
 from playwright._impl._errors import TimeoutError
 from playwright.async_api import Browser as PlaywrightBrowser
@@ -20,6 +23,7 @@ from playwright.async_api import (
 	BrowserContext as PlaywrightBrowserContext,
 )
 from playwright.async_api import (
+	CDPSession,
 	ElementHandle,
 	FrameLocator,
 	Page,
@@ -31,7 +35,7 @@ from browser_use.browser.views import (
 	TabInfo,
 	URLNotAllowedError,
 )
-from browser_use.dom.service import DomService
+from browser_use.dom.service import GET_REGISTERED_ELEMENT_CALL, DomService
 from browser_use.dom.views import DOMElementNode, SelectorMap
 from browser_use.utils import time_execution_async, time_execution_sync
 
@@ -40,6 +44,138 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+# Requests that are waited for before the page is considered loaded
+RELEVANT_RESOURCE_TYPES = frozenset(
+	{
+		'document',
+		'stylesheet',
+		'image',
+		'font',
+		'script',
+		'iframe',
+	}
+)
+
+IGNORED_FETCH_DESTINATIONS = frozenset({'video', 'audio'})
+
+# Class names that can be used in a CSS selector without escaping
+VALID_CLASS_NAME_PATTERN = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_-]*$')
+
+# Attributes that are stable and useful for selection
+SAFE_SELECTOR_ATTRIBUTES = frozenset(
+	{
+		# Data attributes (if they're stable in your application)
+		'id',
+		# Standard HTML attributes
+		'name',
+		'type',
+		'placeholder',
+		# Accessibility attributes
+		'aria-label',
+		'aria-labelledby',
+		'aria-describedby',
+		'role',
+		# Common form attributes
+		'for',
+		'autocomplete',
+		'required',
+		'readonly',
+		# Media attributes
+		'alt',
+		'title',
+		'src',
+		# Custom stable attributes (add any application-specific ones)
+		'href',
+		'target',
+	}
+)
+
+# Test attributes, only used with include_dynamic_attributes
+DYNAMIC_SELECTOR_ATTRIBUTES = frozenset({'data-id', 'data-qa', 'data-cy', 'data-testid'})
+
+RELEVANT_CONTENT_TYPES = (
+	'text/html',
+	'text/css',
+	'application/javascript',
+	'image/',
+	'font/',
+	'application/json',
+)
+
+STREAMING_CONTENT_TYPES = (
+	'streaming',
+	'video',
+	'audio',
+	'webm',
+	'mp4',
+	'event-stream',
+	'websocket',
+	'protobuf',
+)
+
+# Background traffic that never settles or does not matter for the page content
+IGNORED_URL_PATTERNS = (
+	# Analytics and tracking
+	'analytics',
+	'tracking',
+	'telemetry',
+	'beacon',
+	'metrics',
+	# Ad-related
+	'doubleclick',
+	'adsystem',
+	'adserver',
+	'advertising',
+	# Social media widgets
+	'facebook.com/plugins',
+	'platform.twitter',
+	'linkedin.com/embed',
+	# Live chat and support
+	'livechat',
+	'zendesk',
+	'intercom',
+	'crisp.chat',
+	'hotjar',
+	# Push notifications
+	'push-notifications',
+	'onesignal',
+	'pushwoosh',
+	# Background sync/heartbeat
+	'heartbeat',
+	'ping',
+	'alive',
+	# WebRTC and streaming
+	'webrtc',
+	'rtmp://',
+	'wss://',
+	# Common CDNs for dynamic content
+	'cloudfront.net',
+	'fastly.net',
+)
+
+# A single alternation scans each URL once instead of one substring search per pattern
+IGNORED_URL_REGEX = re.compile('|'.join(re.escape(pattern) for pattern in IGNORED_URL_PATTERNS))
+
+
+def get_screenshot_hash(screenshot_b64: str) -> str:
+	"""
+	Perceptual hash of a screenshot: a 64x64 grayscale thumbnail quantized to 32 levels, so re-encoding noise does not
+	change it while visible changes like typed text or an opened menu do. Requires Pillow (the `vision` extra), without
+	it the encoded image is hashed and only byte identical screenshots match.
+	"""
+	data = base64.b64decode(screenshot_b64)
+	try:
+		from PIL import Image
+
+		image = Image.open(io.BytesIO(data))
+		# Lets the jpeg decoder downscale while decoding
+		image.draft('L', (128, 128))
+		thumbnail = image.convert('L').resize((64, 64), Image.Resampling.BOX)
+		data = bytes(value >> 3 for value in thumbnail.tobytes())
+	except (ImportError, OSError):
+		pass
+	return hashlib.blake2b(data, digest_size=16).hexdigest()
+
 
 class BrowserContextWindowSize(TypedDict):
 	width: int
@@ -107,6 +243,73 @@ class BrowserContextConfig:
 
 	    include_dynamic_attributes: bool = True
 	        Include dynamic attributes in the CSS selector. If you want to reuse the css_selectors, it might be better to set this to False.
+
+	    reuse_unchanged_dom_snapshots: True
+	        Keep a MutationObserver in every page. A page without mutations, scrolling, resizing, focus, input or pointer
+	        events since the last state skips the DOM walk and reuses the cached tree. Any other page is walked and
+	        transferred in full, there is no partial update of a changed tree.
+
+	    packed_dom_transfer: False
+	        Return the DOM tree from the page as a single packed JSON string (interned strings, columnar node arrays)
+	        instead of a nested object. Much cheaper to transfer and decode on very large pages.
+
+	    dom_max_nodes: None
+	        Maximum number of DOM nodes buildDomTree.js visits. Elements in the viewport are visited first, the tree of
+	        a page that exceeds the budget is cut off and flagged as truncated. None for no limit.
+
+	    dom_max_millis: None
+	        Maximum time in milliseconds the DOM walk may take, with the same behaviour as dom_max_nodes.
+
+	    dom_time_sliced: False
+	        Walk the DOM in slices between requestIdleCallback calls instead of blocking the page until it is done.
+
+	    dom_intersection_observer: False
+	        Experimental: take the boxes of the DOM walk from one IntersectionObserver pass before it. Every walk then
+	        waits for a rendering frame (at most 100 ms), and the boxes are discarded if the page changed meanwhile.
+	        Not measured to be faster yet, the walk still reads styles and forces layout.
+
+	    dom_hit_test_grid_size: 0
+	        Experimental: cell size in pixels (e.g. 24) of a grid buildDomTree.js hit-tests the viewport on to tell
+	        whether elements are covered. Elements decide from the grid points inside them and fall back to testing
+	        their center when the points disagree or none of them lands on the element. 0 hit-tests the center of
+	        every element on its own. Only pays off on pages with many overlapping elements in the viewport, see
+	        browser_use/dom/tests/occlusion_benchmark.py.
+
+	    dom_engine: 'javascript'
+	        How the DOM tree is extracted. 'javascript' runs buildDomTree.js in the page, 'cdp' builds the same tree from
+	        a single CDP DOMSnapshot.captureSnapshot call (computed styles, layout and paint order of all frames at once)
+	        instead of layout queries per element. 'accessibility' builds the tree like 'cdp', but takes the interactive
+	        elements from the accessibility tree (Accessibility.getFullAXTree) instead of the DOM heuristics. It is an
+	        accuracy mode, not a cheaper one: the full snapshot is still needed for visibility and occlusion, and the
+	        accessibility tree of every frame is fetched on top of it.
+	        Both require chromium and fall back to 'javascript' otherwise.
+
+	    screenshot_format: 'png'
+	        Image format of the screenshots: 'png', 'jpeg' or 'webp'. JPEG and WebP screenshots are encoded by the browser
+	        and are a fraction of the size of a PNG.
+
+	    screenshot_quality: 80
+	        Compression quality (0-100) of jpeg and webp screenshots
+
+	    screenshot_max_width: None
+	    screenshot_max_height: None
+	        Downscale screenshots in the browser to fit into these dimensions (in image pixels, so device scale factor included).
+	        Vision models downscale large images anyway, so sending them smaller only saves upload time.
+
+	    screenshot_grayscale: False
+	        Capture screenshots in grayscale
+
+	    skip_unchanged_screenshots: True
+	        Compare a hash of every screenshot with the previous one. It is a perceptual hash with Pillow installed
+	        (pip install browser-use[vision]), otherwise a hash of the encoded image. An unchanged screenshot reuses the
+	        previous image, so the states and the history share one copy of it. It is still sent to the LLM with every
+	        state, as the state messages of earlier steps are removed from the conversation.
+
+	    reuse_unchanged_state: True
+	        Query a fingerprint of the page (mutation counter of the DOM observer, scroll position, viewport and a hash of
+	        the interactive elements) before building a new state, and return the cached state if it did not change.
+	        Only repeated captures without an action in between are reused, every action drops the fingerprint.
+	        Requires reuse_unchanged_dom_snapshots.
 	"""
 
 	cookies_file: str | None = None
@@ -132,6 +335,22 @@ class BrowserContextConfig:
 	viewport_expansion: int = 500
 	allowed_domains: list[str] | None = None
 	include_dynamic_attributes: bool = True
+	reuse_unchanged_dom_snapshots: bool = True
+	packed_dom_transfer: bool = False
+	dom_max_nodes: Optional[int] = None
+	dom_max_millis: Optional[int] = None
+	dom_time_sliced: bool = False
+	dom_intersection_observer: bool = False
+	dom_hit_test_grid_size: int = 0
+	dom_engine: Literal['javascript', 'cdp', 'accessibility'] = 'javascript'
+
+	screenshot_format: Literal['png', 'jpeg', 'webp'] = 'png'
+	screenshot_quality: int = 80
+	screenshot_max_width: int | None = None
+	screenshot_max_height: int | None = None
+	screenshot_grayscale: bool = False
+	skip_unchanged_screenshots: bool = True
+	reuse_unchanged_state: bool = True
 
 	_force_keep_context_alive: bool = False
 
@@ -140,6 +359,10 @@ class BrowserContextConfig:
 class BrowserSession:
 	context: PlaywrightBrowserContext
 	cached_state: BrowserState | None
+	# Fingerprint of the page the cached state was taken from, None if it is unknown or an action ran since
+	cached_fingerprint: dict | None = None
+	# Fingerprint the selector map of the cached state was taken from, kept across actions to check its indices
+	selector_map_fingerprint: dict | None = None
 
 
 @dataclass
@@ -169,6 +392,11 @@ class BrowserContext:
 		# Initialize these as None - they'll be set up when needed
 		self.session: BrowserSession | None = None
 
+		# DomService per page, so an unchanged page can reuse the previous snapshot
+		self._dom_services: weakref.WeakKeyDictionary[Page, DomService] = weakref.WeakKeyDictionary()
+		# CDP session per page for screenshots encoded by the browser
+		self._cdp_sessions: weakref.WeakKeyDictionary[Page, CDPSession] = weakref.WeakKeyDictionary()
+
 	async def __aenter__(self):
 		"""Async context manager entry"""
 		await self._initialize_session()
@@ -215,6 +443,8 @@ class BrowserContext:
 			# Dereference everything
 			self.session = None
 			self._page_event_handler = None
+			self._dom_services.clear()
+			self._cdp_sessions.clear()
 
 	def __del__(self):
 		"""Cleanup when object is destroyed"""
@@ -331,12 +561,12 @@ class BrowserContext:
 		if self.config.trace_path:
 			await context.tracing.start(screenshots=True, snapshots=True, sources=True)
 
-		# Load cookies if they exist
-		if self.config.cookies_file and os.path.exists(self.config.cookies_file):
-			with open(self.config.cookies_file, 'r') as f:
-				cookies = json.load(f)
-				logger.info(f'Loaded {len(cookies)} cookies from {self.config.cookies_file}')
-				await context.add_cookies(cookies)
+		await self._load_cookies(context)
+
+		if self.config.reuse_unchanged_dom_snapshots:
+			await context.add_init_script(DomService.get_observer_script())
+		if self.config.dom_engine == 'javascript':
+			await context.add_init_script(DomService.get_injection_script())
 
 		# Expose anti-detection scripts
 		await context.add_init_script(
@@ -378,173 +608,96 @@ class BrowserContext:
 		return context
 
 	async def _wait_for_stable_network(self):
+		"""
+		Wait until no relevant request has been pending for `wait_for_network_idle_page_load_time` seconds.
+		Driven by the request lifecycle events instead of polling: a timer is armed whenever the last
+		pending request settles and cancelled when a new one starts.
+		"""
 		page = await self.get_current_page()
+		loop = asyncio.get_running_loop()
 
 		pending_requests = set()
-		last_activity = asyncio.get_event_loop().time()
-
-		# Define relevant resource types and content types
-		RELEVANT_RESOURCE_TYPES = {
-			'document',
-			'stylesheet',
-			'image',
-			'font',
-			'script',
-			'iframe',
-		}
-
-		RELEVANT_CONTENT_TYPES = {
-			'text/html',
-			'text/css',
-			'application/javascript',
-			'image/',
-			'font/',
-			'application/json',
-		}
-
-		# Additional patterns to filter out
-		IGNORED_URL_PATTERNS = {
-			# Analytics and tracking
-			'analytics',
-			'tracking',
-			'telemetry',
-			'beacon',
-			'metrics',
-			# Ad-related
-			'doubleclick',
-			'adsystem',
-			'adserver',
-			'advertising',
-			# Social media widgets
-			'facebook.com/plugins',
-			'platform.twitter',
-			'linkedin.com/embed',
-			# Live chat and support
-			'livechat',
-			'zendesk',
-			'intercom',
-			'crisp.chat',
-			'hotjar',
-			# Push notifications
-			'push-notifications',
-			'onesignal',
-			'pushwoosh',
-			# Background sync/heartbeat
-			'heartbeat',
-			'ping',
-			'alive',
-			# WebRTC and streaming
-			'webrtc',
-			'rtmp://',
-			'wss://',
-			# Common CDNs for dynamic content
-			'cloudfront.net',
-			'fastly.net',
-		}
-
-		async def on_request(request):
+		last_activity = loop.time()
+		network_idle = asyncio.Event()
+		idle_timer: asyncio.TimerHandle | None = None
+
+		def update_idle_timer():
+			nonlocal idle_timer
+			if idle_timer is not None:
+				idle_timer.cancel()
+				idle_timer = None
+			if not pending_requests:
+				idle_timer = loop.call_at(last_activity + self.config.wait_for_network_idle_page_load_time, network_idle.set)
+
+		def on_request(request):
 			# Filter by resource type
 			if request.resource_type not in RELEVANT_RESOURCE_TYPES:
 				return
 
-			# Filter out streaming, websocket, and other real-time requests
-			if request.resource_type in {
-				'websocket',
-				'media',
-				'eventsource',
-				'manifest',
-				'other',
-			}:
-				return
-
-			# Filter out by URL patterns
+			# Filter out by URL patterns, data URLs and blob URLs
 			url = request.url.lower()
-			if any(pattern in url for pattern in IGNORED_URL_PATTERNS):
-				return
-
-			# Filter out data URLs and blob URLs
-			if url.startswith(('data:', 'blob:')):
+			if url.startswith(('data:', 'blob:')) or IGNORED_URL_REGEX.search(url):
 				return
 
 			# Filter out requests with certain headers
 			headers = request.headers
-			if headers.get('purpose') == 'prefetch' or headers.get('sec-fetch-dest') in [
-				'video',
-				'audio',
-			]:
+			if headers.get('purpose') == 'prefetch' or headers.get('sec-fetch-dest') in IGNORED_FETCH_DESTINATIONS:
 				return
 
 			nonlocal last_activity
 			pending_requests.add(request)
-			last_activity = asyncio.get_event_loop().time()
-			# logger.debug(f'Request started: {request.url} ({request.resource_type})')
+			last_activity = loop.time()
+			update_idle_timer()
 
-		async def on_response(response):
+		def on_response(response):
 			request = response.request
 			if request not in pending_requests:
 				return
 
-			# Filter by content type if available
+			# Streaming, irrelevant and very large (> 5MB) responses are settled without counting as activity
 			content_type = response.headers.get('content-type', '').lower()
+			content_length = response.headers.get('content-length', '')
+			is_relevant = (
+				not any(t in content_type for t in STREAMING_CONTENT_TYPES)
+				and any(ct in content_type for ct in RELEVANT_CONTENT_TYPES)
+				and not (content_length.isdigit() and int(content_length) > 5 * 1024 * 1024)
+			)
 
-			# Skip if content type indicates streaming or real-time data
-			if any(
-				t in content_type
-				for t in [
-					'streaming',
-					'video',
-					'audio',
-					'webm',
-					'mp4',
-					'event-stream',
-					'websocket',
-					'protobuf',
-				]
-			):
-				pending_requests.remove(request)
-				return
-
-			# Only process relevant content types
-			if not any(ct in content_type for ct in RELEVANT_CONTENT_TYPES):
-				pending_requests.remove(request)
-				return
-
-			# Skip if response is too large (likely not essential for page load)
-			content_length = response.headers.get('content-length')
-			if content_length and int(content_length) > 5 * 1024 * 1024:  # 5MB
-				pending_requests.remove(request)
-				return
+			nonlocal last_activity
+			pending_requests.discard(request)
+			if is_relevant:
+				last_activity = loop.time()
+			update_idle_timer()
 
+		def on_request_failed(request):
+			# Failed and aborted requests never get a response, the page may still react to them (retries, error UI)
 			nonlocal last_activity
-			pending_requests.remove(request)
-			last_activity = asyncio.get_event_loop().time()
-			# logger.debug(f'Request resolved: {request.url} ({content_type})')
+			if request in pending_requests:
+				pending_requests.discard(request)
+				last_activity = loop.time()
+				update_idle_timer()
 
 		# Attach event listeners
 		page.on('request', on_request)
 		page.on('response', on_response)
+		page.on('requestfailed', on_request_failed)
+		update_idle_timer()
 
 		try:
-			# Wait for idle time
-			start_time = asyncio.get_event_loop().time()
-			while True:
-				await asyncio.sleep(0.1)
-				now = asyncio.get_event_loop().time()
-				if len(pending_requests) == 0 and (now - last_activity) >= self.config.wait_for_network_idle_page_load_time:
-					break
-				if now - start_time > self.config.maximum_wait_page_load_time:
-					logger.debug(
-						f'Network timeout after {self.config.maximum_wait_page_load_time}s with {len(pending_requests)} '
-						f'pending requests: {[r.url for r in pending_requests]}'
-					)
-					break
-
+			await asyncio.wait_for(network_idle.wait(), timeout=self.config.maximum_wait_page_load_time)
+			logger.debug(f'Network stabilized for {self.config.wait_for_network_idle_page_load_time} seconds')
+		except asyncio.TimeoutError:
+			logger.debug(
+				f'Network timeout after {self.config.maximum_wait_page_load_time}s with {len(pending_requests)} '
+				f'pending requests: {[r.url for r in pending_requests]}'
+			)
 		finally:
 			# Clean up event listeners
+			if idle_timer is not None:
+				idle_timer.cancel()
 			page.remove_listener('request', on_request)
 			page.remove_listener('response', on_response)
-
-		logger.debug(f'Network stabilized for {self.config.wait_for_network_idle_page_load_time} seconds')
+			page.remove_listener('requestfailed', on_request_failed)
 
 	async def _wait_for_page_and_frames_load(self, timeout_overwrite: float | None = None):
 		"""
@@ -743,9 +896,21 @@ class BrowserContext:
 	@time_execution_sync('--get_state')  # This decorator might need to be updated to handle async
 	async def get_state(self) -> BrowserState:
 		"""Get the current state of the browser"""
-		await self._wait_for_page_and_frames_load()
 		session = await self.get_session()
+		# Requests and navigations started by the last action may not have changed the DOM yet
+		await self._wait_for_page_and_frames_load()
+
+		fingerprint = await self.get_fingerprint() if self.config.reuse_unchanged_state else None
+		if fingerprint is not None and session.cached_state is not None and fingerprint == session.cached_fingerprint:
+			logger.debug('Page unchanged since the last state, reusing it')
+			return session.cached_state
+
+		# The fingerprint is taken before the update, so changes made while it runs invalidate the state
+		previous_state = session.cached_state
 		session.cached_state = await self._update_state()
+		# A failed update returns the last good state, which must not be tied to the new fingerprint
+		session.cached_fingerprint = fingerprint if session.cached_state is not previous_state else None
+		session.selector_map_fingerprint = session.cached_fingerprint
 
 		# Save cookies if a file is specified
 		if self.config.cookies_file:
@@ -753,6 +918,39 @@ class BrowserContext:
 
 		return session.cached_state
 
+	async def get_fingerprint(self) -> Optional[dict]:
+		"""Structural fingerprint of the current page and the open tabs, None if the page has no DOM observer"""
+		session = await self.get_session()
+		page = await self.get_current_page()
+		fingerprint = await self._get_dom_service(page).get_fingerprint()
+		if fingerprint is None:
+			return None
+		return {**fingerprint, 'url': page.url, 'tabs': len(session.context.pages)}
+
+	def drop_cached_fingerprint(self) -> None:
+		"""
+		Called for every executed action. Its effects, e.g. input values or a pending request, may not be visible in
+		the fingerprint, so the next get_state builds a new state.
+		"""
+		if self.session is not None:
+			self.session.cached_fingerprint = None
+
+	async def has_unchanged_interactive_elements(self) -> bool:
+		"""
+		Whether the page still has the interactive elements of the cached state, so its indices are still valid.
+		Unlike get_state, changes of text, styles or the scroll position are ignored.
+		"""
+		session = await self.get_session()
+		cached = session.selector_map_fingerprint
+		if session.cached_state is None or cached is None:
+			return False
+		# Like get_state, wait for the navigations and requests started by the last action to change the page
+		await self._wait_for_page_and_frames_load()
+		fingerprint = await self.get_fingerprint()
+		return fingerprint is not None and all(
+			fingerprint[key] == cached[key] for key in ('documentId', 'interactive', 'url', 'tabs')
+		)
+
 	async def _update_state(self, focus_element: int = -1) -> BrowserState:
 		"""Update and return state."""
 		session = await self.get_session()
@@ -760,8 +958,8 @@ class BrowserContext:
 		# Check if current page is still valid, if not switch to another available page
 		try:
 			page = await self.get_current_page()
-			# Test if page is still accessible
-			await page.evaluate('1')
+			# Test if page is still accessible, the scroll position and title are read in the same round trip
+			page_info = await self._get_page_info(page)
 		except Exception as e:
 			logger.debug(f'Current page is no longer accessible: {str(e)}')
 			# Get all available pages
@@ -769,31 +967,64 @@ class BrowserContext:
 			if pages:
 				self.state.target_id = None
 				page = await self._get_current_page(session)
-				logger.debug(f'Switched to page: {await page.title()}')
+				page_info = await self._get_page_info(page)
+				logger.debug(f'Switched to page: {page_info["title"]}')
 			else:
 				raise BrowserError('Browser closed: no valid pages available')
 
 		try:
-			await self.remove_highlights()
-			dom_service = DomService(page)
-			content = await dom_service.get_clickable_elements(
-				focus_element=focus_element,
-				viewport_expansion=self.config.viewport_expansion,
-				highlight_elements=self.config.highlight_elements,
-			)
+			timings = {}
 
-			screenshot_b64 = await self.take_screenshot()
-			pixels_above, pixels_below = await self.get_scroll_info(page)
+			async def timed(phase: str, coroutine):
+				start = time.perf_counter()
+				try:
+					return await coroutine
+				finally:
+					timings[phase] = time.perf_counter() - start
+
+			# The DOM build removes the previous highlights itself, tab titles are independent of it
+			dom_service = self._get_dom_service(page)
+			content, tabs = await asyncio.gather(
+				timed(
+					'dom',
+					dom_service.get_clickable_elements(
+						focus_element=focus_element,
+						viewport_expansion=self.config.viewport_expansion,
+						highlight_elements=self.config.highlight_elements,
+					),
+				),
+				timed('tabs', self.get_tabs_info()),
+			)
+			# The screenshot has to wait for the highlights of the DOM build
+			screenshot_b64 = await timed('screenshot', self._take_screenshot(page))
+
+			screenshot_hash = None
+			screenshot_unchanged = False
+			if self.config.skip_unchanged_screenshots and screenshot_b64:
+				screenshot_hash = await timed('screenshot_hash', asyncio.to_thread(get_screenshot_hash, screenshot_b64))
+				previous_state = getattr(self, 'current_state', None)
+				if previous_state and previous_state.screenshot_hash == screenshot_hash and previous_state.url == page.url:
+					# Keep a single copy of the image for all steps it did not change in
+					screenshot_b64 = previous_state.screenshot
+					screenshot_unchanged = True
+
+			logger.debug(
+				'State captured: ' + ', '.join(f'{phase}={duration * 1000:.0f}ms' for phase, duration in timings.items())
+			)
 
 			self.current_state = BrowserState(
 				element_tree=content.element_tree,
 				selector_map=content.selector_map,
+				truncated=content.truncated,
+				registry_id=content.registry_id,
 				url=page.url,
-				title=await page.title(),
-				tabs=await self.get_tabs_info(),
+				title=page_info['title'],
+				tabs=tabs,
 				screenshot=screenshot_b64,
-				pixels_above=pixels_above,
-				pixels_below=pixels_below,
+				screenshot_hash=screenshot_hash,
+				screenshot_unchanged=screenshot_unchanged,
+				pixels_above=page_info['pixelsAbove'],
+				pixels_below=page_info['pixelsBelow'],
 			)
 
 			return self.current_state
@@ -804,6 +1035,24 @@ class BrowserContext:
 				return self.current_state
 			raise
 
+	def _get_dom_service(self, page: Page) -> DomService:
+		"""Get the DomService of a page, keeping its last snapshot between calls"""
+		dom_service = self._dom_services.get(page)
+		if dom_service is None:
+			dom_service = DomService(
+				page,
+				reuse_snapshots=self.config.reuse_unchanged_dom_snapshots,
+				packed=self.config.packed_dom_transfer,
+				engine=self.config.dom_engine,
+				max_nodes=self.config.dom_max_nodes,
+				max_millis=self.config.dom_max_millis,
+				time_sliced=self.config.dom_time_sliced,
+				intersection_observer=self.config.dom_intersection_observer,
+				hit_test_grid_size=self.config.dom_hit_test_grid_size,
+			)
+			self._dom_services[page] = dom_service
+		return dom_service
+
 	# region - Browser Actions
 	@time_execution_async('--take_screenshot')
 	async def take_screenshot(self, full_page: bool = False) -> str:
@@ -815,44 +1064,92 @@ class BrowserContext:
 		await page.bring_to_front()
 		await page.wait_for_load_state()
 
-		screenshot = await page.screenshot(
-			full_page=full_page,
-			animations='disabled',
-		)
+		return await self._take_screenshot(page, full_page)
 
-		screenshot_b64 = base64.b64encode(screenshot).decode('utf-8')
+	async def _take_screenshot(self, page: Page, full_page: bool = False) -> str:
+		config = self.config
+		if (
+			config.screenshot_format != 'png'
+			or config.screenshot_max_width
+			or config.screenshot_max_height
+			or config.screenshot_grayscale
+		):
+			try:
+				return await self._capture_screenshot(page, full_page)
+			except Exception as e:
+				# CDP is only available in chromium
+				logger.debug(f'Failed to capture screenshot over CDP, falling back to playwright: {e}')
 
-		# await self.remove_highlights()
+		if config.screenshot_format == 'png':
+			screenshot = await page.screenshot(full_page=full_page, animations='disabled')
+		else:
+			screenshot = await page.screenshot(
+				full_page=full_page, animations='disabled', type='jpeg', quality=config.screenshot_quality
+			)
 
-		return screenshot_b64
+		return base64.b64encode(screenshot).decode('utf-8')
+
+	async def _capture_screenshot(self, page: Page, full_page: bool = False) -> str:
+		"""
+		Capture a screenshot with Page.captureScreenshot, so encoding, compression and downscaling happen in the browser
+		and only the final image is transferred. Returns it base64 encoded, as CDP does.
+		"""
+		config = self.config
+		cdp_session = self._cdp_sessions.get(page)
+		if cdp_session is None:
+			cdp_session = await page.context.new_cdp_session(page)
+			self._cdp_sessions[page] = cdp_session
+
+		params: dict = {'format': config.screenshot_format, 'captureBeyondViewport': full_page}
+		if config.screenshot_format != 'png':
+			params['quality'] = config.screenshot_quality
+
+		if full_page or config.screenshot_max_width or config.screenshot_max_height:
+			viewport = await page.evaluate(
+				"""(fullPage) => {
+					const root = document.documentElement;
+					const viewport = window.visualViewport;
+					const dpr = window.devicePixelRatio;
+					return fullPage
+						? {x: 0, y: 0, width: root.scrollWidth, height: root.scrollHeight, dpr}
+						: {x: viewport.pageLeft, y: viewport.pageTop, width: viewport.width, height: viewport.height, dpr};
+				}""",
+				full_page,
+			)
+			# The clip scale applies on top of the device scale factor
+			scale = 1.0
+			if config.screenshot_max_width:
+				scale = min(scale, config.screenshot_max_width / (viewport['width'] * viewport['dpr']))
+			if config.screenshot_max_height:
+				scale = min(scale, config.screenshot_max_height / (viewport['height'] * viewport['dpr']))
+			params['clip'] = {
+				'x': viewport['x'],
+				'y': viewport['y'],
+				'width': viewport['width'],
+				'height': viewport['height'],
+				'scale': scale,
+			}
+
+		if not config.screenshot_grayscale:
+			result = await cdp_session.send('Page.captureScreenshot', params)
+			return result['data']
+
+		await cdp_session.send('Emulation.setEmulatedVisionDeficiency', {'type': 'achromatopsia'})
+		try:
+			result = await cdp_session.send('Page.captureScreenshot', params)
+		finally:
+			await cdp_session.send('Emulation.setEmulatedVisionDeficiency', {'type': 'none'})
+		return result['data']
 
 	@time_execution_async('--remove_highlights')
 	async def remove_highlights(self):
 		"""
-		Removes all highlight overlays and labels created by the highlightElement function.
-		Handles cases where the page might be closed or inaccessible.
+		Removes the highlight overlay drawn by buildDomTree.js. All boxes and labels are drawn on one canvas,
+		so this is a single remove. Handles cases where the page might be closed or inaccessible.
 		"""
 		try:
 			page = await self.get_current_page()
-			await page.evaluate(
-				"""
-                try {
-                    // Remove the highlight container and all its contents
-                    const container = document.getElementById('playwright-highlight-container');
-                    if (container) {
-                        container.remove();
-                    }
-
-                    // Remove highlight attributes from elements
-                    const highlightedElements = document.querySelectorAll('[browser-user-highlight-id^="playwright-highlight-"]');
-                    highlightedElements.forEach(el => {
-                        el.removeAttribute('browser-user-highlight-id');
-                    });
-                } catch (e) {
-                    console.error('Failed to remove highlights:', e);
-                }
-                """
-			)
+			await page.evaluate("document.getElementById('playwright-highlight-container')?.remove()")
 		except Exception as e:
 			logger.debug(f'Failed to remove highlights (this is usually ok): {str(e)}')
 			# Don't raise the error since this is not critical functionality
@@ -928,9 +1225,6 @@ class BrowserContext:
 
 			# Handle class attributes
 			if 'class' in element.attributes and element.attributes['class'] and include_dynamic_attributes:
-				# Define a regex pattern for valid class names in CSS
-				valid_class_name_pattern = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_-]*$')
-
 				# Iterate through the class attribute values
 				classes = element.attributes['class'].split()
 				for class_name in classes:
@@ -939,49 +1233,13 @@ class BrowserContext:
 						continue
 
 					# Check if the class name is valid
-					if valid_class_name_pattern.match(class_name):
+					if VALID_CLASS_NAME_PATTERN.match(class_name):
 						# Append the valid class name to the CSS selector
 						css_selector += f'.{class_name}'
 					else:
 						# Skip invalid class names
 						continue
 
-			# Expanded set of safe attributes that are stable and useful for selection
-			SAFE_ATTRIBUTES = {
-				# Data attributes (if they're stable in your application)
-				'id',
-				# Standard HTML attributes
-				'name',
-				'type',
-				'placeholder',
-				# Accessibility attributes
-				'aria-label',
-				'aria-labelledby',
-				'aria-describedby',
-				'role',
-				# Common form attributes
-				'for',
-				'autocomplete',
-				'required',
-				'readonly',
-				# Media attributes
-				'alt',
-				'title',
-				'src',
-				# Custom stable attributes (add any application-specific ones)
-				'href',
-				'target',
-			}
-
-			if include_dynamic_attributes:
-				dynamic_attributes = {
-					'data-id',
-					'data-qa',
-					'data-cy',
-					'data-testid',
-				}
-				SAFE_ATTRIBUTES.update(dynamic_attributes)
-
 			# Handle other attributes
 			for attribute, value in element.attributes.items():
 				if attribute == 'class':
@@ -991,7 +1249,9 @@ class BrowserContext:
 				if not attribute.strip():
 					continue
 
-				if attribute not in SAFE_ATTRIBUTES:
+				if attribute not in SAFE_SELECTOR_ATTRIBUTES and not (
+					include_dynamic_attributes and attribute in DYNAMIC_SELECTOR_ATTRIBUTES
+				):
 					continue
 
 				# Escape special characters in attribute names
@@ -1017,8 +1277,46 @@ class BrowserContext:
 			tag_name = element.tag_name or '*'
 			return f"{tag_name}[highlight_index='{element.highlight_index}']"
 
+	async def get_registered_element(self, element: DOMElementNode) -> Optional[ElementHandle]:
+		"""
+		Resolve an element of the current state from the element registry buildDomTree.js keeps in the page.
+		None if the state has no registry, the page was walked again since, the element was removed or it is
+		inside an iframe, whose elements need a handle of their own frame.
+		"""
+		session = await self.get_session()
+		state = session.cached_state
+		index = element.highlight_index
+		if state is None or state.registry_id is None or index is None or state.selector_map.get(index) is not element:
+			return None
+
+		parent = element.parent
+		while parent is not None:
+			if parent.tag_name == 'iframe':
+				return None
+			parent = parent.parent
+
+		page = await self.get_current_page()
+		try:
+			handle = await page.evaluate_handle(GET_REGISTERED_ELEMENT_CALL, [state.registry_id, index])
+		except Exception as e:
+			logger.debug(f'Failed to resolve element {index} from the registry: {str(e)}')
+			return None
+
+		element_handle = handle.as_element()
+		if element_handle is None:
+			await handle.dispose()
+		return element_handle
+
 	@time_execution_async('--get_locate_element')
 	async def get_locate_element(self, element: DOMElementNode) -> Optional[ElementHandle]:
+		element_handle = await self.get_registered_element(element)
+		if element_handle is not None:
+			try:
+				await element_handle.scroll_into_view_if_needed()
+				return element_handle
+			except Exception as e:
+				logger.debug(f'Registered element cannot be scrolled into view, locating it by selector: {str(e)}')
+
 		current_frame = await self.get_current_page()
 
 		# Start with the target element and collect all parents
@@ -1163,12 +1461,10 @@ class BrowserContext:
 		"""Get information about all tabs"""
 		session = await self.get_session()
 
-		tabs_info = []
-		for page_id, page in enumerate(session.context.pages):
-			tab_info = TabInfo(page_id=page_id, url=page.url, title=await page.title())
-			tabs_info.append(tab_info)
+		pages = session.context.pages
+		titles = await asyncio.gather(*(page.title() for page in pages))
 
-		return tabs_info
+		return [TabInfo(page_id=page_id, url=page.url, title=title) for page_id, (page, title) in enumerate(zip(pages, titles))]
 
 	@time_execution_async('--switch_to_tab')
 	async def switch_to_tab(self, page_id: int) -> None:
@@ -1251,6 +1547,14 @@ class BrowserContext:
 		selector_map = await self.get_selector_map()
 		return selector_map[index]
 
+	async def _load_cookies(self, context: PlaywrightBrowserContext):
+		"""Load cookies from the cookies file into the context if it exists"""
+		if self.config.cookies_file and os.path.exists(self.config.cookies_file):
+			with open(self.config.cookies_file, 'r') as f:
+				cookies = json.load(f)
+				logger.info(f'Loaded {len(cookies)} cookies from {self.config.cookies_file}')
+				await context.add_cookies(cookies)
+
 	async def save_cookies(self):
 		"""Save current cookies to file"""
 		if self.session and self.session.context and self.config.cookies_file:
@@ -1304,6 +1608,19 @@ class BrowserContext:
 		pixels_below = total_height - (scroll_y + viewport_height)
 		return pixels_above, pixels_below
 
+	async def _get_page_info(self, page: Page) -> dict:
+		"""Get the title and scroll position information of a page in a single round trip."""
+		return await page.evaluate(
+			"""() => {
+				const scrollY = window.scrollY;
+				return {
+					title: document.title,
+					pixelsAbove: scrollY,
+					pixelsBelow: document.documentElement.scrollHeight - (scrollY + window.innerHeight),
+				};
+			}"""
+		)
+
 	async def reset_context(self):
 		"""Reset the browser session
 		Call this when you don't want to kill the context but just kill the state
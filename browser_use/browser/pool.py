@@ -0,0 +1,334 @@
+"""
+Pool of long-lived browsers with warm, pre-initialized contexts.
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator
+from urllib.parse import urlsplit
+
+from browser_use.browser.browser import Browser, BrowserConfig
+from browser_use.browser.context import BrowserContext, BrowserContextConfig
+from browser_use.utils import time_execution_async
+
+logger = logging.getLogger(__name__)
+
+# Storage cleared per origin when a context is returned, cookies are handled by clear_cookies_on_release
+CLEARED_STORAGE_TYPES = 'local_storage,indexeddb,websql,cache_storage,service_workers,file_systems'
+
+
+@dataclass
+class BrowserPoolConfig:
+	"""
+	Configuration for the BrowserPool.
+
+	Default values:
+		size: 2
+			Number of browsers kept alive
+
+		contexts_per_browser: 2
+			Number of warm contexts kept ready per browser. This is also the maximum
+			number of concurrent leases per browser.
+
+		max_context_uses: 20
+			Number of leases after which a context is closed and replaced by a fresh one.
+			Use 1 to give every lease a brand new context.
+
+		clear_cookies_on_release: True
+			Clear the cookies of a context when it is returned (cookies from the cookies file are loaded again)
+
+		clear_storage_on_release: True
+			Clear local storage, IndexedDB, cache storage and service workers of every origin the context loaded
+			when it is returned. Session storage goes with the closed pages. Needs CDP, so in other browsers than
+			chromium a returned context is replaced instead.
+
+		health_check_timeout: 5.0
+			Seconds a leased context has to answer a health check before it is replaced
+
+		acquire_timeout: None
+			Maximum seconds to wait for a free context, None waits forever
+
+		replenish_attempts: 3
+			Attempts to create the replacement of a discarded context. When all of them fail, the pool shrinks by
+			one context, and acquire raises once no context is left.
+
+		replenish_backoff: 1.0
+			Seconds to wait before the second attempt, doubled for every further attempt
+	"""
+
+	size: int = 2
+	contexts_per_browser: int = 2
+	max_context_uses: int = 20
+	clear_cookies_on_release: bool = True
+	clear_storage_on_release: bool = True
+	health_check_timeout: float = 5.0
+	acquire_timeout: float | None = None
+	replenish_attempts: int = 3
+	replenish_backoff: float = 1.0
+
+	browser_config: BrowserConfig = field(default_factory=BrowserConfig)
+	context_config: BrowserContextConfig = field(default_factory=BrowserContextConfig)
+
+
+@dataclass
+class PooledBrowser:
+	browser: Browser
+	lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+@dataclass
+class PooledContext:
+	context: BrowserContext
+	pooled_browser: PooledBrowser
+	uses: int = 0
+	# Origins of the documents loaded since the last reset, their storage is cleared on release
+	origins: set[str] = field(default_factory=set)
+
+
+class BrowserPool:
+	"""
+	Keeps `size` browsers alive with `contexts_per_browser` warm contexts each (init scripts, cookies
+	and a page already set up) and leases them to agents:
+
+		async with pool.lease() as browser_context:
+			agent = Agent(task=task, llm=llm, browser_context=browser_context)
+			await agent.run()
+
+	Contexts are health checked before every lease and replaced after `max_context_uses` leases.
+	Browsers that lost their connection are restarted.
+	"""
+
+	def __init__(self, config: BrowserPoolConfig = BrowserPoolConfig()):
+		self.config = config
+		self._browsers: list[PooledBrowser] = []
+		# None is put in when the last context is gone, to wake up the waiting acquire calls
+		self._idle: asyncio.Queue[PooledContext | None] = asyncio.Queue()
+		self._leased: dict[BrowserContext, PooledContext] = {}
+		self._background_tasks: set[asyncio.Task] = set()
+		self._start_lock = asyncio.Lock()
+		# Contexts that are idle, leased or being replaced
+		self._capacity = 0
+		self._started = False
+		self._closed = False
+
+	async def __aenter__(self):
+		await self.start()
+		return self
+
+	async def __aexit__(self, exc_type, exc_val, exc_tb):
+		await self.close()
+
+	@time_execution_async('--start (browser pool)')
+	async def start(self):
+		"""Launch the browsers and warm up their contexts"""
+		async with self._start_lock:
+			if self._started:
+				return
+			if self._closed:
+				raise RuntimeError('Browser pool is closed')
+
+			self._browsers = list(await asyncio.gather(*(self._launch_browser() for _ in range(self.config.size))))
+			warm_contexts = await asyncio.gather(
+				*(
+					self._create_context(pooled_browser)
+					for pooled_browser in self._browsers
+					for _ in range(self.config.contexts_per_browser)
+				)
+			)
+			for pooled in warm_contexts:
+				self._idle.put_nowait(pooled)
+			self._capacity = len(warm_contexts)
+
+			self._started = True
+			logger.info(f'Browser pool started with {len(self._browsers)} browsers and {len(warm_contexts)} warm contexts')
+
+	@asynccontextmanager
+	async def lease(self) -> AsyncIterator[BrowserContext]:
+		"""Lease a warm browser context for the duration of the block"""
+		browser_context = await self.acquire()
+		try:
+			yield browser_context
+		finally:
+			await self.release(browser_context)
+
+	async def acquire(self) -> BrowserContext:
+		"""Take a healthy warm context out of the pool. It must be given back with `release`."""
+		if not self._started:
+			await self.start()
+
+		while True:
+			if self._closed:
+				raise RuntimeError('Browser pool is closed')
+			if self._capacity == 0:
+				raise RuntimeError('Browser pool has no contexts left, replacing them failed')
+
+			pooled = await asyncio.wait_for(self._idle.get(), timeout=self.config.acquire_timeout)
+			if pooled is None:
+				# Pass the wake up on to the next waiting acquire
+				self._idle.put_nowait(None)
+				continue
+			if await self._is_healthy(pooled):
+				pooled.uses += 1
+				self._leased[pooled.context] = pooled
+				return pooled.context
+
+			logger.debug('Pooled browser context failed health check, replacing it')
+			await self._discard(pooled)
+
+	async def release(self, browser_context: BrowserContext):
+		"""Give a leased context back to the pool"""
+		pooled = self._leased.pop(browser_context, None)
+		if pooled is None:
+			raise ValueError('Browser context was not leased from this pool')
+
+		if self._closed:
+			await self._close_context(pooled)
+			return
+
+		if pooled.uses >= self.config.max_context_uses or not await self._reset(pooled):
+			await self._discard(pooled)
+			return
+
+		self._idle.put_nowait(pooled)
+
+	async def close(self):
+		"""Close all contexts and browsers of the pool"""
+		self._closed = True
+
+		for task in list(self._background_tasks):
+			task.cancel()
+		if self._background_tasks:
+			await asyncio.gather(*self._background_tasks, return_exceptions=True)
+
+		while not self._idle.empty():
+			pooled = self._idle.get_nowait()
+			if pooled is not None:
+				await self._close_context(pooled)
+		for pooled in list(self._leased.values()):
+			await self._close_context(pooled)
+		self._leased.clear()
+
+		for pooled_browser in self._browsers:
+			await pooled_browser.browser.close()
+		self._browsers = []
+
+	async def _launch_browser(self) -> PooledBrowser:
+		browser = Browser(config=self.config.browser_config)
+		await browser.get_playwright_browser()
+		return PooledBrowser(browser=browser)
+
+	async def _create_context(self, pooled_browser: PooledBrowser) -> PooledContext:
+		browser_context = BrowserContext(browser=pooled_browser.browser, config=self.config.context_config)
+		# Creates the playwright context with init scripts and cookies, and opens the first page
+		session = await browser_context.get_session()
+		pooled = PooledContext(context=browser_context, pooled_browser=pooled_browser)
+		session.context.on('request', lambda request: self._record_origin(pooled, request.url, request.resource_type))
+		for page in session.context.pages:
+			self._record_origin(pooled, page.url, 'document')
+		return pooled
+
+	@staticmethod
+	def _record_origin(pooled: PooledContext, url: str, resource_type: str):
+		"""Remember the origin of a loaded document (pages and iframes)"""
+		if resource_type != 'document':
+			return
+		parts = urlsplit(url)
+		if parts.scheme in ('http', 'https') and parts.netloc:
+			pooled.origins.add(f'{parts.scheme}://{parts.netloc}')
+
+	def _is_browser_connected(self, pooled_browser: PooledBrowser) -> bool:
+		playwright_browser = pooled_browser.browser.playwright_browser
+		return playwright_browser is not None and playwright_browser.is_connected()
+
+	async def _is_healthy(self, pooled: PooledContext) -> bool:
+		if not self._is_browser_connected(pooled.pooled_browser):
+			return False
+
+		try:
+			page = await asyncio.wait_for(pooled.context.get_current_page(), timeout=self.config.health_check_timeout)
+			return await asyncio.wait_for(page.evaluate('1'), timeout=self.config.health_check_timeout) == 1
+		except Exception as e:
+			logger.debug(f'Browser context health check failed: {e}')
+			return False
+
+	async def _reset(self, pooled: PooledContext) -> bool:
+		"""Bring a returned context back to a blank state, returns False if it should be replaced instead"""
+		try:
+			session = await pooled.context.get_session()
+			old_pages = session.context.pages
+			# Open the fresh page first, closing the last page of a context is not always safe
+			new_page = await session.context.new_page()
+			for page in old_pages:
+				await page.close()
+
+			if self.config.clear_storage_on_release and pooled.origins:
+				# Raises in browsers without CDP, the context is replaced then
+				cdp_session = await session.context.new_cdp_session(new_page)
+				try:
+					for origin in pooled.origins:
+						await cdp_session.send(
+							'Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': CLEARED_STORAGE_TYPES}
+						)
+				finally:
+					await cdp_session.detach()
+				pooled.origins.clear()
+
+			if self.config.clear_cookies_on_release:
+				await session.context.clear_cookies()
+				await pooled.context._load_cookies(session.context)
+
+			session.cached_state = None
+			pooled.context.state.target_id = None
+			return True
+		except Exception as e:
+			logger.debug(f'Failed to reset pooled browser context: {e}')
+			return False
+
+	async def _close_context(self, pooled: PooledContext):
+		try:
+			await pooled.context.close()
+		except Exception as e:
+			logger.debug(f'Failed to close pooled browser context: {e}')
+
+	async def _discard(self, pooled: PooledContext):
+		"""Close a context and warm up a replacement in the background"""
+		await self._close_context(pooled)
+		if self._closed:
+			return
+
+		task = asyncio.create_task(self._replenish(pooled.pooled_browser))
+		self._background_tasks.add(task)
+		task.add_done_callback(self._background_tasks.discard)
+
+	async def _replenish(self, pooled_browser: PooledBrowser):
+		"""Create the replacement of a discarded context, with retries. The pool shrinks if all of them fail."""
+		attempts = self.config.replenish_attempts
+		for attempt in range(attempts):
+			if attempt:
+				await asyncio.sleep(self.config.replenish_backoff * 2 ** (attempt - 1))
+			if self._closed:
+				return
+
+			try:
+				async with pooled_browser.lock:
+					if not self._is_browser_connected(pooled_browser):
+						logger.warning('Pooled browser lost its connection, restarting it')
+						await pooled_browser.browser.close()
+						pooled_browser.browser = Browser(config=self.config.browser_config)
+						await pooled_browser.browser.get_playwright_browser()
+
+				pooled = await self._create_context(pooled_browser)
+				if self._closed:
+					await self._close_context(pooled)
+					return
+				self._idle.put_nowait(pooled)
+				return
+			except Exception as e:
+				logger.warning(f'Failed to replenish browser pool (attempt {attempt + 1}/{attempts}): {str(e)}')
+
+		self._capacity -= 1
+		logger.error(f'Gave up replenishing the browser pool, {self._capacity} contexts left')
+		if self._capacity == 0:
+			self._idle.put_nowait(None)
@@ -392,6 +392,16 @@ class Controller(Generic[Context]):
 
 			xpath = '//' + dom_element.xpath
 
+			element_handle = await browser.get_registered_element(dom_element)
+			if element_handle is not None:
+				try:
+					selected_option_values = await element_handle.select_option(label=text, timeout=1000)
+					msg = f'selected option {text} with value {selected_option_values}'
+					logger.info(msg)
+					return ActionResult(extracted_content=msg, include_in_memory=True)
+				except Exception as e:
+					logger.debug(f'Failed to select option on the registered element, searching the frames: {str(e)}')
+
 			try:
 				frame_index = 0
 				for frame in page.frames:
@@ -491,6 +501,7 @@ class Controller(Generic[Context]):
 		try:
 			for action_name, params in action.model_dump(exclude_unset=True).items():
 				if params is not None:
+					browser_context.drop_cached_fingerprint()
 					# with Laminar.start_as_current_span(
 					# 	name=action_name,
 					# 	input={
@@ -4,16 +4,26 @@
     focusHighlightIndex: -1,
     viewportExpansion: 0,
     debugMode: false,
+    reuseSnapshots: false,
+    baseSnapshotId: null,
+    packed: false,
+    maxNodes: 0,
+    maxMillis: 0,
+    timeSliced: false,
+    intersectionObserver: false,
+    hitTestGridSize: 0,
   }
 ) => {
   const { doHighlightElements, focusHighlightIndex, viewportExpansion, debugMode } = args;
   let highlightIndex = 0; // Reset highlight index
 
+  // Persistent state installed by domObserver.js, used to reuse the snapshot of an unchanged page
+  const AGENT = args.reuseSnapshots && window.__browserUse?.observer ? window.__browserUse : null;
+
   // Add timing stack to handle recursion
   const TIMING_STACK = {
     nodeProcessing: [],
     treeTraversal: [],
-    highlighting: [],
     current: null
   };
 
@@ -33,7 +43,6 @@
     buildDomTreeCalls: 0,
     timings: {
       buildDomTree: 0,
-      highlightElement: 0,
       isInteractiveElement: 0,
       isElementVisible: 0,
       isTopElement: 0,
@@ -57,6 +66,43 @@
       processedNodes: 0,
       skippedNodes: 0,
     },
+    candidateMetrics: {
+      roots: 0,
+      candidates: 0,
+      skippedChecks: 0,
+      queryTime: 0,
+    },
+    intersectionMetrics: {
+      observedElements: 0,
+      observerTime: 0,
+      timedOut: false,
+      discarded: false,
+      observedRects: 0,
+      inheritedTextNodes: 0,
+      measuredTextNodes: 0,
+    },
+    occlusionMetrics: {
+      sampledPoints: 0,
+      gridDecisions: 0,
+      ambiguousElements: 0,
+      preciseChecks: 0,
+    },
+    walkMetrics: {
+      enteredNodes: 0,
+      deferredNodes: 0,
+      slices: 0,
+      truncated: false,
+    },
+    highlightMetrics: {
+      highlightedElements: 0,
+      renderTime: 0,
+    },
+    xpathMetrics: {
+      topDownTime: 0,
+      legacyTime: 0,
+      timeSaved: 0,
+      mismatches: 0,
+    },
     buildDomTreeBreakdown: {
       totalTime: 0,
       totalSelfTime: 0,
@@ -103,12 +149,80 @@
   const DOM_CACHE = {
     boundingRects: new WeakMap(),
     computedStyles: new WeakMap(),
+    gridHits: new Map(),
     clearCache: () => {
       DOM_CACHE.boundingRects = new WeakMap();
       DOM_CACHE.computedStyles = new WeakMap();
+      DOM_CACHE.gridHits = new Map();
     }
   };
 
+  /**
+   * IntersectionObserver entries of the main document, gathered in one pass before the walk.
+   */
+  let INTERSECTIONS = new WeakMap();
+
+  const INTERSECTION_TIMEOUT = 100;
+
+  /**
+   * Observes the interactive candidates and the parents of text nodes of the main document and resolves once
+   * the observer reported all of them, so their geometry comes from one rendering step instead of a layout
+   * read per element and a Range per text node. Returns null when the observer is disabled or cannot be used.
+   */
+  function observeIntersections() {
+    if (!args.intersectionObserver || typeof IntersectionObserver === "undefined") return null;
+
+    const candidates = getInteractiveCandidates(document.body);
+    const targets = new Set(candidates ? candidates.elements : []);
+    const walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT);
+    for (let text = walker.nextNode(); text !== null; text = walker.nextNode()) {
+      if (text.parentElement && text.data.trim()) targets.add(text.parentElement);
+    }
+    if (targets.size === 0) return null;
+
+    const start = performance.now();
+    return new Promise((resolve) => {
+      const pending = new Set(targets);
+      let timer = null;
+      // The page keeps running while the observer is pending, observed boxes are stale after a mutation or scroll
+      let changed = false;
+      const markChanged = () => { changed = true; };
+      const mutations = new MutationObserver(markChanged);
+      mutations.observe(document, { subtree: true, childList: true, attributes: true, characterData: true });
+      window.addEventListener("scroll", markChanged, { capture: true, passive: true });
+      window.addEventListener("resize", markChanged, { passive: true });
+      const done = (timedOut) => {
+        if (timer === null) return;
+        clearTimeout(timer);
+        timer = null;
+        observer.disconnect();
+        if (mutations.takeRecords().length > 0) changed = true;
+        mutations.disconnect();
+        window.removeEventListener("scroll", markChanged, { capture: true });
+        window.removeEventListener("resize", markChanged);
+        // A mutation can move any element, not only its target, so all boxes are measured again by the walk
+        if (changed) INTERSECTIONS = new WeakMap();
+        if (debugMode) {
+          PERF_METRICS.intersectionMetrics.observedElements = targets.size - pending.size;
+          PERF_METRICS.intersectionMetrics.observerTime = performance.now() - start;
+          PERF_METRICS.intersectionMetrics.timedOut = timedOut;
+          PERF_METRICS.intersectionMetrics.discarded = changed;
+        }
+        resolve();
+      };
+      const observer = new IntersectionObserver((entries) => {
+        for (const entry of entries) {
+          INTERSECTIONS.set(entry.target, entry);
+          pending.delete(entry.target);
+        }
+        if (pending.size === 0) done(false);
+      }, { rootMargin: `${Math.max(viewportExpansion, 0)}px` });
+      // Pages that are not rendered, like background tabs, may never notify, elements left are measured
+      timer = setTimeout(() => done(true), INTERSECTION_TIMEOUT);
+      for (const target of targets) observer.observe(target);
+    });
+  }
+
   // Cache helper functions
   function getCachedBoundingRect(element) {
     if (!element) return null;
@@ -125,7 +239,12 @@
     }
 
     let rect;
-    if (debugMode) {
+    const entry = INTERSECTIONS.get(element);
+    if (entry) {
+      // Geometry of the frame the IntersectionObserver notified about, no layout read
+      rect = entry.boundingClientRect;
+      if (debugMode) PERF_METRICS.intersectionMetrics.observedRects++;
+    } else if (debugMode) {
       const start = performance.now();
       rect = element.getBoundingClientRect();
       const duration = performance.now() - start;
@@ -185,150 +304,184 @@
 
   const ID = { current: 0 };
 
-  const HIGHLIGHT_CONTAINER_ID = "playwright-highlight-container";
-
   /**
-   * Highlights an element in the DOM and returns the index of the next element.
+   * Returns the id of a node. Ids are stable across snapshots when the observer is installed.
    */
-  function highlightElement(element, index, parentIframe = null) {
-    if (!element) return index;
+  function getNodeId(node) {
+    return AGENT ? `${AGENT.getNodeId(node)}` : `${ID.current++}`;
+  }
 
-    try {
-      // Create or get highlight container
-      let container = document.getElementById(HIGHLIGHT_CONTAINER_ID);
-      if (!container) {
-        container = document.createElement("div");
-        container.id = HIGHLIGHT_CONTAINER_ID;
-        container.style.position = "fixed";
-        container.style.pointerEvents = "none";
-        container.style.top = "0";
-        container.style.left = "0";
-        container.style.width = "100%";
-        container.style.height = "100%";
-        container.style.zIndex = "2147483647";
-        document.body.appendChild(container);
-      }
+  /**
+   * Highlighted elements of this snapshot, kept so an unchanged page can be re-highlighted without a walk.
+   */
+  const HIGHLIGHTS = [];
 
-      // Get element position
-      const rect = measureDomOperation(
-        () => element.getBoundingClientRect(),
-        'getBoundingClientRect'
-      );
+  /**
+   * Highlighted elements by highlight index, kept on the page so actions resolve their target with one evaluate
+   * instead of a selector. Weak references, so the registry does not keep removed elements alive.
+   */
+  const REGISTRY = typeof WeakRef === "function" ? { id: null, elements: [] } : null;
 
-      if (!rect) return index;
-
-      // Generate a color based on the index
-      const colors = [
-        "#FF0000",
-        "#00FF00",
-        "#0000FF",
-        "#FFA500",
-        "#800080",
-        "#008080",
-        "#FF69B4",
-        "#4B0082",
-        "#FF4500",
-        "#2E8B57",
-        "#DC143C",
-        "#4682B4",
-      ];
-      const colorIndex = index % colors.length;
-      const baseColor = colors[colorIndex];
-      const backgroundColor = baseColor + "1A"; // 10% opacity version of the color
-
-      // Create highlight overlay
-      const overlay = document.createElement("div");
-      overlay.style.position = "fixed";
-      overlay.style.border = `2px solid ${baseColor}`;
-      overlay.style.backgroundColor = backgroundColor;
-      overlay.style.pointerEvents = "none";
-      overlay.style.boxSizing = "border-box";
-
-      // Get element position
-      let iframeOffset = { x: 0, y: 0 };
-
-      // If element is in an iframe, calculate iframe offset
-      if (parentIframe) {
-        const iframeRect = parentIframe.getBoundingClientRect();
-        iframeOffset.x = iframeRect.left;
-        iframeOffset.y = iframeRect.top;
-      }
+  /**
+   * State kept on the page between runs, with a token unique per document.
+   */
+  function getPageState() {
+    const agent = window.__browserUse = window.__browserUse || {};
+    agent.documentToken = agent.documentToken || `${Date.now().toString(36)}${Math.random().toString(36).slice(2)}`;
+    return agent;
+  }
 
-      // Calculate position
-      const top = rect.top + iframeOffset.y;
-      const left = rect.left + iframeOffset.x;
-
-      overlay.style.top = `${top}px`;
-      overlay.style.left = `${left}px`;
-      overlay.style.width = `${rect.width}px`;
-      overlay.style.height = `${rect.height}px`;
-
-      // Create and position label
-      const label = document.createElement("div");
-      label.className = "playwright-highlight-label";
-      label.style.position = "fixed";
-      label.style.background = baseColor;
-      label.style.color = "white";
-      label.style.padding = "1px 4px";
-      label.style.borderRadius = "4px";
-      label.style.fontSize = `${Math.min(12, Math.max(8, rect.height / 2))}px`;
-      label.textContent = index;
-
-      const labelWidth = 20;
-      const labelHeight = 16;
-
-      let labelTop = top + 2;
-      let labelLeft = left + rect.width - labelWidth - 2;
-
-      if (rect.width < labelWidth + 4 || rect.height < labelHeight + 4) {
-        labelTop = top - labelHeight - 2;
-        labelLeft = left + rect.width - labelWidth;
-      }
+  /**
+   * Returns the identity of an element, the same in every snapshot for as long as the element is alive.
+   */
+  function getElementId(element) {
+    const agent = getPageState();
+    agent.elementIds = agent.elementIds || new WeakMap();
+    let id = agent.elementIds.get(element);
+    if (id === undefined) {
+      agent.nextElementId = (agent.nextElementId || 0) + 1;
+      id = `${agent.documentToken}:${agent.nextElementId}`;
+      agent.elementIds.set(element, id);
+    }
+    return id;
+  }
 
-      label.style.top = `${labelTop}px`;
-      label.style.left = `${labelLeft}px`;
+  /**
+   * Installs the registry of this walk, ids are unique per document.
+   */
+  function registerElements() {
+    const agent = getPageState();
+    agent.registryCounter = (agent.registryCounter || 0) + 1;
+    REGISTRY.id = `${agent.documentToken}:${agent.registryCounter}`;
+    agent.registry = REGISTRY;
+  }
 
-      // Add to container
-      container.appendChild(overlay);
-      container.appendChild(label);
+  const HIGHLIGHT_CONTAINER_ID = "playwright-highlight-container";
 
-      // Update positions on scroll
-      const updatePositions = () => {
-        const newRect = element.getBoundingClientRect();
-        let newIframeOffset = { x: 0, y: 0 };
+  const HIGHLIGHT_COLORS = [
+    "#FF0000",
+    "#00FF00",
+    "#0000FF",
+    "#FFA500",
+    "#800080",
+    "#008080",
+    "#FF69B4",
+    "#4B0082",
+    "#FF4500",
+    "#2E8B57",
+    "#DC143C",
+    "#4682B4",
+  ];
 
+  /**
+   * Draws the boxes and labels of all highlighted elements onto a single canvas overlay.
+   * The canvas is the only node added to the page, so removing the highlights is a single remove().
+   * One scroll/resize listener redraws the overlay once per animation frame and goes away with the canvas.
+   * Highlights are [element, index, parentIframe]. Instead of an element, a fixed box {left, top, width, height} in
+   * the viewport of its document can be given, which only follows the position of its iframe.
+   */
+  function renderHighlights(highlights) {
+    const start = performance.now();
+    document.getElementById(HIGHLIGHT_CONTAINER_ID)?.remove();
+    if (highlights.length === 0 || !document.body) return;
+
+    const canvas = document.createElement("canvas");
+    const context = canvas.getContext && canvas.getContext("2d");
+    if (!context) return;
+    canvas.id = HIGHLIGHT_CONTAINER_ID;
+    canvas.style.position = "fixed";
+    canvas.style.pointerEvents = "none";
+    canvas.style.top = "0";
+    canvas.style.left = "0";
+    canvas.style.zIndex = "2147483647";
+
+    function draw() {
+      // Read all positions before drawing
+      const iframeOffsets = new Map();
+      const boxes = [];
+      for (const [element, index, parentIframe] of highlights) {
+        const rect = typeof element.getBoundingClientRect === "function" ? element.getBoundingClientRect() : element;
+        let offset = { x: 0, y: 0 };
         if (parentIframe) {
-          const iframeRect = parentIframe.getBoundingClientRect();
-          newIframeOffset.x = iframeRect.left;
-          newIframeOffset.y = iframeRect.top;
+          offset = iframeOffsets.get(parentIframe);
+          if (!offset) {
+            const iframeRect = parentIframe.getBoundingClientRect();
+            offset = { x: iframeRect.left, y: iframeRect.top };
+            iframeOffsets.set(parentIframe, offset);
+          }
         }
+        boxes.push([index, rect.left + offset.x, rect.top + offset.y, rect.width, rect.height]);
+      }
 
-        const newTop = newRect.top + newIframeOffset.y;
-        const newLeft = newRect.left + newIframeOffset.x;
-
-        overlay.style.top = `${newTop}px`;
-        overlay.style.left = `${newLeft}px`;
-        overlay.style.width = `${newRect.width}px`;
-        overlay.style.height = `${newRect.height}px`;
-
-        let newLabelTop = newTop + 2;
-        let newLabelLeft = newLeft + newRect.width - labelWidth - 2;
+      const width = window.innerWidth;
+      const height = window.innerHeight;
+      const ratio = window.devicePixelRatio || 1;
+      canvas.width = Math.round(width * ratio);
+      canvas.height = Math.round(height * ratio);
+      canvas.style.width = `${width}px`;
+      canvas.style.height = `${height}px`;
+      context.setTransform(ratio, 0, 0, ratio, 0, 0);
+      context.clearRect(0, 0, width, height);
+      context.textBaseline = "middle";
+
+      for (const [index, left, top, boxWidth, boxHeight] of boxes) {
+        const baseColor = HIGHLIGHT_COLORS[index % HIGHLIGHT_COLORS.length];
+        context.fillStyle = baseColor + "1A"; // 10% opacity version of the color
+        context.fillRect(left, top, boxWidth, boxHeight);
+        context.strokeStyle = baseColor;
+        context.lineWidth = 2;
+        context.strokeRect(left + 1, top + 1, Math.max(0, boxWidth - 2), Math.max(0, boxHeight - 2));
+
+        const fontSize = Math.min(12, Math.max(8, boxHeight / 2));
+        context.font = `${fontSize}px sans-serif`;
+        const label = String(index);
+        const labelWidth = context.measureText(label).width + 8;
+        const labelHeight = fontSize + 4;
+
+        let labelTop = top + 2;
+        let labelLeft = left + boxWidth - labelWidth - 2;
+        if (boxWidth < labelWidth + 4 || boxHeight < labelHeight + 4) {
+          labelTop = top - labelHeight - 2;
+          labelLeft = left + boxWidth - labelWidth;
+        }
 
-        if (newRect.width < labelWidth + 4 || newRect.height < labelHeight + 4) {
-          newLabelTop = newTop - labelHeight - 2;
-          newLabelLeft = newLeft + newRect.width - labelWidth;
+        context.fillStyle = baseColor;
+        context.beginPath();
+        if (context.roundRect) {
+          context.roundRect(labelLeft, labelTop, labelWidth, labelHeight, 4);
+        } else {
+          context.rect(labelLeft, labelTop, labelWidth, labelHeight);
         }
+        context.fill();
+        context.fillStyle = "white";
+        context.fillText(label, labelLeft + 4, labelTop + labelHeight / 2);
+      }
+    }
 
-        label.style.top = `${newLabelTop}px`;
-        label.style.left = `${newLabelLeft}px`;
-      };
+    let frameRequested = false;
+    function onViewportChange() {
+      if (!canvas.isConnected) {
+        window.removeEventListener("scroll", onViewportChange, true);
+        window.removeEventListener("resize", onViewportChange);
+        return;
+      }
+      if (frameRequested) return;
+      frameRequested = true;
+      requestAnimationFrame(() => {
+        frameRequested = false;
+        if (canvas.isConnected) draw();
+      });
+    }
 
-      window.addEventListener('scroll', updatePositions);
-      window.addEventListener('resize', updatePositions);
+    draw();
+    document.body.appendChild(canvas);
+    // Capture scroll events of scrollable containers as well
+    window.addEventListener("scroll", onViewportChange, true);
+    window.addEventListener("resize", onViewportChange);
 
-      return index + 1;
-    } finally {
-      popTiming('highlighting');
+    if (debugMode) {
+      PERF_METRICS.highlightMetrics.highlightedElements = highlights.length;
+      PERF_METRICS.highlightMetrics.renderTime = performance.now() - start;
     }
   }
 
@@ -371,30 +524,128 @@
     return segments.join("/");
   }
 
+  /**
+   * Schedules the children of a node. XPaths are built top-down: every child element gets the path of its
+   * parent plus its own segment, with same-tag siblings counted on the way. This is linear in the number
+   * of nodes, while getXPathTree walks up to the root and over all previous siblings for every element.
+   * Children of a shadow root get an empty path, as getXPathTree stops at the shadow boundary.
+   *
+   * Children are pushed in reverse, so they are entered in document order. With a budget, elements outside
+   * the viewport are deferred until everything in it is visited. Children of such a list are written to
+   * reserved slots, so the list stays in document order.
+   */
+  function pushChildren(nodeData, childNodes, parentIframe, parentXPath, isShadowBoundary = false) {
+    const frames = [];
+    const tagCounts = new Map();
+    for (const child of childNodes) {
+      let xpath = null;
+      if (child.nodeType === Node.ELEMENT_NODE) {
+        const start = debugMode ? performance.now() : 0;
+        const count = (tagCounts.get(child.nodeName) || 0) + 1;
+        tagCounts.set(child.nodeName, count);
+        if (isShadowBoundary) {
+          xpath = "";
+        } else {
+          const segment = count > 1 ? `${child.nodeName.toLowerCase()}[${count}]` : child.nodeName.toLowerCase();
+          xpath = parentXPath ? `${parentXPath}/${segment}` : segment;
+        }
+        if (debugMode) PERF_METRICS.xpathMetrics.topDownTime += performance.now() - start;
+      }
+      frames.push([child, parentIframe, xpath, nodeData.children, -1]);
+    }
+
+    if (WALK.budgeted) {
+      const deferred = frames.map(([child]) => child.nodeType === Node.ELEMENT_NODE && isDeferred(child));
+      if (deferred.includes(true)) {
+        // Every child gets a slot, the ones that stay empty are dropped by finishWalk
+        for (let i = 0; i < frames.length; i++) {
+          frames[i][4] = i;
+          nodeData.children.push(null);
+        }
+        WALK.reservedLists.add(nodeData.children);
+        for (let i = 0; i < frames.length; i++) {
+          if (deferred[i]) WALK.deferred.push(frames[i]);
+        }
+        for (let i = frames.length - 1; i >= 0; i--) {
+          if (!deferred[i]) WALK.stack.push(frames[i]);
+        }
+        return;
+      }
+    }
+    for (let i = frames.length - 1; i >= 0; i--) WALK.stack.push(frames[i]);
+  }
+
+  /**
+   * Elements that can wait until the viewport is visited: laid out, not fixed or sticky and outside the viewport.
+   */
+  function isDeferred(element) {
+    if (element.id === HIGHLIGHT_CONTAINER_ID) return false;
+    const rect = getCachedBoundingRect(element);
+    if (!rect || (rect.width === 0 && rect.height === 0)) return false;
+    const style = getCachedComputedStyle(element);
+    if (style && (style.position === "fixed" || style.position === "sticky")) return false;
+    return !isInExpandedViewport(element, Math.max(viewportExpansion, 0));
+  }
+
+  /**
+   * Whether the text of an element is in the viewport, taken from the observed box of the element. Null when
+   * the text may be laid out elsewhere or the box crosses the viewport edge, then the text node is measured.
+   */
+  function getInheritedTextViewport(parentElement) {
+    const entry = INTERSECTIONS.get(parentElement);
+    if (!entry) return null;
+
+    const rect = entry.boundingClientRect;
+    if (rect.width === 0 || rect.height === 0) return null;
+    const style = getCachedComputedStyle(parentElement);
+    if (style.display === "contents" || style.textIndent !== "0px" || style.fontSize === "0px") return null;
+
+    // isIntersecting also accounts for clipping by scroll containers, which the measured check does not
+    const isOutside =
+      rect.bottom < -viewportExpansion ||
+      rect.top > window.innerHeight + viewportExpansion ||
+      rect.right < -viewportExpansion ||
+      rect.left > window.innerWidth + viewportExpansion;
+    if (isOutside) return false;
+    const isInside =
+      rect.top >= -viewportExpansion &&
+      rect.bottom <= window.innerHeight + viewportExpansion &&
+      rect.left >= -viewportExpansion &&
+      rect.right <= window.innerWidth + viewportExpansion;
+    return isInside ? true : null;
+  }
+
   /**
    * Checks if a text node is visible.
    */
   function isTextNodeVisible(textNode) {
     try {
-      const range = document.createRange();
-      range.selectNodeContents(textNode);
-      const rect = range.getBoundingClientRect();
+      const parentElement = textNode.parentElement;
+      let isInViewport = parentElement ? getInheritedTextViewport(parentElement) : null;
+
+      if (isInViewport !== null) {
+        if (debugMode) PERF_METRICS.intersectionMetrics.inheritedTextNodes++;
+      } else {
+        if (debugMode) PERF_METRICS.intersectionMetrics.measuredTextNodes++;
+        const range = document.createRange();
+        range.selectNodeContents(textNode);
+        const rect = range.getBoundingClientRect();
+
+        // Simple size check
+        if (rect.width === 0 || rect.height === 0) {
+          return false;
+        }
 
-      // Simple size check
-      if (rect.width === 0 || rect.height === 0) {
-        return false;
+        // Simple viewport check without scroll calculations
+        isInViewport = !(
+          rect.bottom < -viewportExpansion ||
+          rect.top > window.innerHeight + viewportExpansion ||
+          rect.right < -viewportExpansion ||
+          rect.left > window.innerWidth + viewportExpansion
+        );
       }
 
-      // Simple viewport check without scroll calculations
-      const isInViewport = !(
-        rect.bottom < -viewportExpansion ||
-        rect.top > window.innerHeight + viewportExpansion ||
-        rect.right < -viewportExpansion ||
-        rect.left > window.innerWidth + viewportExpansion
-      );
-
       // Check parent visibility
-      const parentElement = textNode.parentElement;
       if (!parentElement) return false;
 
       try {
@@ -457,14 +708,79 @@
   /**
    * Checks if an element is interactive.
    */
+  // Every element isInteractiveElement can accept matches one of these selectors or has an onclick property
+  const INTERACTIVE_CANDIDATE_SELECTOR = [
+    // Native interactive elements, draggable by default, rich text editors
+    "a", "button", "details", "embed", "input", "menu", "menuitem", "object", "select", "textarea", "canvas",
+    "summary", "dialog", "banner", "img", "[draggable]", "[contenteditable]", "[contenteditable] *", "#tinymce",
+    ".mce-content-body", "body[data-id^='mce_']",
+    // Roles, focus, ARIA states and framework click handlers
+    "[role]", "[aria-role]", "[tabindex]", "[data-action]", "[aria-expanded]", "[aria-pressed]", "[aria-selected]",
+    "[aria-checked]", "[onclick]", "[ng-click]", "[\\@click]", "[v-on\\:click]",
+    // Dropdowns and site specific classes
+    ".dropdown-toggle", "[data-toggle='dropdown']", "[aria-haspopup='true']", ".address-input__container__input",
+    ".nav-btn", ".pull-left",
+    // Cookie banners and their buttons
+    "[id*='cookie' i]", "[id*='consent' i]", "[id*='notice' i]", ".otCenterRounded", ".ot-sdk-container",
+    "[data-nosnippet='true']", "[aria-label*='cookie' i]", "[aria-label*='consent' i]", "div[id*='onetrust']",
+    "div.onetrust", "div.cookie", "div.consent", ".ot-sdk-button", ".accept-button", ".reject-button",
+    "[aria-label*='accept' i]", "[aria-label*='reject' i]", ".button",
+  ].join(",");
+
+  const ONETRUST_BANNER_SELECTORS = ['[id*="onetrust"]', '[class*="onetrust"]', '[data-nosnippet="true"]', '[aria-label*="cookie"]'];
+  const COOKIE_BANNER_SELECTORS = ['[id*="cookie"]', '[id*="consent"]', '[class*="cookie"]', '[class*="consent"]', '[id*="onetrust"]'];
+
+  // Matches the elements for which element.closest(selectors) is not null
+  function selfOrDescendantSelector(selectors) {
+    return selectors.flatMap((selector) => [selector, `${selector} *`]).join(",");
+  }
+
+  /**
+   * Interactive candidates and cookie banner membership, resolved once per document or shadow root
+   * with native querySelectorAll passes instead of selector matching per element.
+   */
+  const CANDIDATE_CACHE = new Map();
+
+  function getInteractiveCandidates(element) {
+    const root = element.getRootNode();
+    let candidates = CANDIDATE_CACHE.get(root);
+    if (candidates === undefined) {
+      const start = performance.now();
+      candidates = null;
+      // Everything is editable in design mode and in the shadow tree of an editable host
+      const isEditableRoot = (root.ownerDocument || root).designMode === "on" || Boolean(root.host?.isContentEditable);
+      if (typeof root.querySelectorAll === "function" && !isEditableRoot) {
+        candidates = {
+          elements: new Set(root.querySelectorAll(INTERACTIVE_CANDIDATE_SELECTOR)),
+          inOnetrustBanner: new Set(root.querySelectorAll(selfOrDescendantSelector(ONETRUST_BANNER_SELECTORS))),
+          inCookieBanner: new Set(root.querySelectorAll(selfOrDescendantSelector(COOKIE_BANNER_SELECTORS))),
+        };
+      }
+      CANDIDATE_CACHE.set(root, candidates);
+      if (debugMode) {
+        PERF_METRICS.candidateMetrics.roots++;
+        PERF_METRICS.candidateMetrics.candidates += candidates ? candidates.elements.size : 0;
+        PERF_METRICS.candidateMetrics.queryTime += performance.now() - start;
+      }
+    }
+    return candidates;
+  }
+
   function isInteractiveElement(element) {
     if (!element || element.nodeType !== Node.ELEMENT_NODE) {
       return false;
     }
 
+    const candidates = getInteractiveCandidates(element);
+    if (candidates && !candidates.elements.has(element) && element.onclick === null) {
+      if (debugMode) PERF_METRICS.candidateMetrics.skippedChecks++;
+      return false;
+    }
+
     // Special handling for cookie banner elements
-    const isCookieBannerElement =
-      (typeof element.closest === 'function') && (
+    const isCookieBannerElement = candidates
+      ? candidates.inOnetrustBanner.has(element)
+      : (typeof element.closest === 'function') && (
         element.closest('[id*="onetrust"]') ||
         element.closest('[class*="onetrust"]') ||
         element.closest('[data-nosnippet="true"]') ||
@@ -558,9 +874,9 @@
     if (isCookieBanner) return true;
 
     // Additional check for buttons in cookie banners
-    const isInCookieBanner = typeof element.closest === 'function' && element.closest(
-      '[id*="cookie"],[id*="consent"],[class*="cookie"],[class*="consent"],[id*="onetrust"]'
-    );
+    const isInCookieBanner = candidates
+      ? candidates.inCookieBanner.has(element)
+      : typeof element.closest === 'function' && element.closest(COOKIE_BANNER_SELECTORS.join(","));
 
     if (isInCookieBanner && (
       element.tagName.toLowerCase() === 'button' ||
@@ -572,9 +888,6 @@
       return true;
     }
 
-    // Get computed style
-    const style = window.getComputedStyle(element);
-
     // Check for event listeners
     const hasClickHandler =
       element.onclick !== null ||
@@ -647,6 +960,79 @@
     );
   }
 
+  // Cell size in CSS pixels of the hit-test grid over the viewport, 0 to hit-test every element on its own
+  const HIT_TEST_GRID_SIZE = args.hitTestGridSize ?? 0;
+  // Grid points sampled per axis of an element
+  const HIT_TEST_SAMPLES = 2;
+
+  /**
+   * Topmost element at a point of the hit-test grid. Points are hit-tested on first use and shared by
+   * all elements that cover them, nested elements and their ancestors mostly test the same points.
+   */
+  function getGridHit(column, row) {
+    const key = row * 65536 + column;
+    let hit = DOM_CACHE.gridHits.get(key);
+    if (hit === undefined) {
+      hit = document.elementFromPoint((column + 0.5) * HIT_TEST_GRID_SIZE, (row + 0.5) * HIT_TEST_GRID_SIZE);
+      DOM_CACHE.gridHits.set(key, hit);
+      if (debugMode) PERF_METRICS.occlusionMetrics.sampledPoints++;
+    }
+    return hit;
+  }
+
+  /**
+   * Decides whether an element is topmost from the grid points inside it: top if every point hits the element
+   * or a descendant. Returns null when the element covers no grid point, when no point hits it (points can land in
+   * the gaps of inline and thin elements) or when the points disagree, then the center of the element is hit-tested
+   * like before.
+   */
+  function isTopElementFromGrid(element, rect) {
+    const left = Math.max(rect.left, 0);
+    const top = Math.max(rect.top, 0);
+    const right = Math.min(rect.right, window.innerWidth);
+    const bottom = Math.min(rect.bottom, window.innerHeight);
+    // Grid points strictly inside the visible part of the element
+    const firstColumn = Math.max(0, Math.floor(left / HIT_TEST_GRID_SIZE - 0.5) + 1);
+    const lastColumn = Math.ceil(right / HIT_TEST_GRID_SIZE - 0.5) - 1;
+    const firstRow = Math.max(0, Math.floor(top / HIT_TEST_GRID_SIZE - 0.5) + 1);
+    const lastRow = Math.ceil(bottom / HIT_TEST_GRID_SIZE - 0.5) - 1;
+    if (firstColumn > lastColumn || firstRow > lastRow) return null;
+
+    let covered = 0;
+    let samples = 0;
+    for (const row of latticeSamples(firstRow, lastRow)) {
+      for (const column of latticeSamples(firstColumn, lastColumn)) {
+        const hit = getGridHit(column, row);
+        if (hit && element.contains(hit)) covered++;
+        samples++;
+        if (covered > 0 && covered < samples) {
+          if (debugMode) PERF_METRICS.occlusionMetrics.ambiguousElements++;
+          return null;
+        }
+      }
+    }
+    if (covered === 0) return null;
+    if (debugMode) PERF_METRICS.occlusionMetrics.gridDecisions++;
+    return true;
+  }
+
+  /**
+   * Up to HIT_TEST_SAMPLES grid indices from first to last, preferring multiples of the largest powers of two.
+   * Overlapping elements, like a link and its label or a list and its items, pick the same indices and share
+   * their hit tests.
+   */
+  function latticeSamples(first, last) {
+    const samples = [];
+    let step = 1;
+    while (step * 2 <= last) step *= 2;
+    for (; step >= 1 && samples.length < HIT_TEST_SAMPLES; step /= 2) {
+      for (let i = Math.ceil(first / step) * step; i <= last && samples.length < HIT_TEST_SAMPLES; i += step) {
+        if (!samples.includes(i)) samples.push(i);
+      }
+    }
+    return samples;
+  }
+
   /**
    * Checks if an element is the topmost element at its position.
    */
@@ -697,11 +1083,18 @@
       }
     }
 
+    // Decide from the shared hit-test grid, only ambiguous elements get their own hit test
+    if (HIT_TEST_GRID_SIZE > 0) {
+      const isTop = isTopElementFromGrid(element, rect);
+      if (isTop !== null) return isTop;
+    }
+
     // For elements in viewport, check if they're topmost
     const centerX = rect.left + rect.width / 2;
     const centerY = rect.top + rect.height / 2;
 
     try {
+      if (debugMode) PERF_METRICS.occlusionMetrics.preciseChecks++;
       const topEl = document.elementFromPoint(centerX, centerY);
       if (!topEl) return false;
 
@@ -790,14 +1183,44 @@
   }
 
   /**
-   * Creates a node data object for a given node and its descendants.
+   * State of the iterative walk. Frames on the stack are [node, parentIframe, xpath, parent children, slot]
+   * for nodes to enter and [node, nodeData, parent children, slot] to complete an element after its children.
+   */
+  const WALK = {
+    stack: [],
+    deferred: [],
+    deferredIndex: 0,
+    reservedLists: new Set(),
+    rootChildren: [],
+    budgeted: Boolean(args.maxNodes || args.maxMillis),
+    maxNodes: args.maxNodes || Infinity,
+    maxMillis: args.maxMillis || Infinity,
+    start: 0,
+    enteredNodes: 0,
+    truncated: false,
+  };
+
+  /**
+   * Adds the id of a completed node to the children of its parent.
    */
-  function buildDomTree(node, parentIframe = null) {
+  function addChild(children, slot, id) {
+    if (slot >= 0) {
+      children[slot] = id;
+    } else if (id !== null) {
+      children.push(id);
+    }
+  }
+
+  /**
+   * Creates the node data of a node and schedules its children. Text nodes and skipped nodes are
+   * completed right away, elements once all their children are completed.
+   */
+  function enterNode(node, parentIframe, xpath, parentChildren, slot) {
     if (debugMode) PERF_METRICS.nodeMetrics.totalNodes++;
 
     if (!node || node.id === HIGHLIGHT_CONTAINER_ID) {
       if (debugMode) PERF_METRICS.nodeMetrics.skippedNodes++;
-      return null;
+      return addChild(parentChildren, slot, null);
     }
 
     // Special handling for root node (body)
@@ -809,22 +1232,16 @@
         children: [],
       };
 
+      WALK.stack.push([node, nodeData, parentChildren, slot]);
       // Process children of body
-      for (const child of node.childNodes) {
-        const domElement = buildDomTree(child, parentIframe);
-        if (domElement) nodeData.children.push(domElement);
-      }
-
-      const id = `${ID.current++}`;
-      DOM_HASH_MAP[id] = nodeData;
-      if (debugMode) PERF_METRICS.nodeMetrics.processedNodes++;
-      return id;
+      pushChildren(nodeData, node.childNodes, parentIframe, getXPathTree(node, true));
+      return;
     }
 
     // Early bailout for non-element nodes except text
     if (node.nodeType !== Node.ELEMENT_NODE && node.nodeType !== Node.TEXT_NODE) {
       if (debugMode) PERF_METRICS.nodeMetrics.skippedNodes++;
-      return null;
+      return addChild(parentChildren, slot, null);
     }
 
     // Process text nodes
@@ -832,35 +1249,34 @@
       const textContent = node.textContent.trim();
       if (!textContent) {
         if (debugMode) PERF_METRICS.nodeMetrics.skippedNodes++;
-        return null;
+        return addChild(parentChildren, slot, null);
       }
 
       // Only check visibility for text nodes that might be visible
       const parentElement = node.parentElement;
       if (!parentElement || parentElement.tagName.toLowerCase() === 'script') {
         if (debugMode) PERF_METRICS.nodeMetrics.skippedNodes++;
-        return null;
+        return addChild(parentChildren, slot, null);
       }
 
-      const id = `${ID.current++}`;
+      const id = getNodeId(node);
       DOM_HASH_MAP[id] = {
         type: "TEXT_NODE",
         text: textContent,
         isVisible: isTextNodeVisible(node),
       };
       if (debugMode) PERF_METRICS.nodeMetrics.processedNodes++;
-      return id;
+      return addChild(parentChildren, slot, id);
     }
 
     // Quick checks for element nodes
     if (node.nodeType === Node.ELEMENT_NODE && !isElementAccepted(node)) {
       if (debugMode) PERF_METRICS.nodeMetrics.skippedNodes++;
-      return null;
+      return addChild(parentChildren, slot, null);
     }
 
     // Early viewport check - only filter out elements clearly outside viewport
     if (viewportExpansion !== -1) {
-      const rect = getCachedBoundingRect(node);
       const style = getCachedComputedStyle(node);
 
       // Skip viewport check for fixed/sticky elements as they may appear anywhere
@@ -869,22 +1285,34 @@
       // Check if element has actual dimensions
       const hasSize = node.offsetWidth > 0 || node.offsetHeight > 0;
 
-      if (!rect || (!isFixedOrSticky && !hasSize && (
+      // Only elements without dimensions are filtered, so only their rect is read
+      const rect = isFixedOrSticky || hasSize ? null : getCachedBoundingRect(node);
+      if (rect && (
         rect.bottom < -viewportExpansion ||
         rect.top > window.innerHeight + viewportExpansion ||
         rect.right < -viewportExpansion ||
         rect.left > window.innerWidth + viewportExpansion
-      ))) {
+      )) {
         if (debugMode) PERF_METRICS.nodeMetrics.skippedNodes++;
-        return null;
+        return addChild(parentChildren, slot, null);
       }
     }
 
+    if (xpath === null) {
+      xpath = getXPathTree(node, true);
+    } else if (debugMode) {
+      // Compare with the bottom-up XPath to report the time saved
+      const start = performance.now();
+      const legacyXPath = getXPathTree(node, true);
+      PERF_METRICS.xpathMetrics.legacyTime += performance.now() - start;
+      if (legacyXPath !== xpath) PERF_METRICS.xpathMetrics.mismatches++;
+    }
+
     // Process element node
     const nodeData = {
       tagName: node.tagName.toLowerCase(),
       attributes: {},
-      xpath: getXPathTree(node, true),
+      xpath,
       children: [],
     };
 
@@ -908,21 +1336,19 @@
           if (nodeData.isInteractive) {
             nodeData.isInViewport = true;
             nodeData.highlightIndex = highlightIndex++;
+            nodeData.elementId = getElementId(node);
+            if (REGISTRY) REGISTRY.elements.push(new WeakRef(node));
 
             if (doHighlightElements) {
-              if (focusHighlightIndex >= 0) {
-                if (focusHighlightIndex === nodeData.highlightIndex) {
-                  highlightElement(node, nodeData.highlightIndex, parentIframe);
-                }
-              } else {
-                highlightElement(node, nodeData.highlightIndex, parentIframe);
-              }
+              HIGHLIGHTS.push([node, nodeData.highlightIndex, parentIframe]);
             }
           }
         }
       }
     }
 
+    WALK.stack.push([node, nodeData, parentChildren, slot]);
+
     // Process children, with special handling for iframes and rich text editors
     if (node.tagName) {
       const tagName = node.tagName.toLowerCase();
@@ -932,10 +1358,8 @@
         try {
           const iframeDoc = node.contentDocument || node.contentWindow?.document;
           if (iframeDoc) {
-            for (const child of iframeDoc.childNodes) {
-              const domElement = buildDomTree(child, node);
-              if (domElement) nodeData.children.push(domElement);
-            }
+            if (AGENT) AGENT.observe(iframeDoc);
+            pushChildren(nodeData, iframeDoc.childNodes, node, "");
           }
         } catch (e) {
           console.warn("Unable to access iframe:", e);
@@ -950,43 +1374,131 @@
         (tagName === "body" && node.getAttribute("data-id")?.startsWith("mce_"))
       ) {
         // Process all child nodes to capture formatted text
-        for (const child of node.childNodes) {
-          const domElement = buildDomTree(child, parentIframe);
-          if (domElement) nodeData.children.push(domElement);
-        }
+        pushChildren(nodeData, node.childNodes, parentIframe, xpath);
       }
       // Handle shadow DOM
       else if (node.shadowRoot) {
         nodeData.shadowRoot = true;
-        for (const child of node.shadowRoot.childNodes) {
-          const domElement = buildDomTree(child, parentIframe);
-          if (domElement) nodeData.children.push(domElement);
-        }
+        if (AGENT) AGENT.observe(node.shadowRoot);
+        // Shadow roots of other frames fail the instanceof check, so getXPathTree does not stop at them
+        pushChildren(nodeData, node.shadowRoot.childNodes, parentIframe, "", node.shadowRoot instanceof ShadowRoot);
       }
       // Handle regular elements
       else {
-        for (const child of node.childNodes) {
-          const domElement = buildDomTree(child, parentIframe);
-          if (domElement) nodeData.children.push(domElement);
-        }
+        pushChildren(nodeData, node.childNodes, parentIframe, xpath);
       }
     }
+  }
 
-    // Skip empty anchor tags
+  /**
+   * Completes an element once all its children are completed.
+   */
+  function exitNode(node, nodeData, parentChildren, slot) {
+    // Skip empty anchor tags, children reserved for deferred elements count as content
     if (nodeData.tagName === 'a' && nodeData.children.length === 0 && !nodeData.attributes.href) {
       if (debugMode) PERF_METRICS.nodeMetrics.skippedNodes++;
-      return null;
+      return addChild(parentChildren, slot, null);
     }
 
-    const id = `${ID.current++}`;
+    const id = getNodeId(node);
     DOM_HASH_MAP[id] = nodeData;
     if (debugMode) PERF_METRICS.nodeMetrics.processedNodes++;
-    return id;
+    addChild(parentChildren, slot, id);
+  }
+
+  /**
+   * Processes frames until the walk is done or the deadline is reached, returns whether the walk is done.
+   * Once the budget is spent, nodes are no longer entered but the entered elements are still completed,
+   * so the truncated tree is valid.
+   */
+  function walkSlice(deadline) {
+    let frame;
+    while ((frame = nextFrame()) !== undefined) {
+      if (frame.length === 4) {
+        exitNode(...frame);
+        continue;
+      }
+
+      if (WALK.truncated) {
+        addChild(frame[3], frame[4], null);
+        continue;
+      }
+
+      // Time is only read every 32 nodes
+      const checkTime = (++WALK.enteredNodes & 31) === 0;
+      if (
+        WALK.budgeted &&
+        (WALK.enteredNodes > WALK.maxNodes || (checkTime && performance.now() - WALK.start > WALK.maxMillis))
+      ) {
+        WALK.truncated = true;
+        addChild(frame[3], frame[4], null);
+        continue;
+      }
+
+      enterNode(...frame);
+      if (checkTime && performance.now() >= deadline) return false;
+    }
+    return true;
+  }
+
+  function nextFrame() {
+    if (WALK.stack.length > 0) return WALK.stack.pop();
+    // The viewport is done, continue with the deferred elements in document order
+    if (WALK.deferredIndex < WALK.deferred.length) return WALK.deferred[WALK.deferredIndex++];
+    return undefined;
+  }
+
+  function startWalk(root) {
+    WALK.start = performance.now();
+    WALK.stack.push([root, null, null, WALK.rootChildren, -1]);
+  }
+
+  function finishWalk() {
+    // Drop the reserved slots of deferred elements that were skipped
+    for (const children of WALK.reservedLists) {
+      let length = 0;
+      for (const id of children) {
+        if (id !== null) children[length++] = id;
+      }
+      children.length = length;
+    }
+    return WALK.rootChildren.length > 0 ? WALK.rootChildren[0] : null;
+  }
+
+  /**
+   * Walks the DOM from the body. A time-sliced walk yields to the page between idle callbacks.
+   */
+  function buildDomTree(root) {
+    startWalk(root);
+    if (!args.timeSliced) {
+      walkSlice(Infinity);
+      return finishWalk();
+    }
+
+    const idle = (callback) =>
+      window.requestIdleCallback ? window.requestIdleCallback(callback, { timeout: 50 }) : setTimeout(() => callback(null), 0);
+    return new Promise((resolve, reject) => {
+      const run = (idleDeadline) => {
+        try {
+          // Layout may have changed while the page was running
+          DOM_CACHE.clearCache();
+          const sliceMillis = idleDeadline && !idleDeadline.didTimeout ? Math.max(idleDeadline.timeRemaining(), 5) : 5;
+          if (walkSlice(performance.now() + sliceMillis)) {
+            resolve(finishWalk());
+          } else {
+            if (debugMode) PERF_METRICS.walkMetrics.slices++;
+            idle(run);
+          }
+        } catch (e) {
+          reject(e);
+        }
+      };
+      run(null);
+    });
   }
 
   // After all functions are defined, wrap them with performance measurement
   // Remove buildDomTree from here as we measure it separately
-  highlightElement = measureTime(highlightElement);
   isInteractiveElement = measureTime(isInteractiveElement);
   isElementVisible = measureTime(isElementVisible);
   isTopElement = measureTime(isTopElement);
@@ -994,62 +1506,226 @@
   isTextNodeVisible = measureTime(isTextNodeVisible);
   getEffectiveScroll = measureTime(getEffectiveScroll);
 
-  const rootId = buildDomTree(document.body);
+  /**
+   * Returns a key that changes whenever the previous snapshot may no longer describe the page.
+   */
+  function getSnapshotFingerprint() {
+    const root = document.documentElement;
+    return [
+      AGENT.documentId,
+      AGENT.flush(),
+      window.scrollX,
+      window.scrollY,
+      window.innerWidth,
+      window.innerHeight,
+      root ? root.scrollWidth : 0,
+      root ? root.scrollHeight : 0,
+      viewportExpansion,
+      doHighlightElements,
+    ].join("|");
+  }
 
-  // Clear the cache before starting
-  DOM_CACHE.clearCache();
+  /**
+   * Stores what an unchanged page needs to be re-highlighted without a walk, and returns the full node map.
+   */
+  function finishSnapshot(rootId, fingerprint) {
+    const snapshotId = `${AGENT.documentId}:${++AGENT.snapshotCounter}`;
+    AGENT.snapshot = {
+      id: snapshotId,
+      // Truncated snapshots have no fingerprint, they are never reused
+      fingerprint,
+      highlights: HIGHLIGHTS,
+      registry: REGISTRY,
+    };
+    return { rootId, map: DOM_HASH_MAP, snapshotId };
+  }
 
-  // Only process metrics in debug mode
-  if (debugMode && PERF_METRICS) {
-    // Convert timings to seconds and add useful derived metrics
-    Object.keys(PERF_METRICS.timings).forEach(key => {
-      PERF_METRICS.timings[key] = PERF_METRICS.timings[key] / 1000;
-    });
+  const NODE_FLAGS = {
+    isVisible: 1,
+    isTopElement: 2,
+    isInteractive: 4,
+    isInViewport: 8,
+    shadowRoot: 16,
+  };
 
-    Object.keys(PERF_METRICS.buildDomTreeBreakdown).forEach(key => {
-      if (typeof PERF_METRICS.buildDomTreeBreakdown[key] === 'number') {
-        PERF_METRICS.buildDomTreeBreakdown[key] = PERF_METRICS.buildDomTreeBreakdown[key] / 1000;
+  /**
+   * Encodes the result as a JSON string in a columnar layout: one interned string table,
+   * parallel arrays per node field and flattened attributes/children addressed by offset ranges.
+   */
+  function packResult(result) {
+    const strings = [];
+    const stringIndex = new Map();
+    const intern = (value) => {
+      let index = stringIndex.get(value);
+      if (index === undefined) {
+        index = strings.length;
+        strings.push(value);
+        stringIndex.set(value, index);
       }
-    });
+      return index;
+    };
+
+    const nodes = {
+      id: [],
+      tag: [],
+      xpath: [],
+      text: [],
+      flags: [],
+      highlightIndex: [],
+      elementId: [],
+      attributeOffsets: [0],
+      attributes: [],
+      childOffsets: [0],
+      children: [],
+    };
 
-    // Add some useful derived metrics
-    if (PERF_METRICS.buildDomTreeBreakdown.buildDomTreeCalls > 0) {
-      PERF_METRICS.buildDomTreeBreakdown.averageTimePerNode =
-        PERF_METRICS.buildDomTreeBreakdown.totalTime / PERF_METRICS.buildDomTreeBreakdown.buildDomTreeCalls;
+    for (const id in result.map || {}) {
+      const data = result.map[id];
+      let flags = 0;
+      for (const name in NODE_FLAGS) {
+        if (data[name]) flags |= NODE_FLAGS[name];
+      }
+      nodes.id.push(Number(id));
+      nodes.flags.push(flags);
+
+      if (data.type === "TEXT_NODE") {
+        nodes.tag.push(-1);
+        nodes.xpath.push(-1);
+        nodes.text.push(intern(data.text));
+        nodes.highlightIndex.push(-1);
+        nodes.elementId.push(-1);
+      } else {
+        nodes.tag.push(intern(data.tagName));
+        nodes.xpath.push(intern(data.xpath));
+        nodes.text.push(-1);
+        nodes.highlightIndex.push(data.highlightIndex ?? -1);
+        nodes.elementId.push(data.elementId === undefined ? -1 : intern(data.elementId));
+        for (const name in data.attributes) {
+          nodes.attributes.push(intern(name), intern(data.attributes[name]));
+        }
+        for (const childId of data.children) {
+          nodes.children.push(Number(childId));
+        }
+      }
+      nodes.attributeOffsets.push(nodes.attributes.length);
+      nodes.childOffsets.push(nodes.children.length);
     }
 
-    PERF_METRICS.buildDomTreeBreakdown.timeInChildCalls =
-      PERF_METRICS.buildDomTreeBreakdown.totalTime - PERF_METRICS.buildDomTreeBreakdown.totalSelfTime;
+    const packed = Object.assign({}, result, { format: "packed", strings, nodes });
+    delete packed.map;
+    return JSON.stringify(packed);
+  }
 
-    // Add average time per operation to the metrics
-    Object.keys(PERF_METRICS.buildDomTreeBreakdown.domOperations).forEach(op => {
-      const time = PERF_METRICS.buildDomTreeBreakdown.domOperations[op];
-      const count = PERF_METRICS.buildDomTreeBreakdown.domOperationCounts[op];
-      if (count > 0) {
-        PERF_METRICS.buildDomTreeBreakdown.domOperations[`${op}Average`] = time / count;
-      }
-    });
+  // Remove the highlights of a previous run, they are redrawn below
+  document.getElementById(HIGHLIGHT_CONTAINER_ID)?.remove();
 
-    // Calculate cache hit rates
-    const boundingRectTotal = PERF_METRICS.cacheMetrics.boundingRectCacheHits + PERF_METRICS.cacheMetrics.boundingRectCacheMisses;
-    const computedStyleTotal = PERF_METRICS.cacheMetrics.computedStyleCacheHits + PERF_METRICS.cacheMetrics.computedStyleCacheMisses;
+  // Only draw the given highlights, for trees that were built without a walk (the CDP snapshot engine)
+  if (args.highlights) {
+    renderHighlights(args.highlights);
+    return null;
+  }
 
-    if (boundingRectTotal > 0) {
-      PERF_METRICS.cacheMetrics.boundingRectHitRate = PERF_METRICS.cacheMetrics.boundingRectCacheHits / boundingRectTotal;
+  // Nothing changed since the base snapshot: only restore the highlights
+  if (AGENT && args.baseSnapshotId && focusHighlightIndex < 0) {
+    const previous = AGENT.snapshot;
+    if (previous && previous.id === args.baseSnapshotId && previous.fingerprint === getSnapshotFingerprint()) {
+      renderHighlights(previous.highlights.filter(([element]) => element.isConnected));
+      const unchanged = { snapshotId: previous.id, unchanged: true };
+      if (previous.registry) {
+        AGENT.registry = previous.registry;
+        unchanged.registryId = previous.registry.id;
+      }
+      return args.packed ? packResult(unchanged) : unchanged;
     }
+  }
 
-    if (computedStyleTotal > 0) {
-      PERF_METRICS.cacheMetrics.computedStyleHitRate = PERF_METRICS.cacheMetrics.computedStyleCacheHits / computedStyleTotal;
+  /**
+   * Renders the highlights and assembles the result once the walk is done.
+   */
+  function finish(rootId) {
+    if (doHighlightElements) {
+      renderHighlights(
+        focusHighlightIndex >= 0 ? HIGHLIGHTS.filter(([, index]) => index === focusHighlightIndex) : HIGHLIGHTS
+      );
     }
 
-    if ((boundingRectTotal + computedStyleTotal) > 0) {
-      PERF_METRICS.cacheMetrics.overallHitRate =
-        (PERF_METRICS.cacheMetrics.boundingRectCacheHits + PERF_METRICS.cacheMetrics.computedStyleCacheHits) /
-        (boundingRectTotal + computedStyleTotal);
+    // Clear the cache before starting
+    DOM_CACHE.clearCache();
+
+    // Only process metrics in debug mode
+    if (debugMode && PERF_METRICS) {
+      PERF_METRICS.walkMetrics.enteredNodes = WALK.enteredNodes;
+      PERF_METRICS.walkMetrics.deferredNodes = WALK.deferred.length;
+      PERF_METRICS.walkMetrics.truncated = WALK.truncated;
+
+      // Convert timings to seconds and add useful derived metrics
+      Object.keys(PERF_METRICS.timings).forEach(key => {
+        PERF_METRICS.timings[key] = PERF_METRICS.timings[key] / 1000;
+      });
+
+      Object.keys(PERF_METRICS.buildDomTreeBreakdown).forEach(key => {
+        if (typeof PERF_METRICS.buildDomTreeBreakdown[key] === 'number') {
+          PERF_METRICS.buildDomTreeBreakdown[key] = PERF_METRICS.buildDomTreeBreakdown[key] / 1000;
+        }
+      });
+
+      // Add some useful derived metrics
+      if (PERF_METRICS.buildDomTreeBreakdown.buildDomTreeCalls > 0) {
+        PERF_METRICS.buildDomTreeBreakdown.averageTimePerNode =
+          PERF_METRICS.buildDomTreeBreakdown.totalTime / PERF_METRICS.buildDomTreeBreakdown.buildDomTreeCalls;
+      }
+
+      PERF_METRICS.buildDomTreeBreakdown.timeInChildCalls =
+        PERF_METRICS.buildDomTreeBreakdown.totalTime - PERF_METRICS.buildDomTreeBreakdown.totalSelfTime;
+
+      PERF_METRICS.xpathMetrics.topDownTime /= 1000;
+      PERF_METRICS.xpathMetrics.legacyTime /= 1000;
+      PERF_METRICS.xpathMetrics.timeSaved = PERF_METRICS.xpathMetrics.legacyTime - PERF_METRICS.xpathMetrics.topDownTime;
+      PERF_METRICS.highlightMetrics.renderTime /= 1000;
+      PERF_METRICS.candidateMetrics.queryTime /= 1000;
+      PERF_METRICS.intersectionMetrics.observerTime /= 1000;
+
+      // Add average time per operation to the metrics
+      Object.keys(PERF_METRICS.buildDomTreeBreakdown.domOperations).forEach(op => {
+        const time = PERF_METRICS.buildDomTreeBreakdown.domOperations[op];
+        const count = PERF_METRICS.buildDomTreeBreakdown.domOperationCounts[op];
+        if (count > 0) {
+          PERF_METRICS.buildDomTreeBreakdown.domOperations[`${op}Average`] = time / count;
+        }
+      });
+
+      // Calculate cache hit rates
+      const boundingRectTotal = PERF_METRICS.cacheMetrics.boundingRectCacheHits + PERF_METRICS.cacheMetrics.boundingRectCacheMisses;
+      const computedStyleTotal = PERF_METRICS.cacheMetrics.computedStyleCacheHits + PERF_METRICS.cacheMetrics.computedStyleCacheMisses;
+
+      if (boundingRectTotal > 0) {
+        PERF_METRICS.cacheMetrics.boundingRectHitRate = PERF_METRICS.cacheMetrics.boundingRectCacheHits / boundingRectTotal;
+      }
+
+      if (computedStyleTotal > 0) {
+        PERF_METRICS.cacheMetrics.computedStyleHitRate = PERF_METRICS.cacheMetrics.computedStyleCacheHits / computedStyleTotal;
+      }
+
+      if ((boundingRectTotal + computedStyleTotal) > 0) {
+        PERF_METRICS.cacheMetrics.overallHitRate =
+          (PERF_METRICS.cacheMetrics.boundingRectCacheHits + PERF_METRICS.cacheMetrics.computedStyleCacheHits) /
+          (boundingRectTotal + computedStyleTotal);
+      }
     }
+
+    if (REGISTRY) registerElements();
+    const result = AGENT ? finishSnapshot(rootId, WALK.truncated ? null : fingerprint) : { rootId, map: DOM_HASH_MAP };
+    if (REGISTRY) result.registryId = REGISTRY.id;
+    if (WALK.truncated) result.truncated = true;
+    if (debugMode) result.perfMetrics = PERF_METRICS;
+    return args.packed ? packResult(result) : result;
   }
 
-  return debugMode ?
-    { rootId, map: DOM_HASH_MAP, perfMetrics: PERF_METRICS } :
-    { rootId, map: DOM_HASH_MAP };
+  // Taken before the walk, so changes made while a time-sliced walk yields to the page invalidate the snapshot
+  const fingerprint = AGENT ? getSnapshotFingerprint() : null;
+  // A time-sliced walk reads fresh geometry in every slice, observed geometry would go stale
+  const intersections = args.timeSliced ? null : observeIntersections();
+  if (intersections) return intersections.then(() => finish(buildDomTree(document.body)));
+  const rootId = buildDomTree(document.body);
+  return args.timeSliced ? rootId.then(finish) : finish(rootId);
 };
@@ -0,0 +1,225 @@
+"""
+Diff of two DOMElementNode trees, e.g. of consecutive DOMStates.
+
+The trees are aligned top-down: the children of two matched elements are aligned by the longest common subsequence of
+their tags and attributes, so an inserted sibling does not shift the elements after it. Common prefixes and suffixes
+are matched before the subsequence is computed, which keeps the alignment linear for the usual local changes.
+Children left over in a parent that appear on both sides are matched as moved within the parent.
+
+Elements the alignment leaves over are matched by xpath, tag and attributes, then as moved when their tag and
+attributes are unique among the left overs of both trees, the rest were removed or inserted. Text nodes are not
+aligned themselves, a change of the text directly inside a matched element is reported on the element.
+"""
+
+from collections import defaultdict, deque
+from dataclasses import dataclass
+
+from browser_use.dom.diff.views import DOMNodeChange, DOMTextChange, DOMTreeDiff
+from browser_use.dom.history_tree_processor.service import HistoryTreeProcessor
+from browser_use.dom.views import DOMElementNode, DOMState, DOMTextNode
+from browser_use.utils import time_execution_sync
+
+# Larger sibling lists are aligned in order by key instead of by the quadratic longest common subsequence
+MAX_LCS_CELLS = 40_000
+
+
+@dataclass(frozen=False, slots=True)
+class _DiffEntry:
+	node: DOMElementNode
+	# Xpaths are relative to the nearest shadow root or iframe, the scope holds the xpaths of the hosts above it
+	scope: str
+	attributes_hash: str
+	text: str
+	position: int
+	matched: '_DiffEntry | None' = None
+	moved: bool = False
+
+
+class DomDiff:
+	"""
+	Aligns two element trees and reports the inserted, removed, moved and text changed elements
+	"""
+
+	@staticmethod
+	def compare_states(previous: DOMState, current: DOMState) -> DOMTreeDiff:
+		return DomDiff.compare(previous.element_tree, current.element_tree)
+
+	@staticmethod
+	@time_execution_sync('--dom_diff')
+	def compare(previous: DOMElementNode, current: DOMElementNode) -> DOMTreeDiff:
+		diff = DOMTreeDiff()
+		# A reused state has the same tree
+		if previous is current:
+			return diff
+
+		previous_entries = DomDiff._collect(previous)
+		current_entries = DomDiff._collect(current)
+
+		if previous.tag_name == current.tag_name:
+			DomDiff._align(previous_entries, current_entries, previous_entries[id(previous)], current_entries[id(current)])
+		DomDiff._match_left_overs(previous_entries, current_entries)
+
+		for entry in current_entries.values():
+			if entry.matched is None:
+				diff.inserted.append(entry.node)
+			else:
+				if entry.moved:
+					diff.moved.append(DOMNodeChange(entry.matched.node, entry.node))
+				if entry.matched.text != entry.text:
+					diff.text_changed.append(DOMTextChange(entry.matched.node, entry.node, entry.matched.text, entry.text))
+		diff.removed = [entry.node for entry in previous_entries.values() if entry.matched is None]
+		return diff
+
+	@staticmethod
+	def _collect(root: DOMElementNode) -> dict[int, _DiffEntry]:
+		"""Elements of the tree in document order, keyed by the id of the node"""
+		entries: dict[int, _DiffEntry] = {}
+		stack: list[tuple[DOMElementNode, str]] = [(root, '')]
+		while stack:
+			node, scope = stack.pop()
+			text = '\n'.join(child.text for child in node.children if isinstance(child, DOMTextNode))
+			attributes_hash = HistoryTreeProcessor.attributes_hash(node.attributes)
+			entries[id(node)] = _DiffEntry(node, scope, attributes_hash, text, len(entries))
+
+			child_scope = f'{scope}/{node.xpath}' if node.shadow_root or node.tag_name == 'iframe' else scope
+			stack.extend((child, child_scope) for child in reversed(node.children) if isinstance(child, DOMElementNode))
+		return entries
+
+	@staticmethod
+	def _pair(previous_entry: _DiffEntry, current_entry: _DiffEntry, moved: bool = False) -> None:
+		previous_entry.matched = current_entry
+		current_entry.matched = previous_entry
+		current_entry.moved = moved
+
+	@staticmethod
+	def _align(
+		previous_entries: dict[int, _DiffEntry],
+		current_entries: dict[int, _DiffEntry],
+		previous_root: _DiffEntry,
+		current_root: _DiffEntry,
+		moved: bool = False,
+	) -> None:
+		"""Match the two elements and align their subtrees top-down"""
+		DomDiff._pair(previous_root, current_root, moved)
+		stack = [(previous_root, current_root)]
+		while stack:
+			previous_parent, current_parent = stack.pop()
+			previous_children = DomDiff._unmatched_children(previous_entries, previous_parent)
+			current_children = DomDiff._unmatched_children(current_entries, current_parent)
+			for previous_entry, current_entry, reordered in DomDiff._align_children(previous_children, current_children):
+				DomDiff._pair(previous_entry, current_entry, reordered)
+				stack.append((previous_entry, current_entry))
+
+	@staticmethod
+	def _unmatched_children(entries: dict[int, _DiffEntry], parent: _DiffEntry) -> list[_DiffEntry]:
+		children = (entries[id(child)] for child in parent.node.children if isinstance(child, DOMElementNode))
+		return [child for child in children if child.matched is None]
+
+	@staticmethod
+	def _align_children(
+		previous_children: list[_DiffEntry], current_children: list[_DiffEntry]
+	) -> list[tuple[_DiffEntry, _DiffEntry, bool]]:
+		"""Pairs of siblings with the same tag and attributes, and whether the pair changed its order"""
+
+		def key(entry: _DiffEntry) -> tuple[str, str]:
+			return (entry.node.tag_name, entry.attributes_hash)
+
+		previous_keys = [key(entry) for entry in previous_children]
+		current_keys = [key(entry) for entry in current_children]
+
+		start = 0
+		while start < len(previous_keys) and start < len(current_keys) and previous_keys[start] == current_keys[start]:
+			start += 1
+		previous_end, current_end = len(previous_keys), len(current_keys)
+		while previous_end > start and current_end > start and previous_keys[previous_end - 1] == current_keys[current_end - 1]:
+			previous_end -= 1
+			current_end -= 1
+
+		pairs = [(previous_children[index], current_children[index], False) for index in range(start)]
+		pairs.extend(
+			(previous_children[previous_end + offset], current_children[current_end + offset], False)
+			for offset in range(len(previous_keys) - previous_end)
+		)
+
+		previous_middle = range(start, previous_end)
+		current_middle = range(start, current_end)
+		# Without the subsequence the order of the middle is not known, pairs in order by key are not reported as moved
+		use_lcs = len(previous_middle) * len(current_middle) <= MAX_LCS_CELLS
+		if use_lcs:
+			for previous_index, current_index in DomDiff._lcs(
+				[previous_keys[index] for index in previous_middle], [current_keys[index] for index in current_middle]
+			):
+				pairs.append((previous_children[start + previous_index], current_children[start + current_index], False))
+
+		paired = {id(entry) for pair in pairs for entry in pair[:2]}
+		unpaired_previous: dict[tuple[str, str], deque[_DiffEntry]] = defaultdict(deque)
+		for index in previous_middle:
+			if id(previous_children[index]) not in paired:
+				unpaired_previous[previous_keys[index]].append(previous_children[index])
+		for index in current_middle:
+			candidates = unpaired_previous.get(current_keys[index])
+			if id(current_children[index]) not in paired and candidates:
+				pairs.append((candidates.popleft(), current_children[index], use_lcs))
+		return pairs
+
+	@staticmethod
+	def _lcs(previous_keys: list[tuple[str, str]], current_keys: list[tuple[str, str]]) -> list[tuple[int, int]]:
+		"""Index pairs of a longest common subsequence of the two key lists"""
+		lengths = [[0] * (len(current_keys) + 1) for _ in range(len(previous_keys) + 1)]
+		for previous_index in range(len(previous_keys) - 1, -1, -1):
+			for current_index in range(len(current_keys) - 1, -1, -1):
+				if previous_keys[previous_index] == current_keys[current_index]:
+					lengths[previous_index][current_index] = lengths[previous_index + 1][current_index + 1] + 1
+				else:
+					lengths[previous_index][current_index] = max(
+						lengths[previous_index + 1][current_index], lengths[previous_index][current_index + 1]
+					)
+
+		pairs: list[tuple[int, int]] = []
+		previous_index = current_index = 0
+		while previous_index < len(previous_keys) and current_index < len(current_keys):
+			if previous_keys[previous_index] == current_keys[current_index]:
+				pairs.append((previous_index, current_index))
+				previous_index += 1
+				current_index += 1
+			elif lengths[previous_index + 1][current_index] >= lengths[previous_index][current_index + 1]:
+				previous_index += 1
+			else:
+				current_index += 1
+		return pairs
+
+	@staticmethod
+	def _match_left_overs(previous_entries: dict[int, _DiffEntry], current_entries: dict[int, _DiffEntry]) -> None:
+		"""
+		Match the elements the alignment left over, first by xpath, tag and attributes, then as moved when their tag and
+		attributes are unique on both sides. Elements without attributes are too generic to be told apart and are never
+		matched as moved. The subtrees of the matched elements are aligned in turn.
+		"""
+		unmatched_previous: dict[tuple, deque[_DiffEntry]] = defaultdict(deque)
+		for entry in previous_entries.values():
+			if entry.matched is None:
+				unmatched_previous[(entry.scope, entry.node.xpath, entry.node.tag_name, entry.attributes_hash)].append(entry)
+		for entry in current_entries.values():
+			if entry.matched is not None:
+				continue
+			candidates = unmatched_previous.get((entry.scope, entry.node.xpath, entry.node.tag_name, entry.attributes_hash))
+			while candidates and candidates[0].matched is not None:
+				candidates.popleft()
+			if candidates:
+				DomDiff._align(previous_entries, current_entries, candidates.popleft(), entry)
+
+		def group(entries: dict[int, _DiffEntry]) -> dict[tuple, list[_DiffEntry]]:
+			groups: dict[tuple, list[_DiffEntry]] = defaultdict(list)
+			for entry in entries.values():
+				if entry.matched is None and entry.node.attributes:
+					groups[(entry.scope, entry.node.tag_name, entry.attributes_hash)].append(entry)
+			return groups
+
+		previous_groups = group(previous_entries)
+		current_groups = group(current_entries)
+		# Current elements in document order, so ancestors are matched and aligned before their descendants
+		for entries in sorted(current_groups.values(), key=lambda entries: entries[0].position):
+			key = (entries[0].scope, entries[0].node.tag_name, entries[0].attributes_hash)
+			candidates = previous_groups.get(key, [])
+			if len(entries) == 1 and len(candidates) == 1 and entries[0].matched is None and candidates[0].matched is None:
+				DomDiff._align(previous_entries, current_entries, candidates[0], entries[0], moved=True)
@@ -0,0 +1,36 @@
+from dataclasses import dataclass, field
+
+from browser_use.dom.views import DOMElementNode
+
+
+@dataclass
+class DOMNodeChange:
+	"""An element of the previous tree and the element it was aligned with in the current tree"""
+
+	previous: DOMElementNode
+	current: DOMElementNode
+
+
+@dataclass
+class DOMTextChange(DOMNodeChange):
+	"""The text directly inside an aligned element changed"""
+
+	previous_text: str
+	current_text: str
+
+
+@dataclass
+class DOMTreeDiff:
+	"""
+	Changes between two element trees. Inserted, moved and text changed elements are in the document order of the
+	current tree, removed elements in the document order of the previous tree.
+	"""
+
+	inserted: list[DOMElementNode] = field(default_factory=list)
+	removed: list[DOMElementNode] = field(default_factory=list)
+	moved: list[DOMNodeChange] = field(default_factory=list)
+	text_changed: list[DOMTextChange] = field(default_factory=list)
+
+	@property
+	def has_changes(self) -> bool:
+		return bool(self.inserted or self.removed or self.moved or self.text_changed)
@@ -0,0 +1,126 @@
+(() => {
+  // Persistent in-page state shared between buildDomTree.js runs on the same document.
+  // Installed as an init script on every new document, and lazily on pages that predate it.
+  if (window.__browserUse && window.__browserUse.observer) return;
+
+  const HIGHLIGHT_CONTAINER_ID = "playwright-highlight-container";
+  const OBSERVER_OPTIONS = { subtree: true, childList: true, attributes: true, characterData: true };
+
+  const agent = window.__browserUse = window.__browserUse || {};
+  agent.documentId = Math.random().toString(36).slice(2) + Date.now().toString(36);
+  agent.epoch = 0;
+  agent.snapshotCounter = 0;
+  agent.snapshot = null;
+  agent.nextNodeId = 1;
+  agent.nodeIds = new WeakMap();
+
+  /**
+   * Returns the id of a node, stable for as long as the node is alive.
+   */
+  agent.getNodeId = (node) => {
+    let id = agent.nodeIds.get(node);
+    if (id === undefined) {
+      id = agent.nextNodeId++;
+      agent.nodeIds.set(node, id);
+    }
+    return id;
+  };
+
+  // Mutations of our own highlight overlay must not invalidate the snapshot
+  function isHighlightMutation(record) {
+    for (let node = record.target; node; node = node.parentNode) {
+      if (node.id === HIGHLIGHT_CONTAINER_ID) return true;
+    }
+    if (record.type !== "childList") return false;
+    const nodes = [...record.addedNodes, ...record.removedNodes];
+    return nodes.length > 0 && nodes.every((node) => node.id === HIGHLIGHT_CONTAINER_ID);
+  }
+
+  function handleRecords(records) {
+    for (const record of records) {
+      if (!isHighlightMutation(record)) {
+        agent.epoch++;
+        return;
+      }
+    }
+  }
+
+  agent.observer = new MutationObserver(handleRecords);
+  agent.observer.observe(document, OBSERVER_OPTIONS);
+
+  /**
+   * Starts observing a shadow root or iframe document, which the document observer does not see into.
+   */
+  agent.observe = (root) => {
+    try {
+      agent.observer.observe(root, OBSERVER_OPTIONS);
+    } catch (e) {
+      // Cross-origin documents cannot be observed
+    }
+  };
+
+  /**
+   * Processes pending mutation records and returns the current epoch.
+   */
+  agent.flush = () => {
+    handleRecords(agent.observer.takeRecords());
+    return agent.epoch;
+  };
+
+  // Elements that can be interacted with, a cheap superset of the checks of buildDomTree.js
+  const INTERACTIVE_SELECTOR = [
+    "a", "button", "input", "select", "textarea", "summary", "details", "[role]", "[tabindex]", "[onclick]",
+    "[contenteditable]",
+  ].join(",");
+  let interactiveEpoch = -1;
+  let interactiveHash = 0;
+
+  function isRendered(element) {
+    if (element.checkVisibility) return element.checkVisibility({ opacityProperty: true, visibilityProperty: true });
+    return element.getClientRects().length > 0;
+  }
+
+  /**
+   * Rolling FNV-1a hash of the ids and visibility of the interactive elements in document order. It changes when an
+   * interactive element is added, removed, moved, shown or hidden, recomputed only when the epoch changed.
+   */
+  function getInteractiveHash(epoch) {
+    if (epoch !== interactiveEpoch) {
+      let hash = 0x811c9dc5;
+      for (const element of document.querySelectorAll(INTERACTIVE_SELECTOR)) {
+        // Menus and modals are often shown by a class or style toggle with their items already in the DOM
+        hash = Math.imul(hash ^ (agent.getNodeId(element) * 2 + (isRendered(element) ? 1 : 0)), 0x01000193);
+      }
+      interactiveHash = hash >>> 0;
+      interactiveEpoch = epoch;
+    }
+    return interactiveHash;
+  }
+
+  /**
+   * Structural fingerprint of the page, queried in one evaluate to decide whether a new state is needed.
+   * The epoch covers every mutation and layout event, the interactive hash only the set of interactive elements.
+   */
+  agent.getFingerprint = () => {
+    const epoch = agent.flush();
+    const root = document.documentElement;
+    return {
+      documentId: agent.documentId,
+      epoch,
+      interactive: getInteractiveHash(epoch),
+      scroll: [window.scrollX, window.scrollY, root ? root.scrollWidth : 0, root ? root.scrollHeight : 0],
+      viewport: [window.innerWidth, window.innerHeight],
+    };
+  };
+
+  // Layout can change without touching the DOM tree (scrolled containers, loaded images, animations, :hover styles of
+  // menus and tooltips), and so can the value or checked state of form controls, which are properties and not attributes.
+  // Shadow roots are observed by the walk that finds them, a host added later is a mutation of its parent.
+  const bump = () => { agent.epoch++; };
+  for (const type of [
+    "scroll", "resize", "load", "transitionend", "animationend", "focusin", "focusout", "input", "change", "pointerover",
+    "pointerout",
+  ]) {
+    window.addEventListener(type, bump, { capture: true, passive: true });
+  }
+})();
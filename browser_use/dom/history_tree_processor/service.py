@@ -1,8 +1,17 @@
 import hashlib
 from typing import Optional
 
-from browser_use.dom.history_tree_processor.view import DOMHistoryElement, HashedDomElement
-from browser_use.dom.views import DOMElementNode
+from browser_use.dom.history_tree_processor.view import DOMElementIndex, DOMHistoryElement, HashedDomElement
+from browser_use.dom.views import DOMElementNode, SelectorMap
+
+# Digest size of the element hashes, they only identify elements within a session and are never stored
+HASH_DIGEST_SIZE = 16
+
+# Branch path hash of the root, whose tag is not part of the path
+ROOT_BRANCH_PATH_HASH = ''
+
+# Attributes that usually survive changes of the page structure, indexed to find elements whose hash changed
+STABLE_ATTRIBUTES = ('id', 'name', 'aria-label')
 
 
 class HistoryTreeProcessor:
@@ -37,8 +46,7 @@ class HistoryTreeProcessor:
 
 		def process_node(node: DOMElementNode):
 			if node.highlight_index is not None:
-				hashed_node = HistoryTreeProcessor._hash_dom_element(node)
-				if hashed_node == hashed_dom_history_element:
+				if node.hash == hashed_dom_history_element:
 					return node
 			for child in node.children:
 				if isinstance(child, DOMElementNode):
@@ -49,26 +57,60 @@ class HistoryTreeProcessor:
 
 		return process_node(tree)
 
+	@staticmethod
+	def build_element_index(selector_map: SelectorMap) -> DOMElementIndex:
+		index = DOMElementIndex()
+		for highlight_index in sorted(selector_map):
+			node = selector_map[highlight_index]
+			# The first element in document order wins, like in find_history_element_in_tree
+			index.by_hash.setdefault(node.hash, node)
+			index.by_xpath.setdefault(node.xpath, []).append(node)
+			for name in STABLE_ATTRIBUTES:
+				value = node.attributes.get(name)
+				if value:
+					index.by_attribute.setdefault((name, value), []).append(node)
+		return index
+
+	@staticmethod
+	def find_history_element_in_index(dom_history_element: DOMHistoryElement, index: DOMElementIndex) -> Optional[DOMElementNode]:
+		"""
+		Find the element of a history element by its hash. An element whose path or attributes changed is matched by a
+		stable attribute, then by its xpath, if exactly one element with the same tag has it.
+		"""
+		node = index.by_hash.get(HistoryTreeProcessor._hash_dom_history_element(dom_history_element))
+		if node is not None:
+			return node
+
+		candidate_lists = [
+			index.by_attribute.get((name, dom_history_element.attributes[name]), [])
+			for name in STABLE_ATTRIBUTES
+			if dom_history_element.attributes.get(name)
+		]
+		candidate_lists.append(index.by_xpath.get(dom_history_element.xpath, []))
+		for candidates in candidate_lists:
+			matches = [candidate for candidate in candidates if candidate.tag_name == dom_history_element.tag_name]
+			if len(matches) == 1:
+				return matches[0]
+		return None
+
 	@staticmethod
 	def compare_history_element_and_dom_element(dom_history_element: DOMHistoryElement, dom_element: DOMElementNode) -> bool:
 		hashed_dom_history_element = HistoryTreeProcessor._hash_dom_history_element(dom_history_element)
-		hashed_dom_element = HistoryTreeProcessor._hash_dom_element(dom_element)
 
-		return hashed_dom_history_element == hashed_dom_element
+		return hashed_dom_history_element == dom_element.hash
 
 	@staticmethod
 	def _hash_dom_history_element(dom_history_element: DOMHistoryElement) -> HashedDomElement:
 		branch_path_hash = HistoryTreeProcessor._parent_branch_path_hash(dom_history_element.entire_parent_branch_path)
-		attributes_hash = HistoryTreeProcessor._attributes_hash(dom_history_element.attributes)
+		attributes_hash = HistoryTreeProcessor.attributes_hash(dom_history_element.attributes)
 		xpath_hash = HistoryTreeProcessor._xpath_hash(dom_history_element.xpath)
 
 		return HashedDomElement(branch_path_hash, attributes_hash, xpath_hash)
 
 	@staticmethod
 	def _hash_dom_element(dom_element: DOMElementNode) -> HashedDomElement:
-		parent_branch_path = HistoryTreeProcessor._get_parent_branch_path(dom_element)
-		branch_path_hash = HistoryTreeProcessor._parent_branch_path_hash(parent_branch_path)
-		attributes_hash = HistoryTreeProcessor._attributes_hash(dom_element.attributes)
+		branch_path_hash = HistoryTreeProcessor._branch_path_hash(dom_element)
+		attributes_hash = HistoryTreeProcessor.attributes_hash(dom_element.attributes)
 		xpath_hash = HistoryTreeProcessor._xpath_hash(dom_element.xpath)
 		# text_hash = DomTreeProcessor._text_hash(dom_element)
 
@@ -86,19 +128,45 @@ class HistoryTreeProcessor:
 
 		return [parent.tag_name for parent in parents]
 
+	@staticmethod
+	def _branch_path_hash(dom_element: DOMElementNode) -> str:
+		"""
+		Rolling hash of the tag path of the element. It is extended top-down from the nearest ancestor that already has
+		its hash, and stored on every node on the way, so each node of a tree is hashed at most once.
+		"""
+		chain: list[DOMElementNode] = []
+		current = dom_element
+		while current.parent is not None and current._branch_path_hash is None:
+			chain.append(current)
+			current = current.parent
+
+		branch_path_hash = ROOT_BRANCH_PATH_HASH if current.parent is None else current._branch_path_hash
+		for node in reversed(chain):
+			branch_path_hash = HistoryTreeProcessor._extend_branch_path_hash(branch_path_hash, node.tag_name)
+			node._branch_path_hash = branch_path_hash
+		return branch_path_hash
+
+	@staticmethod
+	def _extend_branch_path_hash(branch_path_hash: str, tag_name: str) -> str:
+		return hashlib.blake2b(f'{branch_path_hash}/{tag_name}'.encode(), digest_size=HASH_DIGEST_SIZE).hexdigest()
+
 	@staticmethod
 	def _parent_branch_path_hash(parent_branch_path: list[str]) -> str:
-		parent_branch_path_string = '/'.join(parent_branch_path)
-		return hashlib.sha256(parent_branch_path_string.encode()).hexdigest()
+		"""Branch path hash of a saved path, folded the same way as the rolling hash of the tree"""
+		branch_path_hash = ROOT_BRANCH_PATH_HASH
+		for tag_name in parent_branch_path:
+			branch_path_hash = HistoryTreeProcessor._extend_branch_path_hash(branch_path_hash, tag_name)
+		return branch_path_hash
 
 	@staticmethod
-	def _attributes_hash(attributes: dict[str, str]) -> str:
+	def attributes_hash(attributes: dict[str, str]) -> str:
+		"""Hash of the attributes in their order, also used to align elements in the DOM diff"""
 		attributes_string = ''.join(f'{key}={value}' for key, value in attributes.items())
-		return hashlib.sha256(attributes_string.encode()).hexdigest()
+		return hashlib.blake2b(attributes_string.encode(), digest_size=HASH_DIGEST_SIZE).hexdigest()
 
 	@staticmethod
 	def _xpath_hash(xpath: str) -> str:
-		return hashlib.sha256(xpath.encode()).hexdigest()
+		return hashlib.blake2b(xpath.encode(), digest_size=HASH_DIGEST_SIZE).hexdigest()
 
 	@staticmethod
 	def _text_hash(dom_element: DOMElementNode) -> str:
@@ -1,10 +1,13 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import TYPE_CHECKING, Optional
 
 from pydantic import BaseModel
 
+if TYPE_CHECKING:
+	from browser_use.dom.views import DOMElementNode
 
-@dataclass
+
+@dataclass(frozen=True)
 class HashedDomElement:
 	"""
 	Hash of the dom element to be used as a unique identifier
@@ -16,6 +19,18 @@ class HashedDomElement:
 	# text_hash: str
 
 
+@dataclass
+class DOMElementIndex:
+	"""
+	Highlighted elements of a state by hash, xpath and stable attribute, so history elements are found without
+	rescanning the tree. Lists keep the highlight index order.
+	"""
+
+	by_hash: dict[HashedDomElement, 'DOMElementNode'] = field(default_factory=dict)
+	by_xpath: dict[str, list['DOMElementNode']] = field(default_factory=dict)
+	by_attribute: dict[tuple[str, str], list['DOMElementNode']] = field(default_factory=dict)
+
+
 class Coordinates(BaseModel):
 	x: int
 	y: int
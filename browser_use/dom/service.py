@@ -1,13 +1,15 @@
-import gc
+import hashlib
 import json
 import logging
 from dataclasses import dataclass
+from functools import cache
 from importlib import resources
 from typing import TYPE_CHECKING, Optional
 
 if TYPE_CHECKING:
 	from playwright.async_api import Page
 
+from browser_use.dom.snapshot.service import DomSnapshotService
 from browser_use.dom.views import (
 	DOMBaseNode,
 	DOMElementNode,
@@ -19,6 +21,48 @@ from browser_use.utils import time_execution_async
 
 logger = logging.getLogger(__name__)
 
+# Bit flags of the packed wire format, see packResult in buildDomTree.js
+NODE_FLAGS = {
+	'isVisible': 1,
+	'isTopElement': 2,
+	'isInteractive': 4,
+	'isInViewport': 8,
+	'shadowRoot': 16,
+}
+
+
+# Calls the buildDomTree.js function registered in the page, null if it is missing or another version
+BUILD_DOM_TREE_CALL = """(args) => {
+	const agent = window.__browserUse;
+	if (!agent || agent.buildDomTreeVersion !== args.scriptVersion) return null;
+	return agent.buildDomTree(args);
+}"""
+
+# Structural fingerprint of the page from domObserver.js, null if the observer is not installed
+GET_FINGERPRINT_CALL = """() => {
+	const agent = window.__browserUse;
+	return agent && agent.getFingerprint ? agent.getFingerprint() : null;
+}"""
+
+# Element of the registry of the last buildDomTree.js walk, null if the registry is another one or the element is gone
+GET_REGISTERED_ELEMENT_CALL = """([registryId, highlightIndex]) => {
+	const registry = window.__browserUse && window.__browserUse.registry;
+	if (!registry || registry.id !== registryId) return null;
+	const element = registry.elements[highlightIndex] && registry.elements[highlightIndex].deref();
+	return element && element.isConnected ? element : null;
+}"""
+
+
+@cache
+def read_script(name: str) -> str:
+	"""Source of a script of the package, read once per process"""
+	return resources.read_text('browser_use.dom', name)
+
+
+@cache
+def get_script_version() -> str:
+	return hashlib.blake2b(read_script('buildDomTree.js').encode(), digest_size=8).hexdigest()
+
 
 @dataclass
 class ViewportInfo:
@@ -27,11 +71,77 @@ class ViewportInfo:
 
 
 class DomService:
-	def __init__(self, page: 'Page'):
+	def __init__(
+		self,
+		page: 'Page',
+		reuse_snapshots: bool = False,
+		packed: bool = False,
+		engine: str = 'javascript',
+		max_nodes: Optional[int] = None,
+		max_millis: Optional[int] = None,
+		time_sliced: bool = False,
+		intersection_observer: bool = False,
+		hit_test_grid_size: int = 0,
+	):
 		self.page = page
 		self.xpath_cache = {}
+		self.reuse_snapshots = reuse_snapshots
+		self.packed = packed
+		self.engine = engine
+		# Budgets of the DOM walk, and whether it yields to the page between idle callbacks
+		self.max_nodes = max_nodes
+		self.max_millis = max_millis
+		self.time_sliced = time_sliced
+		# Take the geometry of the walk from one IntersectionObserver pass, experimental
+		self.intersection_observer = intersection_observer
+		# Cell size in pixels of the grid the occlusion checks share hit tests on, 0 to hit-test every element
+		self.hit_test_grid_size = hit_test_grid_size
+		self._snapshot_service = (
+			DomSnapshotService(page, get_script_version(), self.get_injection_script())
+			if engine in ('cdp', 'accessibility')
+			else None
+		)
 
-		self.js_code = resources.read_text('browser_use.dom', 'buildDomTree.js')
+		self.js_code = read_script('buildDomTree.js')
+
+		# Tree of the last snapshot, reused while the page reports it unchanged
+		self._snapshot_id: Optional[str] = None
+		self._cached_tree: Optional[tuple[DOMElementNode, SelectorMap]] = None
+		# Whether the last walk ran out of its budget
+		self._truncated = False
+		# Id of the in-page element registry of the last walk, None if the page has none
+		self._registry_id: Optional[str] = None
+
+	@staticmethod
+	def get_observer_script() -> str:
+		"""Script that installs the persistent in-page state used to reuse snapshots and fingerprint the page"""
+		return read_script('domObserver.js')
+
+	@staticmethod
+	@cache
+	def get_injection_script() -> str:
+		"""
+		Script that registers buildDomTree.js as window.__browserUse.buildDomTree, so the source is sent and compiled
+		once per document instead of on every state update. Installed as an init script and lazily on older pages.
+		"""
+		version = json.dumps(get_script_version())
+		return (
+			'(() => {\n'
+			'\tif (window.top !== window) return;\n'
+			'\tconst agent = window.__browserUse = window.__browserUse || {};\n'
+			f'\tif (agent.buildDomTreeVersion === {version}) return;\n'
+			f'\tagent.buildDomTree = {read_script("buildDomTree.js").strip().rstrip(";")};\n'
+			f'\tagent.buildDomTreeVersion = {version};\n'
+			'})();'
+		)
+
+	async def get_fingerprint(self) -> Optional[dict]:
+		"""Structural fingerprint of the page from the DOM observer, None if the page has none"""
+		try:
+			return await self.page.evaluate(GET_FINGERPRINT_CALL)
+		except Exception as e:
+			logger.debug('Failed to read the DOM fingerprint: %s', e)
+			return None
 
 	# region - Clickable elements
 	@time_execution_async('--get_clickable_elements')
@@ -42,7 +152,9 @@ class DomService:
 		viewport_expansion: int = 0,
 	) -> DOMState:
 		element_tree, selector_map = await self._build_dom_tree(highlight_elements, focus_element, viewport_expansion)
-		return DOMState(element_tree=element_tree, selector_map=selector_map)
+		return DOMState(
+			element_tree=element_tree, selector_map=selector_map, truncated=self._truncated, registry_id=self._registry_id
+		)
 
 	@time_execution_async('--build_dom_tree')
 	async def _build_dom_tree(
@@ -54,6 +166,19 @@ class DomService:
 		if await self.page.evaluate('1+1') != 2:
 			raise ValueError('The page cannot evaluate javascript code properly')
 
+		self._truncated = False
+		self._registry_id = None
+
+		if self._snapshot_service is not None:
+			try:
+				eval_page = await self._snapshot_service.get_node_map(
+					highlight_elements, focus_element, viewport_expansion, accessibility=self.engine == 'accessibility'
+				)
+				return await self._construct_dom_tree(eval_page)
+			except Exception as e:
+				# CDP is only available in chromium
+				logger.warning('Failed to build the DOM tree from a CDP snapshot, falling back to buildDomTree.js: %s', e)
+
 		# NOTE: We execute JS code in the browser to extract important DOM information.
 		#       The returned hash map contains information about the DOM tree and the
 		#       relationship between the DOM elements.
@@ -63,20 +188,139 @@ class DomService:
 			'focusHighlightIndex': focus_element,
 			'viewportExpansion': viewport_expansion,
 			'debugMode': debug_mode,
+			'reuseSnapshots': self.reuse_snapshots,
+			'baseSnapshotId': self._snapshot_id,
+			'packed': self.packed,
+			'scriptVersion': get_script_version(),
+			'maxNodes': self.max_nodes or 0,
+			'maxMillis': self.max_millis or 0,
+			'timeSliced': self.time_sliced,
+			'intersectionObserver': self.intersection_observer,
+			'hitTestGridSize': self.hit_test_grid_size,
 		}
 
 		try:
-			eval_page = await self.page.evaluate(self.js_code, args)
+			eval_page = await self._evaluate_dom_tree(args)
 		except Exception as e:
 			logger.error('Error evaluating JavaScript: %s', e)
 			raise
 
+		if isinstance(eval_page, str):
+			eval_page = self._unpack_dom_tree(json.loads(eval_page))
+
+		self._registry_id = eval_page.get('registryId')
+
+		if eval_page.get('truncated'):
+			self._truncated = True
+			logger.debug(
+				'DOM walk ran out of its budget (%s nodes, %s ms), the tree is truncated', self.max_nodes, self.max_millis
+			)
+
 		# Only log performance metrics in debug mode
 		if debug_mode and 'perfMetrics' in eval_page:
 			logger.debug('DOM Tree Building Performance Metrics:\n%s', json.dumps(eval_page['perfMetrics'], indent=2))
 
+		if self.reuse_snapshots:
+			return await self._apply_snapshot(eval_page)
+
 		return await self._construct_dom_tree(eval_page)
 
+	async def _evaluate_dom_tree(self, args: dict):
+		"""Run the registered buildDomTree.js, injecting it first into documents that predate the init script"""
+		eval_page = await self.page.evaluate(BUILD_DOM_TREE_CALL, args)
+		if eval_page is not None:
+			return eval_page
+
+		logger.debug('buildDomTree.js %s is not registered in the page, injecting it', args['scriptVersion'])
+		await self.page.evaluate(self.get_injection_script())
+		eval_page = await self.page.evaluate(BUILD_DOM_TREE_CALL, args)
+		if eval_page is None:
+			# The document was replaced in between
+			eval_page = await self.page.evaluate(self.js_code, args)
+		return eval_page
+
+	async def _apply_snapshot(self, eval_page: dict) -> tuple[DOMElementNode, SelectorMap]:
+		"""Reuse the cached tree of an unchanged page, or build the tree of a new snapshot and cache it"""
+		if eval_page.get('unchanged') and self._cached_tree is not None:
+			logger.debug('DOM unchanged since snapshot %s, reusing cached tree', self._snapshot_id)
+			return self._cached_tree
+
+		if 'snapshotId' not in eval_page:
+			# The page was loaded before the observer init script was registered
+			self._reset_snapshot()
+			await self._install_observer()
+			return await self._construct_dom_tree(eval_page)
+
+		try:
+			result = await self._construct_dom_tree(eval_page)
+		except Exception:
+			self._reset_snapshot()
+			raise
+
+		self._snapshot_id = eval_page['snapshotId']
+		self._cached_tree = result
+		return result
+
+	async def _install_observer(self) -> None:
+		try:
+			await self.page.evaluate(self.get_observer_script())
+		except Exception as e:
+			logger.debug('Failed to install DOM observer: %s', e)
+
+	def _reset_snapshot(self) -> None:
+		self._snapshot_id = None
+		self._cached_tree = None
+
+	def _unpack_dom_tree(self, packed: dict) -> dict:
+		"""Decode the packed wire format into the regular node map in a single pass over the columns"""
+		strings = packed.pop('strings')
+		columns = packed.pop('nodes')
+		packed.pop('format', None)
+
+		attributes = columns['attributes']
+		attribute_offsets = columns['attributeOffsets']
+		children = columns['children']
+		child_offsets = columns['childOffsets']
+		flag_items = NODE_FLAGS.items()
+
+		js_node_map = {}
+		rows = zip(
+			columns['id'],
+			columns['tag'],
+			columns['xpath'],
+			columns['text'],
+			columns['flags'],
+			columns['highlightIndex'],
+			columns['elementId'],
+		)
+		for i, (node_id, tag, xpath, text, flags, highlight_index, element_id) in enumerate(rows):
+			if tag < 0:
+				js_node_map[str(node_id)] = {
+					'type': 'TEXT_NODE',
+					'text': strings[text],
+					'isVisible': bool(flags & NODE_FLAGS['isVisible']),
+				}
+				continue
+
+			node_data = {name: True for name, flag in flag_items if flags & flag}
+			node_data['tagName'] = strings[tag]
+			node_data['xpath'] = strings[xpath]
+			node_data['attributes'] = {
+				strings[attributes[j]]: strings[attributes[j + 1]]
+				for j in range(attribute_offsets[i], attribute_offsets[i + 1], 2)
+			}
+			node_data['children'] = [str(child_id) for child_id in children[child_offsets[i] : child_offsets[i + 1]]]
+			if highlight_index >= 0:
+				node_data['highlightIndex'] = highlight_index
+			if element_id >= 0:
+				node_data['elementId'] = strings[element_id]
+			js_node_map[str(node_id)] = node_data
+
+		packed['map'] = js_node_map
+		if 'rootId' in packed:
+			packed['rootId'] = str(packed['rootId'])
+		return packed
+
 	@time_execution_async('--construct_dom_tree')
 	async def _construct_dom_tree(
 		self,
@@ -87,6 +331,7 @@ class DomService:
 
 		selector_map = {}
 		node_map = {}
+		children_map = {}
 
 		for id, node_data in js_node_map.items():
 			node, children_ids = self._parse_node(node_data)
@@ -95,28 +340,25 @@ class DomService:
 
 			node_map[id] = node
 
-			if isinstance(node, DOMElementNode) and node.highlight_index is not None:
-				selector_map[node.highlight_index] = node
-
-			# NOTE: We know that we are building the tree bottom up
-			#       and all children are already processed.
 			if isinstance(node, DOMElementNode):
-				for child_id in children_ids:
-					if child_id not in node_map:
-						continue
+				children_map[id] = children_ids
+				if node.highlight_index is not None:
+					selector_map[node.highlight_index] = node
 
-					child_node = node_map[child_id]
+		# NOTE: Children are linked once all nodes are created,
+		#       so the order of the node map does not matter.
+		for id, children_ids in children_map.items():
+			node = node_map[id]
+			for child_id in children_ids:
+				if child_id not in node_map:
+					continue
 
-					child_node.parent = node
-					node.children.append(child_node)
+				child_node = node_map[child_id]
 
-		html_to_dict = node_map[str(js_root_id)]
+				child_node.parent = node
+				node.children.append(child_node)
 
-		del node_map
-		del js_node_map
-		del js_root_id
-
-		gc.collect()
+		html_to_dict = node_map[str(js_root_id)]
 
 		if html_to_dict is None or not isinstance(html_to_dict, DOMElementNode):
 			raise ValueError('Failed to parse HTML to dictionary')
@@ -162,6 +404,8 @@ class DomService:
 			shadow_root=node_data.get('shadowRoot', False),
 			parent=None,
 			viewport_info=viewport_info,
+			backend_node_id=node_data.get('backendNodeId'),
+			element_id=node_data.get('elementId'),
 		)
 
 		children_ids = node_data.get('children', [])
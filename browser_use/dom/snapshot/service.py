@@ -0,0 +1,830 @@
+"""
+DOM extraction engine built on the CDP DOMSnapshot domain.
+
+DOMSnapshot.captureSnapshot returns the nodes, computed styles, layout bounds, paint order and backend node ids
+of all documents of a page (including same process iframes) in one native call. The checks of buildDomTree.js
+are replicated on that data, and the result is the same node map the script returns, so DomService builds the
+same DOMElementNode tree and SelectorMap from it. In accessibility mode the interactive elements are the
+controls of Accessibility.getFullAXTree, mapped to the snapshot nodes by their backend node ids. That mode is
+for accuracy and costs more than the plain snapshot: visibility and occlusion still need the full snapshot, so
+the accessibility trees are fetched in addition to it.
+"""
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Optional
+
+from browser_use.dom.snapshot.views import (
+	DOCUMENT_FRAGMENT_NODE,
+	ELEMENT_NODE,
+	SNAPSHOT_COMPUTED_STYLES,
+	TEXT_NODE,
+	SnapshotNode,
+	SnapshotRect,
+)
+from browser_use.utils import time_execution_async
+
+if TYPE_CHECKING:
+	from playwright.async_api import CDPSession, Page
+
+logger = logging.getLogger(__name__)
+
+HIGHLIGHT_CONTAINER_ID = 'playwright-highlight-container'
+
+ALWAYS_ACCEPTED_TAGS = frozenset({'body', 'div', 'main', 'article', 'section', 'nav', 'header', 'footer'})
+LEAF_ELEMENT_DENY_LIST = frozenset({'svg', 'script', 'style', 'link', 'meta', 'noscript', 'template'})
+INTERACTIVE_CANDIDATE_TAGS = frozenset({'a', 'button', 'input', 'select', 'textarea', 'details', 'summary'})
+INTERACTIVE_CANDIDATE_ATTRIBUTES = ('onclick', 'role', 'tabindex', 'aria-', 'data-action')
+INTERACTIVE_TAGS = frozenset(
+	{
+		'a',
+		'button',
+		'details',
+		'embed',
+		'input',
+		'menu',
+		'menuitem',
+		'object',
+		'select',
+		'textarea',
+		'canvas',
+		'summary',
+		'dialog',
+		'banner',
+	}
+)
+INTERACTIVE_ROLES = frozenset(
+	{
+		'button-icon',
+		'dialog',
+		'button-text-icon-only',
+		'treeitem',
+		'alert',
+		'grid',
+		'progressbar',
+		'radio',
+		'checkbox',
+		'menuitem',
+		'option',
+		'switch',
+		'dropdown',
+		'scrollbar',
+		'combobox',
+		'a-button-text',
+		'button',
+		'region',
+		'textbox',
+		'tabpanel',
+		'tab',
+		'click',
+		'button-text',
+		'spinbutton',
+		'a-button-inner',
+		'link',
+		'menu',
+		'slider',
+		'listbox',
+		'a-dropdown-button',
+		'button-icon-only',
+		'searchbox',
+		'menuitemradio',
+		'tooltip',
+		'tree',
+		'menuitemcheckbox',
+	}
+)
+ARIA_STATE_ATTRIBUTES = ('aria-expanded', 'aria-pressed', 'aria-selected', 'aria-checked')
+CLICK_HANDLER_ATTRIBUTES = ('onclick', 'ng-click', '@click', 'v-on:click')
+
+# Roles of the accessibility tree that are interactive on their own
+AX_INTERACTIVE_ROLES = frozenset(
+	{
+		'button',
+		'checkbox',
+		'combobox',
+		'link',
+		'listbox',
+		'menuitem',
+		'menuitemcheckbox',
+		'menuitemradio',
+		'option',
+		'radio',
+		'searchbox',
+		'slider',
+		'spinbutton',
+		'switch',
+		'tab',
+		'textbox',
+		'treeitem',
+		'MenuListOption',
+		'MenuListPopup',
+		'PopUpButton',
+		'DisclosureTriangle',
+	}
+)
+# States of the accessibility tree that only interactive nodes have
+AX_INTERACTIVE_PROPERTIES = frozenset({'editable', 'checked', 'pressed', 'expanded', 'hasPopup'})
+# Focusable nodes with these roles are containers, not controls
+AX_CONTAINER_ROLES = frozenset({'RootWebArea', 'WebArea', 'Iframe', 'generic', 'none', 'presentation', 'document', 'group'})
+
+# Cell size in CSS pixels of the grid used to find the topmost element at a point
+HIT_TEST_CELL_SIZE = 64
+
+# Removes the highlights of the previous state and reads the viewport size
+PREPARE_SCRIPT = """() => {
+	document.getElementById('playwright-highlight-container')?.remove();
+	return { width: window.innerWidth, height: window.innerHeight };
+}"""
+
+# Draws the highlights with the renderer of buildDomTree.js registered in the page, false if it is missing or another
+# version. Every highlight is [index, box, target, iframe], target and iframe index into the element arguments.
+RENDER_HIGHLIGHTS_CALL = """function (scriptVersion, highlights, ...elements) {
+	const agent = window.__browserUse;
+	if (!agent || agent.buildDomTreeVersion !== scriptVersion) return false;
+	agent.buildDomTree({
+		highlights: highlights.map(([index, [left, top, width, height], target, iframe]) => [
+			target >= 0 ? elements[target] : { left, top, width, height },
+			index,
+			iframe >= 0 ? elements[iframe] : null,
+		]),
+	});
+	return true;
+}"""
+
+# Object group of the elements resolved for the highlights, released once they are drawn
+HIGHLIGHT_OBJECT_GROUP = 'browser-use-highlights'
+
+
+def _rare_values(data: Optional[dict]) -> dict[int, int]:
+	"""Decode RareStringData / RareIntegerData into a node index -> value dict"""
+	if not data:
+		return {}
+	return dict(zip(data['index'], data['value']))
+
+
+def parse_snapshot(snapshot: dict) -> list[list[SnapshotNode]]:
+	"""
+	Decode the documents of a DOMSnapshot.captureSnapshot result into linked SnapshotNodes.
+	Returns the nodes of every document in document order, the first node of each list is its document node.
+	"""
+	strings = snapshot['strings']
+
+	def string(index: int) -> str:
+		return strings[index] if index >= 0 else ''
+
+	documents = []
+	content_documents = []
+	for document_index, document in enumerate(snapshot['documents']):
+		nodes = document['nodes']
+		node_types = nodes['nodeType']
+		node_names = nodes['nodeName']
+		node_values = nodes.get('nodeValue')
+		backend_node_ids = nodes['backendNodeId']
+		attributes = nodes.get('attributes')
+		shadow_root_types = _rare_values(nodes.get('shadowRootType'))
+		clickable = set(nodes.get('isClickable', {}).get('index', []))
+		pseudo = set(nodes.get('pseudoType', {}).get('index', []))
+
+		parsed: list[SnapshotNode] = []
+		# Parents always come before their children
+		for i, parent_index in enumerate(nodes['parentIndex']):
+			attribute_indices = attributes[i] if attributes else []
+			node = SnapshotNode(
+				document_index=document_index,
+				node_type=node_types[i],
+				node_name=string(node_names[i]),
+				node_value=string(node_values[i]) if node_values else '',
+				backend_node_id=backend_node_ids[i],
+				attributes={
+					string(attribute_indices[j]): string(attribute_indices[j + 1]) for j in range(0, len(attribute_indices), 2)
+				},
+				shadow_root_type=string(shadow_root_types[i]) if i in shadow_root_types else None,
+				is_clickable=i in clickable,
+				is_pseudo=i in pseudo,
+			)
+			if parent_index >= 0:
+				node.parent = parsed[parent_index]
+				node.parent.children.append(node)
+			parsed.append(node)
+
+		# Bounds are relative to the document, make them relative to the viewport like getBoundingClientRect
+		layout = document['layout']
+		scroll_x = document.get('scrollOffsetX', 0)
+		scroll_y = document.get('scrollOffsetY', 0)
+		offset_rects = layout.get('offsetRects') or []
+		paint_orders = layout.get('paintOrders') or []
+		for j, node_index in enumerate(layout['nodeIndex']):
+			node = parsed[node_index]
+			if node.bounds is not None:
+				continue
+			x, y, width, height = layout['bounds'][j]
+			node.bounds = SnapshotRect(x - scroll_x, y - scroll_y, width, height)
+			if j < len(offset_rects) and offset_rects[j]:
+				node.offset_width, node.offset_height = offset_rects[j][2], offset_rects[j][3]
+			node.paint_order = paint_orders[j] if j < len(paint_orders) else j
+			node.styles = {name: string(index) for name, index in zip(SNAPSHOT_COMPUTED_STYLES, layout['styles'][j])}
+
+		documents.append(parsed)
+		content_documents.append(_rare_values(nodes.get('contentDocumentIndex')))
+
+	for parsed, iframes in zip(documents, content_documents):
+		for node_index, document_index in iframes.items():
+			parsed[node_index].content_document = documents[document_index][0]
+
+	return documents
+
+
+def get_interactive_backend_node_ids(ax_nodes: list[dict]) -> set[int]:
+	"""
+	Backend node ids of the interactive nodes of an Accessibility.getFullAXTree result: nodes with a control role,
+	focusable nodes that are not containers and nodes with interactive states. Ignored (e.g. aria-hidden) and
+	disabled nodes are not interactive.
+	"""
+	interactive = set()
+	for ax_node in ax_nodes:
+		backend_node_id = ax_node.get('backendDOMNodeId')
+		if backend_node_id is None or ax_node.get('ignored'):
+			continue
+
+		properties = {prop['name']: prop.get('value', {}).get('value') for prop in ax_node.get('properties', [])}
+		if properties.get('disabled'):
+			continue
+
+		role = (ax_node.get('role') or {}).get('value')
+		if (
+			role in AX_INTERACTIVE_ROLES
+			or (properties.get('focusable') and role not in AX_CONTAINER_ROLES)
+			or any(name in properties for name in AX_INTERACTIVE_PROPERTIES)
+		):
+			interactive.add(backend_node_id)
+	return interactive
+
+
+class SnapshotTreeBuilder:
+	"""
+	Walks the snapshot of a page like buildDomTree.js walks the DOM and produces the same node map.
+	Layout queries are answered from the snapshot, elementFromPoint by a paint order hit test.
+
+	With accessible_nodes, the interactive nodes of each document come from its accessibility tree instead of
+	the heuristics of isInteractiveElement. Documents without an accessibility tree (None) use the heuristics.
+	"""
+
+	def __init__(
+		self,
+		documents: list[list[SnapshotNode]],
+		viewport_width: float,
+		viewport_height: float,
+		viewport_expansion: int,
+		accessible_nodes: Optional[list[Optional[set[int]]]] = None,
+	):
+		self.documents = documents
+		self.viewport_width = viewport_width
+		self.viewport_height = viewport_height
+		self.viewport_expansion = viewport_expansion
+		self.accessible_nodes = accessible_nodes
+
+		self.node_map: dict[str, dict] = {}
+		# (highlight index, node, rect relative to the top viewport) of every interactive element
+		self.highlights: list[tuple[int, SnapshotNode, SnapshotRect]] = []
+		# Iframe element of every document index but the top one
+		self.frame_hosts: dict[int, SnapshotNode] = {}
+		self._highlight_index = 0
+		self._hit_test_grid: Optional[dict[tuple[int, int], list[tuple[int, int, SnapshotNode]]]] = None
+
+	def build(self) -> dict:
+		body = self._find_body(self.documents[0][0])
+		if body is None:
+			raise ValueError('The snapshot has no body element')
+		return {'rootId': self._build(body), 'map': self.node_map}
+
+	def _find_body(self, document: SnapshotNode) -> Optional[SnapshotNode]:
+		for html in document.child_nodes:
+			if html.node_type == ELEMENT_NODE and html.tag_name == 'html':
+				for body in html.child_nodes:
+					if body.node_type == ELEMENT_NODE and body.tag_name == 'body':
+						return body
+		return None
+
+	def _build(self, body: SnapshotNode) -> str:
+		"""Iterative version of buildDomTree, every stack entry is (node, xpath, state of its subtree, child ids of the parent)"""
+		root_data = {'tagName': 'body', 'attributes': {}, 'xpath': '/body', 'children': []}
+		stack = []
+		self._push_children(stack, body.child_nodes, self._get_xpath_tree(body), (0.0, 0.0, False), root_data['children'])
+
+		while stack:
+			entry = stack.pop()
+			if entry[0] == 'exit':
+				_, node_data, parent_children = entry
+				# Skip empty anchor tags
+				if node_data['tagName'] == 'a' and not node_data['children'] and not node_data['attributes'].get('href'):
+					continue
+				parent_children.append(self._add(node_data))
+				continue
+
+			_, node, xpath, state, parent_children = entry
+			if node.node_type == TEXT_NODE:
+				node_data = self._build_text_node(node, state)
+				if node_data is not None:
+					parent_children.append(self._add(node_data))
+				continue
+
+			self._build_element(stack, node, xpath, state, parent_children)
+
+		return self._add(root_data)
+
+	def _add(self, node_data: dict) -> str:
+		node_id = str(len(self.node_map))
+		self.node_map[node_id] = node_data
+		return node_id
+
+	def _push_children(
+		self,
+		stack: list,
+		child_nodes: list[SnapshotNode],
+		parent_xpath: str,
+		state: tuple[float, float, bool],
+		parent_children: list[str],
+		is_shadow_boundary: bool = False,
+	) -> None:
+		"""Push the children in reverse, so they are processed in document order, with their XPaths built top-down"""
+		entries = []
+		tag_counts: dict[str, int] = {}
+		for child in child_nodes:
+			xpath = ''
+			if child.node_type == ELEMENT_NODE:
+				count = tag_counts.get(child.node_name, 0) + 1
+				tag_counts[child.node_name] = count
+				if not is_shadow_boundary:
+					segment = f'{child.tag_name}[{count}]' if count > 1 else child.tag_name
+					xpath = f'{parent_xpath}/{segment}' if parent_xpath else segment
+			entries.append(('enter', child, xpath, state, parent_children))
+		stack.extend(reversed(entries))
+
+	def _get_xpath_tree(self, element: SnapshotNode) -> str:
+		"""Bottom-up XPath like getXPathTree, only used for the root"""
+		segments = []
+		current: Optional[SnapshotNode] = element
+		while current is not None and current.node_type == ELEMENT_NODE:
+			parent = current.parent
+			if parent is not None and parent.node_type == DOCUMENT_FRAGMENT_NODE and current.document_index == 0:
+				break
+			index = 0
+			if parent is not None:
+				for sibling in parent.child_nodes:
+					if sibling is current:
+						break
+					if sibling.node_type == ELEMENT_NODE and sibling.node_name == current.node_name:
+						index += 1
+			segments.append(f'{current.tag_name}[{index + 1}]' if index > 0 else current.tag_name)
+			current = parent
+		return '/'.join(reversed(segments))
+
+	def _build_text_node(self, node: SnapshotNode, state: tuple[float, float, bool]) -> Optional[dict]:
+		text = node.node_value.strip()
+		if not text:
+			return None
+		parent = node.parent_element
+		if parent is None or parent.tag_name == 'script':
+			return None
+		return {'type': 'TEXT_NODE', 'text': text, 'isVisible': self._is_text_node_visible(node, parent, state[2])}
+
+	def _build_element(
+		self,
+		stack: list,
+		node: SnapshotNode,
+		xpath: str,
+		state: tuple[float, float, bool],
+		parent_children: list[str],
+	) -> None:
+		if node.node_type != ELEMENT_NODE or node.attributes.get('id') == HIGHLIGHT_CONTAINER_ID:
+			return
+
+		tag_name = node.tag_name
+		if tag_name not in ALWAYS_ACCEPTED_TAGS and tag_name in LEAF_ELEMENT_DENY_LIST:
+			return
+
+		rect = node.bounds or SnapshotRect(0, 0, 0, 0)
+		# Early viewport check - only filter out elements clearly outside viewport
+		if self.viewport_expansion != -1:
+			is_fixed_or_sticky = node.styles.get('position') in ('fixed', 'sticky')
+			has_size = node.offset_width > 0 or node.offset_height > 0
+			if not is_fixed_or_sticky and not has_size and not self._is_in_expanded_viewport(rect):
+				return
+
+		node_data: dict = {'tagName': tag_name, 'attributes': {}, 'xpath': xpath, 'children': []}
+		interactive_nodes = self._get_interactive_nodes(node)
+		if interactive_nodes is None:
+			is_candidate = self._is_interactive_candidate(node)
+		else:
+			# The accessibility tree has no click listeners, the snapshot does
+			is_candidate = node.backend_node_id in interactive_nodes or node.is_clickable
+		if is_candidate or tag_name in ('iframe', 'body'):
+			node_data['attributes'] = dict(node.attributes)
+		node_data['backendNodeId'] = node.backend_node_id
+
+		node_data['isVisible'] = self._is_element_visible(node)
+		if node_data['isVisible']:
+			node_data['isTopElement'] = self._is_top_element(node, rect)
+			if node_data['isTopElement']:
+				node_data['isInteractive'] = self._is_interactive_element(node) if interactive_nodes is None else is_candidate
+				if node_data['isInteractive']:
+					node_data['isInViewport'] = True
+					node_data['highlightIndex'] = self._highlight_index
+					offset_x, offset_y, _ = state
+					self.highlights.append(
+						(
+							self._highlight_index,
+							node,
+							SnapshotRect(rect.x + offset_x, rect.y + offset_y, rect.width, rect.height),
+						)
+					)
+					self._highlight_index += 1
+
+		stack.append(('exit', node_data, parent_children))
+
+		offset_x, offset_y, is_transparent = state
+		child_state = (offset_x, offset_y, is_transparent or node.styles.get('opacity') == '0')
+		if tag_name == 'iframe':
+			if node.content_document is not None:
+				self.frame_hosts[node.content_document.document_index] = node
+				# Nodes of the frame are relative to its viewport
+				iframe_state = (offset_x + rect.x, offset_y + rect.y, False)
+				self._push_children(stack, node.content_document.child_nodes, '', iframe_state, node_data['children'])
+		elif self._is_content_editable(node):
+			self._push_children(stack, node.child_nodes, xpath, child_state, node_data['children'])
+		elif (shadow_root := node.shadow_root) is not None:
+			node_data['shadowRoot'] = True
+			# Like the instanceof ShadowRoot check in buildDomTree.js, only the top document stops XPaths at shadow roots
+			self._push_children(
+				stack,
+				shadow_root.child_nodes,
+				'',
+				child_state,
+				node_data['children'],
+				is_shadow_boundary=node.document_index == 0,
+			)
+		else:
+			self._push_children(stack, node.child_nodes, xpath, child_state, node_data['children'])
+
+	def _get_interactive_nodes(self, node: SnapshotNode) -> Optional[set[int]]:
+		if self.accessible_nodes is None:
+			return None
+		return self.accessible_nodes[node.document_index]
+
+	# region - Checks of buildDomTree.js
+	def _is_in_expanded_viewport(self, rect: SnapshotRect) -> bool:
+		expansion = self.viewport_expansion
+		return not (
+			rect.bottom < -expansion
+			or rect.y > self.viewport_height + expansion
+			or rect.right < -expansion
+			or rect.x > self.viewport_width + expansion
+		)
+
+	def _is_text_node_visible(self, node: SnapshotNode, parent: SnapshotNode, is_transparent: bool) -> bool:
+		rect = node.bounds
+		if rect is None or rect.width == 0 or rect.height == 0:
+			return False
+		# Like buildDomTree.js, the viewport check also applies the expansion when it is -1
+		if not self._is_in_expanded_viewport(rect):
+			return False
+		# checkVisibility with checkOpacity and checkVisibilityCSS on the parent
+		return (
+			parent.bounds is not None
+			and parent.styles.get('visibility') != 'hidden'
+			and parent.styles.get('opacity') != '0'
+			and not is_transparent
+		)
+
+	def _is_element_visible(self, node: SnapshotNode) -> bool:
+		return (
+			node.offset_width > 0
+			and node.offset_height > 0
+			and node.styles.get('visibility') != 'hidden'
+			and node.styles.get('display') != 'none'
+		)
+
+	def _is_interactive_candidate(self, node: SnapshotNode) -> bool:
+		return node.tag_name in INTERACTIVE_CANDIDATE_TAGS or any(
+			name in node.attributes for name in INTERACTIVE_CANDIDATE_ATTRIBUTES
+		)
+
+	def _is_content_editable(self, node: SnapshotNode) -> bool:
+		"""element.isContentEditable, contenteditable is inherited until an ancestor sets it to false"""
+		if node.attributes.get('id') == 'tinymce' or 'mce-content-body' in node.class_list:
+			return True
+		if node.tag_name == 'body' and node.attributes.get('data-id', '').startswith('mce_'):
+			return True
+		current: Optional[SnapshotNode] = node
+		while current is not None and current.node_type == ELEMENT_NODE:
+			value = current.attributes.get('contenteditable')
+			if value is not None:
+				return value.lower() in ('', 'true', 'plaintext-only')
+			current = current.parent
+		return False
+
+	def _closest(self, node: SnapshotNode, predicate) -> bool:
+		"""element.closest, does not cross shadow roots or documents"""
+		current: Optional[SnapshotNode] = node
+		while current is not None and current.node_type == ELEMENT_NODE:
+			if predicate(current):
+				return True
+			current = current.parent
+		return False
+
+	def _is_interactive_element(self, node: SnapshotNode) -> bool:
+		tag_name = node.tag_name
+		attributes = node.attributes
+		class_list = node.class_list
+		element_id = attributes.get('id', '')
+		aria_label = attributes.get('aria-label', '').lower()
+		role = attributes.get('role')
+		# The snapshot knows about click listeners, which covers the onclick property checks of the script
+		has_onclick = node.is_clickable or 'onclick' in attributes
+
+		def in_onetrust_banner(element: SnapshotNode) -> bool:
+			return (
+				'onetrust' in element.attributes.get('id', '')
+				or 'onetrust' in element.attributes.get('class', '')
+				or element.attributes.get('data-nosnippet') == 'true'
+				or 'cookie' in element.attributes.get('aria-label', '')
+			)
+
+		if self._closest(node, in_onetrust_banner):
+			if (
+				tag_name == 'button'
+				or role == 'button'
+				or has_onclick
+				or any(name in class_list for name in ('ot-sdk-button', 'accept-button', 'reject-button'))
+				or 'accept' in aria_label
+				or 'reject' in aria_label
+			):
+				return True
+
+		if (
+			'dropdown-toggle' in class_list
+			or attributes.get('data-toggle') == 'dropdown'
+			or attributes.get('aria-haspopup') == 'true'
+		):
+			return True
+
+		parent = node.parent_element
+		tab_index = attributes.get('tabindex')
+		has_interactive_role = (
+			any(name in class_list for name in ('address-input__container__input', 'nav-btn', 'pull-left'))
+			or tag_name in INTERACTIVE_TAGS
+			or role in INTERACTIVE_ROLES
+			or attributes.get('aria-role') in INTERACTIVE_ROLES
+			or (tab_index is not None and tab_index != '-1' and (parent is None or parent.tag_name != 'body'))
+			or attributes.get('data-action') in ('a-dropdown-select', 'a-dropdown-button')
+		)
+		if has_interactive_role:
+			return True
+
+		element_id_lower = element_id.lower()
+		is_cookie_banner = (
+			'cookie' in element_id_lower
+			or 'consent' in element_id_lower
+			or 'notice' in element_id_lower
+			or any(name in class_list for name in ('otCenterRounded', 'ot-sdk-container'))
+			or attributes.get('data-nosnippet') == 'true'
+			or 'cookie' in aria_label
+			or 'consent' in aria_label
+			or (
+				tag_name == 'div'
+				and ('onetrust' in element_id or any(name in class_list for name in ('onetrust', 'cookie', 'consent')))
+			)
+		)
+		if is_cookie_banner:
+			return True
+
+		def in_cookie_banner(element: SnapshotNode) -> bool:
+			element_attributes = element.attributes
+			return any(
+				word in element_attributes.get('id', '') or word in element_attributes.get('class', '')
+				for word in ('cookie', 'consent')
+			) or 'onetrust' in element_attributes.get('id', '')
+
+		if self._closest(node, in_cookie_banner) and (
+			tag_name == 'button' or role == 'button' or 'button' in class_list or has_onclick
+		):
+			return True
+
+		has_click_handler = has_onclick or any(name in attributes for name in CLICK_HANDLER_ATTRIBUTES)
+		has_aria_props = any(name in attributes for name in ARIA_STATE_ATTRIBUTES)
+		# element.draggable is true for images and links by default
+		draggable = attributes.get('draggable')
+		is_draggable = draggable == 'true' or (
+			draggable != 'false' and (tag_name == 'img' or (tag_name == 'a' and 'href' in attributes))
+		)
+
+		return has_aria_props or has_click_handler or is_draggable or self._is_content_editable(node)
+
+	def _is_top_element(self, node: SnapshotNode, rect: SnapshotRect) -> bool:
+		is_in_viewport = rect.x < self.viewport_width and rect.right > 0 and rect.y < self.viewport_height and rect.bottom > 0
+		# Elements outside the viewport and elements in iframes are considered top
+		if not is_in_viewport or node.document_index != 0:
+			return True
+
+		hit = self._element_from_point(rect.x + rect.width / 2, rect.y + rect.height / 2)
+		current = hit
+		while current is not None:
+			if current is node:
+				return True
+			current = current.parent
+		return False
+
+	def _element_from_point(self, x: float, y: float) -> Optional[SnapshotNode]:
+		"""The node painted last at a point of the top document, text hits resolve to their parent element"""
+		if self._hit_test_grid is None:
+			self._hit_test_grid = self._build_hit_test_grid()
+
+		best = None
+		for paint_order, order, node in self._hit_test_grid.get((int(x // HIT_TEST_CELL_SIZE), int(y // HIT_TEST_CELL_SIZE)), ()):
+			if (best is None or (paint_order, order) > best[:2]) and node.bounds is not None and node.bounds.contains(x, y):
+				best = (paint_order, order, node)
+		if best is None:
+			return None
+		node = best[2]
+		return node.parent if node.node_type == TEXT_NODE else node
+
+	def _build_hit_test_grid(self) -> dict[tuple[int, int], list[tuple[int, int, SnapshotNode]]]:
+		"""
+		Bucket the hit testable boxes of the top document that intersect the viewport into grid cells.
+		Boxes are clipped by ancestors with overflow other than visible, absolute and fixed boxes escape the clip.
+		"""
+		grid: dict[tuple[int, int], list[tuple[int, int, SnapshotNode]]] = {}
+		viewport = SnapshotRect(0, 0, self.viewport_width, self.viewport_height)
+		clips: dict[int, SnapshotRect] = {}
+
+		for order, node in enumerate(self.documents[0]):
+			parent = node.parent
+			clip = clips.get(id(parent), viewport) if parent is not None else viewport
+			if node.styles.get('position') in ('absolute', 'fixed'):
+				clip = viewport
+			if node.bounds is not None and node.node_type == ELEMENT_NODE:
+				if node.styles.get('overflow-x', 'visible') != 'visible' or node.styles.get('overflow-y', 'visible') != 'visible':
+					clips[id(node)] = clip.intersection(node.bounds)
+				else:
+					clips[id(node)] = clip
+			elif node.bounds is None:
+				clips[id(node)] = clip
+
+			if node.bounds is None or node.styles.get('pointer-events') == 'none' or node.styles.get('visibility') == 'hidden':
+				continue
+			box = clip.intersection(node.bounds)
+			if box.width <= 0 or box.height <= 0:
+				continue
+			for cell_x in range(int(box.x // HIT_TEST_CELL_SIZE), int((box.right - 1e-6) // HIT_TEST_CELL_SIZE) + 1):
+				for cell_y in range(int(box.y // HIT_TEST_CELL_SIZE), int((box.bottom - 1e-6) // HIT_TEST_CELL_SIZE) + 1):
+					grid.setdefault((cell_x, cell_y), []).append((node.paint_order, order, node))
+		return grid
+
+	# endregion
+
+
+class DomSnapshotService:
+	"""Builds the node map of a page from a single DOMSnapshot.captureSnapshot call"""
+
+	def __init__(self, page: 'Page', script_version: str, injection_script: str):
+		self.page = page
+		# buildDomTree.js draws the highlights, registered by the injection script if the page does not have it yet
+		self.script_version = script_version
+		self.injection_script = injection_script
+		self._cdp_session: Optional['CDPSession'] = None
+
+	@time_execution_async('--capture_dom_snapshot')
+	async def get_node_map(
+		self, highlight_elements: bool, focus_element: int, viewport_expansion: int, accessibility: bool = False
+	) -> dict:
+		"""
+		Build the node map of the page. With accessibility, interactive elements are taken from the
+		accessibility tree of each frame instead of the DOM heuristics, fetched after the snapshot.
+		"""
+		if self._cdp_session is None:
+			self._cdp_session = await self.page.context.new_cdp_session(self.page)
+
+		viewport = await self.page.evaluate(PREPARE_SCRIPT)
+		snapshot = await self._cdp_session.send(
+			'DOMSnapshot.captureSnapshot',
+			{
+				'computedStyles': SNAPSHOT_COMPUTED_STYLES,
+				'includePaintOrder': True,
+				'includeDOMRects': True,
+			},
+		)
+
+		accessible_nodes = await self._get_accessible_nodes(snapshot) if accessibility else None
+		builder = SnapshotTreeBuilder(
+			parse_snapshot(snapshot), viewport['width'], viewport['height'], viewport_expansion, accessible_nodes
+		)
+		eval_page = builder.build()
+
+		if highlight_elements:
+			await self._render_highlights(builder, focus_element)
+
+		return eval_page
+
+	async def _render_highlights(self, builder: SnapshotTreeBuilder, focus_element: int) -> None:
+		"""
+		Draw the highlights with the renderer of buildDomTree.js. Elements of the top document are resolved, so the
+		overlay follows them on scroll and resize. Elements of iframes are drawn at their snapshot box in the viewport
+		of the frame, which follows the iframe element if that is in the top document.
+		"""
+		assert self._cdp_session is not None
+		session = self._cdp_session
+		document = builder.documents[0][0]
+		selected = [highlight for highlight in builder.highlights if focus_element < 0 or highlight[0] == focus_element]
+
+		hosts = {node.document_index: builder.frame_hosts.get(node.document_index) for _, node, _ in selected}
+		top_nodes = [node for _, node, _ in selected if node.document_index == 0]
+		top_nodes.extend(host for host in hosts.values() if host is not None and host.document_index == 0)
+
+		try:
+			object_ids = await self._resolve_nodes([document, *top_nodes])
+			if document.backend_node_id not in object_ids:
+				return
+
+			elements: list[str] = []
+			positions: dict[int, int] = {}
+
+			def argument(node: SnapshotNode) -> int:
+				"""Position of the node in the element arguments, -1 if it could not be resolved"""
+				object_id = object_ids.get(node.backend_node_id)
+				if object_id is None:
+					return -1
+				if node.backend_node_id not in positions:
+					positions[node.backend_node_id] = len(elements)
+					elements.append(object_id)
+				return positions[node.backend_node_id]
+
+			highlights = []
+			for index, node, rect in selected:
+				target = argument(node) if node.document_index == 0 else -1
+				host = hosts.get(node.document_index)
+				iframe = -1
+				if target < 0 and host is not None and host.document_index == 0 and node.bounds is not None:
+					iframe = argument(host)
+				box = node.bounds if iframe >= 0 and node.bounds is not None else rect
+				highlights.append([index, [box.x, box.y, box.width, box.height], target, iframe])
+
+			call = {
+				'functionDeclaration': RENDER_HIGHLIGHTS_CALL,
+				'objectId': object_ids[document.backend_node_id],
+				'arguments': [
+					{'value': self.script_version},
+					{'value': highlights},
+					*({'objectId': object_id} for object_id in elements),
+				],
+				'returnByValue': True,
+			}
+			result = await session.send('Runtime.callFunctionOn', call)
+			if not result['result'].get('value'):
+				logger.debug('buildDomTree.js %s is not registered in the page, injecting it', self.script_version)
+				await self.page.evaluate(self.injection_script)
+				await session.send('Runtime.callFunctionOn', call)
+		except Exception as e:
+			logger.debug('Failed to draw the highlights of the CDP snapshot: %s', e)
+		finally:
+			try:
+				await session.send('Runtime.releaseObjectGroup', {'objectGroup': HIGHLIGHT_OBJECT_GROUP})
+			except Exception as e:
+				logger.debug('Failed to release the highlighted elements: %s', e)
+
+	async def _resolve_nodes(self, nodes: list[SnapshotNode]) -> dict[int, str]:
+		"""Remote object ids of the nodes by backend node id, nodes that are gone are left out"""
+		assert self._cdp_session is not None
+		backend_node_ids = list(dict.fromkeys(node.backend_node_id for node in nodes))
+		results = await asyncio.gather(
+			*(
+				self._cdp_session.send(
+					'DOM.resolveNode', {'backendNodeId': backend_node_id, 'objectGroup': HIGHLIGHT_OBJECT_GROUP}
+				)
+				for backend_node_id in backend_node_ids
+			),
+			return_exceptions=True,
+		)
+		return {
+			backend_node_id: result['object']['objectId']
+			for backend_node_id, result in zip(backend_node_ids, results)
+			if not isinstance(result, BaseException)
+		}
+
+	async def _get_accessible_nodes(self, snapshot: dict) -> list[Optional[set[int]]]:
+		"""Interactive backend node ids of every snapshot document, fetched from the accessibility trees of their frames"""
+		assert self._cdp_session is not None
+		session = self._cdp_session
+		strings = snapshot['strings']
+
+		async def get_interactive_nodes(document: dict) -> Optional[set[int]]:
+			frame_id = document.get('frameId', -1)
+			params = {'frameId': strings[frame_id]} if frame_id >= 0 else {}
+			try:
+				result = await session.send('Accessibility.getFullAXTree', params)
+			except Exception as e:
+				# Out of process iframes are not part of the session
+				logger.debug('Failed to get the accessibility tree of frame %s: %s', params.get('frameId'), e)
+				return None
+			return get_interactive_backend_node_ids(result['nodes'])
+
+		return list(await asyncio.gather(*(get_interactive_nodes(document) for document in snapshot['documents'])))
@@ -0,0 +1,91 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+# Computed styles requested from DOMSnapshot.captureSnapshot, in this order
+SNAPSHOT_COMPUTED_STYLES = ['display', 'visibility', 'opacity', 'position', 'pointer-events', 'overflow-x', 'overflow-y']
+
+ELEMENT_NODE = 1
+TEXT_NODE = 3
+DOCUMENT_NODE = 9
+DOCUMENT_FRAGMENT_NODE = 11
+
+
+@dataclass(frozen=False, slots=True)
+class SnapshotRect:
+	"""Rectangle relative to the viewport of the document the node belongs to"""
+
+	x: float
+	y: float
+	width: float
+	height: float
+
+	@property
+	def right(self) -> float:
+		return self.x + self.width
+
+	@property
+	def bottom(self) -> float:
+		return self.y + self.height
+
+	def contains(self, x: float, y: float) -> bool:
+		return self.x <= x < self.right and self.y <= y < self.bottom
+
+	def intersection(self, other: 'SnapshotRect') -> 'SnapshotRect':
+		x = max(self.x, other.x)
+		y = max(self.y, other.y)
+		return SnapshotRect(x, y, max(0.0, min(self.right, other.right) - x), max(0.0, min(self.bottom, other.bottom) - y))
+
+
+@dataclass(frozen=False, slots=True)
+class SnapshotNode:
+	"""
+	A node of a DOMSnapshot.captureSnapshot document, decoded from the columnar node and layout tree arrays.
+	"""
+
+	document_index: int
+	node_type: int
+	node_name: str
+	node_value: str
+	backend_node_id: int
+	attributes: dict[str, str]
+	parent: Optional['SnapshotNode'] = None
+	children: list['SnapshotNode'] = field(default_factory=list)
+	# 'open', 'closed' or 'user-agent' for shadow roots
+	shadow_root_type: Optional[str] = None
+	# Root node of the document of an iframe
+	content_document: Optional['SnapshotNode'] = None
+	is_clickable: bool = False
+	is_pseudo: bool = False
+	# Layout, None if the node is not rendered
+	bounds: Optional[SnapshotRect] = None
+	offset_width: float = 0
+	offset_height: float = 0
+	paint_order: int = -1
+	styles: dict[str, str] = field(default_factory=dict)
+
+	@property
+	def tag_name(self) -> str:
+		return self.node_name.lower()
+
+	@property
+	def parent_element(self) -> Optional['SnapshotNode']:
+		if self.parent is not None and self.parent.node_type == ELEMENT_NODE:
+			return self.parent
+		return None
+
+	@property
+	def shadow_root(self) -> Optional['SnapshotNode']:
+		"""The open shadow root of the node, like element.shadowRoot"""
+		for child in self.children:
+			if child.shadow_root_type == 'open':
+				return child
+		return None
+
+	@property
+	def child_nodes(self) -> list['SnapshotNode']:
+		"""Light DOM children, like node.childNodes"""
+		return [child for child in self.children if child.shadow_root_type is None and not child.is_pseudo]
+
+	@property
+	def class_list(self) -> list[str]:
+		return self.attributes.get('class', '').split()
@@ -0,0 +1,181 @@
+"""
+Benchmark of DOMElementNode.clickable_elements_to_string against the previous recursive implementation.
+
+Run with: python -m browser_use.dom.tests.clickable_elements_benchmark
+"""
+
+import random
+import sys
+import time
+
+from browser_use.dom.views import DOMBaseNode, DOMElementNode, DOMTextNode
+
+INCLUDE_ATTRIBUTES = ['title', 'type', 'name', 'role', 'aria-label', 'placeholder', 'value', 'alt']
+
+
+def legacy_get_all_text_till_next_clickable_element(element: DOMElementNode, max_depth: int = -1) -> str:
+	text_parts = []
+
+	def collect_text(node: DOMBaseNode, current_depth: int) -> None:
+		if max_depth != -1 and current_depth > max_depth:
+			return
+
+		if isinstance(node, DOMElementNode) and node is not element and node.highlight_index is not None:
+			return
+
+		if isinstance(node, DOMTextNode):
+			text_parts.append(node.text)
+		elif isinstance(node, DOMElementNode):
+			for child in node.children:
+				collect_text(child, current_depth + 1)
+
+	collect_text(element, 0)
+	return '\n'.join(text_parts).strip()
+
+
+def legacy_clickable_elements_to_string(root: DOMElementNode, include_attributes: list[str] | None = None) -> str:
+	"""The recursive implementation, walking the subtree of every highlighted element and the ancestors of every text node"""
+	formatted_text = []
+
+	def process_node(node: DOMBaseNode, depth: int) -> None:
+		if isinstance(node, DOMElementNode):
+			if node.highlight_index is not None:
+				attributes_str = ''
+				text = legacy_get_all_text_till_next_clickable_element(node)
+				if include_attributes:
+					attributes = list(
+						set(
+							[
+								str(value)
+								for key, value in node.attributes.items()
+								if key in include_attributes and value != node.tag_name
+							]
+						)
+					)
+					if text in attributes:
+						attributes.remove(text)
+					attributes_str = ';'.join(attributes)
+				line = f'[{node.highlight_index}]<{node.tag_name} '
+				if attributes_str:
+					line += f'{attributes_str}'
+				if text:
+					if attributes_str:
+						line += f'>{text}'
+					else:
+						line += f'{text}'
+				line += '/>'
+				formatted_text.append(line)
+
+			for child in node.children:
+				process_node(child, depth + 1)
+
+		elif isinstance(node, DOMTextNode):
+			if not node.has_parent_with_highlight_index() and node.is_visible:
+				formatted_text.append(f'{node.text}')
+
+	process_node(root, 0)
+	return '\n'.join(formatted_text)
+
+
+class TreeBuilder:
+	def __init__(self, seed: int = 0):
+		self.random = random.Random(seed)
+		self.highlight_index = 0
+		self.node_count = 0
+
+	def element(self, tag_name: str, parent: DOMElementNode | None, clickable: bool = False) -> DOMElementNode:
+		highlight_index = None
+		if clickable:
+			highlight_index = self.highlight_index
+			self.highlight_index += 1
+		node = DOMElementNode(
+			tag_name=tag_name,
+			xpath='',
+			attributes={'role': 'button', 'title': f'title {self.node_count}'} if clickable else {},
+			children=[],
+			is_visible=True,
+			parent=parent,
+			highlight_index=highlight_index,
+		)
+		if parent is not None:
+			parent.children.append(node)
+		self.node_count += 1
+		return node
+
+	def text(self, value: str, parent: DOMElementNode) -> DOMTextNode:
+		node = DOMTextNode(text=value, is_visible=self.random.random() > 0.1, parent=parent)
+		parent.children.append(node)
+		self.node_count += 1
+		return node
+
+	def wide_tree(self, sections: int, items: int) -> DOMElementNode:
+		"""Text heavy page: many sections with clickable cards containing nested text"""
+		root = self.element('body', None)
+		for section_index in range(sections):
+			section = self.element('section', root, clickable=section_index % 5 == 0)
+			self.text(f'Section {section_index}', section)
+			for item_index in range(items):
+				card = self.element('div', section, clickable=self.random.random() < 0.3)
+				for paragraph_index in range(3):
+					paragraph = self.element('p', card)
+					self.text(f'Paragraph {section_index}.{item_index}.{paragraph_index}', paragraph)
+					if self.random.random() < 0.2:
+						link = self.element('a', paragraph, clickable=True)
+						self.text('Read more', link)
+		return root
+
+	def deep_tree(self, depth: int, clickable_every: int) -> DOMElementNode:
+		"""Deeply nested wrappers with text at each level, every n-th level clickable (0 for none)"""
+		root = self.element('body', None)
+		current = root
+		for level in range(depth):
+			current = self.element('div', current, clickable=clickable_every > 0 and level % clickable_every == 0)
+			self.text(f'Level {level}', current)
+			for sibling_index in range(3):
+				self.text(f'Note {level}.{sibling_index}', self.element('span', current))
+		# A clickable leaf at the bottom pulls the text of every wrapper into the legacy ancestor walks
+		self.text('Submit', self.element('button', current, clickable=True))
+		return root
+
+
+def benchmark(name: str, root: DOMElementNode, node_count: int, repeat: int = 3) -> None:
+	timings = {}
+	outputs = {}
+	for label, serialize in (
+		('legacy', lambda: legacy_clickable_elements_to_string(root, INCLUDE_ATTRIBUTES)),
+		('single-pass', lambda: root.clickable_elements_to_string(INCLUDE_ATTRIBUTES)),
+	):
+		best = float('inf')
+		for _ in range(repeat):
+			start = time.perf_counter()
+			outputs[label] = serialize()
+			best = min(best, time.perf_counter() - start)
+		timings[label] = best
+
+	identical = outputs['legacy'] == outputs['single-pass']
+	print(
+		f'{name:<28} nodes={node_count:>7} legacy={timings["legacy"] * 1000:>9.1f}ms '
+		f'single-pass={timings["single-pass"] * 1000:>8.1f}ms speedup={timings["legacy"] / timings["single-pass"]:>6.1f}x '
+		f'identical={identical}'
+	)
+	if not identical:
+		raise AssertionError(f'{name}: serializer output differs from the legacy implementation')
+
+
+def main() -> None:
+	# The legacy implementation recurses once per level
+	sys.setrecursionlimit(20_000)
+
+	for sections, items in ((50, 20), (200, 50)):
+		builder = TreeBuilder()
+		root = builder.wide_tree(sections, items)
+		benchmark(f'wide {sections}x{items}', root, builder.node_count)
+
+	for depth, clickable_every in ((500, 10), (2000, 10), (2000, 0), (5000, 0)):
+		builder = TreeBuilder()
+		root = builder.deep_tree(depth, clickable_every)
+		benchmark(f'deep {depth} clickable/{clickable_every or "-"}', root, builder.node_count)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,115 @@
+"""
+Benchmark of the hit-test grid of isTopElement against hit-testing every element on its own.
+
+Builds dense synthetic pages (nested cards with links and buttons, a fixed header, a sticky sidebar and a modal
+covering part of the content), runs buildDomTree.js with and without the grid and compares the time, the number
+of hit tests and the resulting isTopElement flags.
+
+Run with: python -m browser_use.dom.tests.occlusion_benchmark
+
+The grid is off by default (hitTestGridSize 0) until this benchmark shows it faster in chromium. The only numbers so
+far are hit-test counts on a sparse test page in a fake DOM (30 and 300 rows of the page, 1280x1000 viewport), where
+the grid tests more points than it saves and decides the same flags:
+
+rows  per element  grid 24px  grid 48px  mismatches
+  30           14         28         25           0
+ 300            7         17         15           0
+"""
+
+import asyncio
+import time
+
+from playwright.async_api import Page, async_playwright
+
+from browser_use.dom.service import read_script
+
+GRID_SIZES = (0, 24, 48)
+
+
+def dense_page(columns: int, rows: int) -> str:
+	"""Cards of nested wrappers, each with a link, an icon button and a label, under fixed and sticky overlays"""
+	cards = []
+	for row in range(rows):
+		for column in range(columns):
+			index = row * columns + column
+			cards.append(
+				f'<div class="card"><div class="inner"><a href="/item/{index}"><span>Item {index}</span></a>'
+				f'<button aria-label="Like {index}"><i class="icon"></i></button>'
+				f'<span class="label" role="button" tabindex="0">Tag {index}</span></div></div>'
+			)
+	return f"""
+<!DOCTYPE html>
+<html>
+<head>
+<style>
+	body {{ margin: 0; font: 12px sans-serif; }}
+	header {{ position: fixed; top: 0; left: 0; right: 0; height: 48px; background: #eee; z-index: 10; }}
+	aside {{ position: sticky; top: 48px; float: left; width: 160px; height: 600px; background: #ddd; z-index: 5; }}
+	main {{ display: grid; grid-template-columns: repeat({columns}, 1fr); gap: 4px; padding: 52px 4px 4px 170px; }}
+	.card {{ border: 1px solid #ccc; padding: 4px; }}
+	.inner {{ display: flex; gap: 4px; align-items: center; }}
+	.icon {{ display: inline-block; width: 10px; height: 10px; background: #888; }}
+	.modal {{ position: fixed; top: 200px; left: 300px; width: 400px; height: 300px; background: white;
+		border: 1px solid black; z-index: 20; }}
+</style>
+</head>
+<body>
+<header><a href="/">Home</a> <button>Menu</button> <input placeholder="Search"></header>
+<aside>{''.join(f'<a href="/section/{i}">Section {i}</a><br>' for i in range(30))}</aside>
+<main>{''.join(cards)}</main>
+<div class="modal"><button>Accept</button> <button>Close</button></div>
+</body>
+</html>
+"""
+
+
+async def run(page: Page, js_code: str, grid_size: int, repeat: int) -> tuple[float, dict, dict[str, bool]]:
+	args = {
+		'doHighlightElements': False,
+		'focusHighlightIndex': -1,
+		'viewportExpansion': 0,
+		'debugMode': True,
+		'hitTestGridSize': grid_size,
+	}
+	best = float('inf')
+	result = {}
+	for _ in range(repeat):
+		start = time.perf_counter()
+		result = await page.evaluate(js_code, args)
+		best = min(best, time.perf_counter() - start)
+
+	top_elements = {
+		node['xpath']: bool(node.get('isTopElement'))
+		for node in result['map'].values()
+		if node.get('type') != 'TEXT_NODE' and node.get('isVisible')
+	}
+	return best, result['perfMetrics']['occlusionMetrics'], top_elements
+
+
+async def main() -> None:
+	js_code = read_script('buildDomTree.js')
+
+	async with async_playwright() as playwright:
+		browser = await playwright.chromium.launch(headless=True)
+		page = await browser.new_page(viewport={'width': 1280, 'height': 1000})
+
+		for columns, rows in ((6, 40), (12, 80), (24, 160)):
+			await page.set_content(dense_page(columns, rows))
+			results = {grid_size: await run(page, js_code, grid_size, repeat=5) for grid_size in GRID_SIZES}
+
+			baseline_time, _, baseline_top = results[0]
+			for grid_size, (duration, metrics, top_elements) in results.items():
+				hit_tests = metrics['sampledPoints'] + metrics['preciseChecks']
+				mismatches = sum(1 for xpath, is_top in top_elements.items() if baseline_top.get(xpath) != is_top)
+				label = f'grid {grid_size}px' if grid_size else 'per element'
+				print(
+					f'cards={columns * rows:>5} {label:<12} time={duration * 1000:>8.1f}ms '
+					f'speedup={baseline_time / duration:>5.2f}x hit_tests={hit_tests:>6} '
+					f'ambiguous={metrics["ambiguousElements"]:>5} mismatches={mismatches}/{len(top_elements)}'
+				)
+
+		await browser.close()
+
+
+if __name__ == '__main__':
+	asyncio.run(main())
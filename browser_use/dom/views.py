@@ -1,8 +1,7 @@
-from dataclasses import dataclass
-from functools import cached_property
+from dataclasses import dataclass, field
 from typing import TYPE_CHECKING, Dict, List, Optional
 
-from browser_use.dom.history_tree_processor.view import CoordinateSet, HashedDomElement, ViewportInfo
+from browser_use.dom.history_tree_processor.view import CoordinateSet, DOMElementIndex, HashedDomElement, ViewportInfo
 from browser_use.utils import time_execution_sync
 
 # Avoid circular import issues
@@ -10,14 +9,14 @@ if TYPE_CHECKING:
 	from .views import DOMElementNode
 
 
-@dataclass(frozen=False)
+@dataclass(frozen=False, slots=True)
 class DOMBaseNode:
 	is_visible: bool
 	# Use None as default and set parent later to avoid circular reference issues
 	parent: Optional['DOMElementNode']
 
 
-@dataclass(frozen=False)
+@dataclass(frozen=False, slots=True)
 class DOMTextNode(DOMBaseNode):
 	text: str
 	type: str = 'TEXT_NODE'
@@ -43,7 +42,7 @@ class DOMTextNode(DOMBaseNode):
 		return self.parent.is_top_element
 
 
-@dataclass(frozen=False)
+@dataclass(frozen=False, slots=True)
 class DOMElementNode(DOMBaseNode):
 	"""
 	xpath: the xpath of the element from the last root node (shadow root or iframe OR document if no shadow root or iframe).
@@ -62,6 +61,14 @@ class DOMElementNode(DOMBaseNode):
 	viewport_coordinates: Optional[CoordinateSet] = None
 	page_coordinates: Optional[CoordinateSet] = None
 	viewport_info: Optional[ViewportInfo] = None
+	# Set by the CDP snapshot engine
+	backend_node_id: Optional[int] = None
+	# Identity of the element in the page, the same in every state for as long as the element is alive
+	element_id: Optional[str] = None
+	# Lazily computed by `hash`, a slot instead of a cached_property keeps the node free of a __dict__
+	_hash: Optional[HashedDomElement] = field(default=None, init=False, repr=False, compare=False)
+	# Rolling hash of the tag path to the element, memoized so descendants extend it instead of walking to the root
+	_branch_path_hash: Optional[str] = field(default=None, init=False, repr=False, compare=False)
 
 	def __repr__(self) -> str:
 		tag_str = f'<{self.tag_name}'
@@ -89,32 +96,34 @@ class DOMElementNode(DOMBaseNode):
 
 		return tag_str
 
-	@cached_property
+	@property
 	def hash(self) -> HashedDomElement:
-		from browser_use.dom.history_tree_processor.service import (
-			HistoryTreeProcessor,
-		)
+		if self._hash is None:
+			from browser_use.dom.history_tree_processor.service import (
+				HistoryTreeProcessor,
+			)
 
-		return HistoryTreeProcessor._hash_dom_element(self)
+			self._hash = HistoryTreeProcessor._hash_dom_element(self)
+		return self._hash
 
 	def get_all_text_till_next_clickable_element(self, max_depth: int = -1) -> str:
 		text_parts = []
+		stack: list[tuple[DOMBaseNode, int]] = [(self, 0)]
 
-		def collect_text(node: DOMBaseNode, current_depth: int) -> None:
+		while stack:
+			node, current_depth = stack.pop()
 			if max_depth != -1 and current_depth > max_depth:
-				return
+				continue
 
 			# Skip this branch if we hit a highlighted element (except for the current node)
-			if isinstance(node, DOMElementNode) and node != self and node.highlight_index is not None:
-				return
+			if isinstance(node, DOMElementNode) and node is not self and node.highlight_index is not None:
+				continue
 
 			if isinstance(node, DOMTextNode):
 				text_parts.append(node.text)
 			elif isinstance(node, DOMElementNode):
-				for child in node.children:
-					collect_text(child, current_depth + 1)
+				stack.extend((child, current_depth + 1) for child in reversed(node.children))
 
-		collect_text(self, 0)
 		return '\n'.join(text_parts).strip()
 
 	@time_execution_sync('--clickable_elements_to_string')
@@ -122,46 +131,66 @@ class DOMElementNode(DOMBaseNode):
 		"""Convert the processed DOM content to HTML."""
 		formatted_text = []
 
-		def process_node(node: DOMBaseNode, depth: int) -> None:
+		def format_element(node: DOMElementNode, text: str) -> str:
+			attributes_str = ''
+			if include_attributes:
+				attributes = list(
+					set(
+						[
+							str(value)
+							for key, value in node.attributes.items()
+							if key in include_attributes and value != node.tag_name
+						]
+					)
+				)
+				if text in attributes:
+					attributes.remove(text)
+				attributes_str = ';'.join(attributes)
+			line = f'[{node.highlight_index}]<{node.tag_name} '
+			if attributes_str:
+				line += f'{attributes_str}'
+			if text:
+				if attributes_str:
+					line += f'>{text}'
+				else:
+					line += f'{text}'
+			line += '/>'
+			return line
+
+		# Text nodes below a highlighted element belong to that element's line instead of being listed on their own
+		has_highlighted_ancestor = False
+		current = self.parent
+		while current is not None:
+			if current.highlight_index is not None:
+				has_highlighted_ancestor = True
+				break
+			current = current.parent
+
+		# Single DFS with an explicit stack: every node carries the text parts of its nearest highlighted
+		# ancestor (or None), and highlighted elements reserve their line until their subtree is walked
+		highlighted_lines: list[tuple[int, DOMElementNode, list[str]]] = []
+		stack: list[tuple[DOMBaseNode, Optional[list[str]]]] = [(self, None)]
+
+		while stack:
+			node, text_parts = stack.pop()
 			if isinstance(node, DOMElementNode):
-				# Add element with highlight_index
 				if node.highlight_index is not None:
-					attributes_str = ''
-					text = node.get_all_text_till_next_clickable_element()
-					if include_attributes:
-						attributes = list(
-							set(
-								[
-									str(value)
-									for key, value in node.attributes.items()
-									if key in include_attributes and value != node.tag_name
-								]
-							)
-						)
-						if text in attributes:
-							attributes.remove(text)
-						attributes_str = ';'.join(attributes)
-					line = f'[{node.highlight_index}]<{node.tag_name} '
-					if attributes_str:
-						line += f'{attributes_str}'
-					if text:
-						if attributes_str:
-							line += f'>{text}'
-						else:
-							line += f'{text}'
-					line += '/>'
-					formatted_text.append(line)
-
-				# Process children regardless
-				for child in node.children:
-					process_node(child, depth + 1)
+					text_parts = []
+					highlighted_lines.append((len(formatted_text), node, text_parts))
+					formatted_text.append('')
+
+				stack.extend([(child, text_parts) for child in reversed(node.children)])
 
 			elif isinstance(node, DOMTextNode):
+				if text_parts is not None:
+					text_parts.append(node.text)
 				# Add text only if it doesn't have a highlighted parent
-				if not node.has_parent_with_highlight_index() and node.is_visible:  # and node.is_parent_top_element()
+				elif not has_highlighted_ancestor and node.is_visible:
 					formatted_text.append(f'{node.text}')
 
-		process_node(self, 0)
+		for position, node, text_parts in highlighted_lines:
+			formatted_text[position] = format_element(node, '\n'.join(text_parts).strip())
+
 		return '\n'.join(formatted_text)
 
 	def get_file_upload_element(self, check_siblings: bool = True) -> Optional['DOMElementNode']:
@@ -194,3 +223,31 @@ SelectorMap = dict[int, DOMElementNode]
 class DOMState:
 	element_tree: DOMElementNode
 	selector_map: SelectorMap
+	# The DOM walk ran out of its node or time budget, the tree only covers part of the page
+	truncated: bool = field(default=False, kw_only=True)
+	# Id of the in-page registry that maps the highlight indices of this state to their elements
+	registry_id: Optional[str] = field(default=None, kw_only=True)
+	# Lazily built by `element_index`
+	_element_index: Optional[DOMElementIndex] = field(default=None, init=False, repr=False, compare=False)
+
+	@property
+	def element_index(self) -> DOMElementIndex:
+		"""Index of the highlighted elements used to find history elements, built once per state"""
+		if self._element_index is None:
+			from browser_use.dom.history_tree_processor.service import HistoryTreeProcessor
+
+			self._element_index = HistoryTreeProcessor.build_element_index(self.selector_map)
+		return self._element_index
+
+
+def get_index_remap(previous: SelectorMap, current: SelectorMap) -> dict[int, int]:
+	"""
+	Map the highlight indices of a previous state to the indices of the same elements in the current state,
+	matched by element id. Elements without an id or that are gone have no entry.
+	"""
+	current_indices = {element.element_id: index for index, element in current.items() if element.element_id is not None}
+	return {
+		index: current_indices[element.element_id]
+		for index, element in previous.items()
+		if element.element_id is not None and element.element_id in current_indices
+	}
@@ -0,0 +1,194 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from browser_use.browser.pool import CLEARED_STORAGE_TYPES, BrowserPool, BrowserPoolConfig, PooledBrowser, PooledContext
+
+
+class DummyPage:
+	def __init__(self, healthy=True):
+		self.healthy = healthy
+		self.closed = False
+
+	async def evaluate(self, script):
+		if not self.healthy:
+			raise RuntimeError('Target closed')
+		return 1
+
+	async def close(self):
+		self.closed = True
+
+
+class DummyPlaywrightContext:
+	def __init__(self):
+		self.pages = [DummyPage()]
+		self.clear_cookies = AsyncMock()
+		self.cdp_session = Mock(send=AsyncMock(), detach=AsyncMock())
+		self.new_cdp_session = AsyncMock(return_value=self.cdp_session)
+
+	async def new_page(self):
+		page = DummyPage()
+		self.pages.append(page)
+		return page
+
+
+class DummyPool(BrowserPool):
+	"""
+	Browser pool creating dummy browsers and contexts instead of launching chromium.
+	"""
+
+	def __init__(self, config):
+		super().__init__(config)
+		self.created_contexts = []
+		# Number of upcoming context creations that fail
+		self.failing_creations = 0
+
+	async def _launch_browser(self):
+		browser = Mock()
+		browser.playwright_browser.is_connected.return_value = True
+		browser.close = AsyncMock()
+		return PooledBrowser(browser=browser)
+
+	async def _create_context(self, pooled_browser):
+		if self.failing_creations:
+			self.failing_creations -= 1
+			raise RuntimeError('Browser closed')
+		playwright_context = DummyPlaywrightContext()
+		browser_context = Mock()
+		browser_context.session.context = playwright_context
+		browser_context.get_session = AsyncMock(return_value=browser_context.session)
+		browser_context.get_current_page = AsyncMock(side_effect=lambda: playwright_context.pages[-1])
+		browser_context.close = AsyncMock()
+		browser_context._load_cookies = AsyncMock()
+		self.created_contexts.append(browser_context)
+		return PooledContext(context=browser_context, pooled_browser=pooled_browser)
+
+
+@pytest.mark.asyncio
+async def test_pool_warms_and_reuses_contexts():
+	"""
+	Test that the pool warms size * contexts_per_browser contexts up front and that a released
+	context is reset (fresh page, cookies reloaded) and leased again.
+	"""
+	pool = DummyPool(BrowserPoolConfig(size=2, contexts_per_browser=2))
+	await pool.start()
+	assert len(pool.created_contexts) == 4
+	assert pool._idle.qsize() == 4
+
+	async with pool.lease() as browser_context:
+		first = browser_context
+		old_page = browser_context.session.context.pages[0]
+		assert pool._idle.qsize() == 3
+
+	assert old_page.closed
+	first.session.context.clear_cookies.assert_awaited_once()
+	first._load_cookies.assert_awaited_once()
+	assert pool._idle.qsize() == 4
+
+	# Contexts are handed out in FIFO order, so the released one comes back last
+	leased = [await pool.acquire() for _ in range(4)]
+	assert leased[-1] is first
+	for browser_context in leased:
+		await pool.release(browser_context)
+
+	await pool.close()
+	assert all(browser_context.close.await_count == 1 for browser_context in pool.created_contexts)
+
+
+@pytest.mark.asyncio
+async def test_pool_recycles_context_after_max_uses():
+	"""
+	Test that a context is closed after max_context_uses leases and replaced by a fresh one.
+	"""
+	pool = DummyPool(BrowserPoolConfig(size=1, contexts_per_browser=1, max_context_uses=2))
+	await pool.start()
+	first = pool.created_contexts[0]
+
+	for _ in range(2):
+		async with pool.lease() as browser_context:
+			assert browser_context is first
+
+	first.close.assert_awaited_once()
+	async with pool.lease() as browser_context:
+		assert browser_context is pool.created_contexts[1]
+
+	await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_replaces_unhealthy_context():
+	"""
+	Test that a context failing the health check is not leased but replaced.
+	"""
+	pool = DummyPool(BrowserPoolConfig(size=1, contexts_per_browser=1))
+	await pool.start()
+	broken = pool.created_contexts[0]
+	broken.session.context.pages[-1].healthy = False
+
+	browser_context = await asyncio.wait_for(pool.acquire(), timeout=1)
+	assert browser_context is not broken
+	broken.close.assert_awaited_once()
+
+	await pool.release(browser_context)
+	with pytest.raises(ValueError):
+		await pool.release(browser_context)
+
+	await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_clears_storage_of_loaded_origins():
+	"""
+	Test that a released context clears the storage of the origins of its documents over CDP,
+	and that a context whose storage cannot be cleared is replaced.
+	"""
+	pool = DummyPool(BrowserPoolConfig(size=1, contexts_per_browser=1))
+	await pool.start()
+
+	async with pool.lease() as browser_context:
+		pooled = pool._leased[browser_context]
+		pool._record_origin(pooled, 'https://example.com/login?next=/', 'document')
+		pool._record_origin(pooled, 'https://cdn.example.com/logo.png', 'image')
+		pool._record_origin(pooled, 'about:blank', 'document')
+
+	cdp_session = browser_context.session.context.cdp_session
+	cdp_session.send.assert_awaited_once_with(
+		'Storage.clearDataForOrigin', {'origin': 'https://example.com', 'storageTypes': CLEARED_STORAGE_TYPES}
+	)
+	cdp_session.detach.assert_awaited_once()
+	assert pooled.origins == set()
+
+	async with pool.lease() as browser_context:
+		pool._record_origin(pool._leased[browser_context], 'https://example.com/', 'document')
+		browser_context.session.context.new_cdp_session.side_effect = RuntimeError('CDP is only available in chromium')
+
+	browser_context.close.assert_awaited_once()
+	async with pool.lease() as replacement:
+		assert replacement is pool.created_contexts[1]
+
+	await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_retries_replenish_and_fails_acquire_when_empty():
+	"""
+	Test that a failed replacement of a context is retried, and that acquire raises instead of waiting
+	forever once all retries failed and no context is left.
+	"""
+	pool = DummyPool(BrowserPoolConfig(size=1, contexts_per_browser=1, max_context_uses=1, replenish_backoff=0))
+	await pool.start()
+
+	pool.failing_creations = 1
+	async with pool.lease():
+		pass
+	async with asyncio.timeout(1):
+		async with pool.lease() as browser_context:
+			assert browser_context is pool.created_contexts[1]
+
+	pool.failing_creations = 3
+	with pytest.raises(RuntimeError, match='no contexts left'):
+		async with asyncio.timeout(1):
+			await pool.acquire()
+
+	await pool.close()
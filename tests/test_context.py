@@ -1,11 +1,37 @@
 import asyncio
 import base64
-import os
+import io
+from unittest.mock import AsyncMock, Mock
+
 import pytest
-from browser_use.browser.context import BrowserContext, BrowserContextConfig
+
+from browser_use.browser.context import BrowserContext, BrowserContextConfig, BrowserSession, get_screenshot_hash
 from browser_use.browser.views import BrowserState
-from browser_use.dom.views import DOMElementNode
-from unittest.mock import Mock
+from browser_use.dom.service import GET_REGISTERED_ELEMENT_CALL
+from browser_use.dom.views import DOMElementNode, DOMState
+
+
+@pytest.fixture
+def make_context():
+    """
+    Factory for a BrowserContext with a session over the given pages, without launching a browser.
+    With an element tree, the DOM service of every page returns a state of it.
+    """
+    def make(*pages, config=None, element_tree=None):
+        dummy_browser = Mock()
+        dummy_browser.config = Mock()
+        dummy_browser.config.cdp_url = None
+        context = BrowserContext(browser=dummy_browser, config=config or BrowserContextConfig())
+        context.session = BrowserSession(context=Mock(pages=list(pages)), cached_state=None)
+        if element_tree is not None:
+            dom_service = Mock()
+            dom_service.get_clickable_elements = AsyncMock(
+                side_effect=lambda **kwargs: DOMState(element_tree=element_tree, selector_map={})
+            )
+            context._get_dom_service = lambda _page: dom_service
+        return context
+    return make
+
 
 def test_is_url_allowed():
     """
@@ -323,4 +349,313 @@ async def test_remove_highlights_failure():
     try:
         await context.remove_highlights()
     except Exception as e:
-        pytest.fail(f"remove_highlights raised an exception: {e}")
\ No newline at end of file
+        pytest.fail(f"remove_highlights raised an exception: {e}")
+
+
+class DummyNetworkPage:
+    """Page stub that records event listeners so tests can emit request lifecycle events."""
+
+    def __init__(self):
+        self.listeners = {}
+
+    def on(self, event, handler):
+        self.listeners.setdefault(event, []).append(handler)
+
+    def remove_listener(self, event, handler):
+        self.listeners[event].remove(handler)
+
+    def emit(self, event, payload):
+        for handler in list(self.listeners.get(event, [])):
+            handler(payload)
+
+
+def make_request(url, resource_type="script"):
+    request = Mock()
+    request.url = url
+    request.resource_type = resource_type
+    request.headers = {}
+    return request
+
+
+def network_config(idle_time, max_wait):
+    return BrowserContextConfig(wait_for_network_idle_page_load_time=idle_time, maximum_wait_page_load_time=max_wait)
+
+
+@pytest.mark.asyncio
+async def test_wait_for_stable_network_handles_failed_requests(make_context):
+    """
+    Test that a failed request settles immediately instead of keeping the waiter busy until the timeout,
+    and that ignored URLs never count as pending.
+    """
+    page = DummyNetworkPage()
+    context = make_context(page, config=network_config(idle_time=0.05, max_wait=2.0))
+    loop = asyncio.get_running_loop()
+    request = make_request("https://example.com/app.js")
+
+    async def traffic():
+        await asyncio.sleep(0.01)
+        page.emit("request", make_request("https://www.google-analytics.com/collect"))
+        page.emit("request", request)
+        await asyncio.sleep(0.1)
+        page.emit("requestfailed", request)
+
+    start = loop.time()
+    traffic_task = asyncio.create_task(traffic())
+    await context._wait_for_stable_network()
+    elapsed = loop.time() - start
+    await traffic_task
+    assert 0.15 <= elapsed < 1.0, f"Expected the wait to end shortly after the failed request, took {elapsed:.2f}s"
+    assert all(not handlers for handlers in page.listeners.values()), "Expected all listeners to be removed"
+
+
+@pytest.mark.asyncio
+async def test_wait_for_stable_network_times_out(make_context):
+    """
+    Test that a request that never settles makes the waiter give up after maximum_wait_page_load_time.
+    """
+    page = DummyNetworkPage()
+    context = make_context(page, config=network_config(idle_time=0.05, max_wait=0.2))
+    loop = asyncio.get_running_loop()
+
+    async def traffic():
+        await asyncio.sleep(0.01)
+        page.emit("request", make_request("https://example.com/index.html", resource_type="document"))
+
+    start = loop.time()
+    traffic_task = asyncio.create_task(traffic())
+    await context._wait_for_stable_network()
+    await traffic_task
+    assert 0.2 <= loop.time() - start < 1.0
+
+
+@pytest.mark.asyncio
+async def test_update_state_batches_page_info(make_context):
+    """
+    Test that _update_state reads title and scroll information in a single evaluate call,
+    collects tab titles and returns a state built from the DOM service and screenshot results.
+    """
+    class DummyPage:
+        url = "https://example.com"
+        def __init__(self, title):
+            self.page_title = title
+            self.evaluate_calls = 0
+        async def evaluate(self, script):
+            self.evaluate_calls += 1
+            return {"title": self.page_title, "pixelsAbove": 100, "pixelsBelow": 600}
+        async def title(self):
+            return self.page_title
+        async def screenshot(self, full_page, animations):
+            return b"test"
+    page = DummyPage("Current")
+    other_page = DummyPage("Other")
+    element_tree = DOMElementNode(tag_name="body", xpath="", attributes={}, children=[], is_visible=True, parent=None)
+    context = make_context(other_page, page, element_tree=element_tree)
+    state = await context._update_state()
+    assert page.evaluate_calls == 1, "Expected title and scroll info to be read in one evaluate call"
+    assert state.title == "Current"
+    assert (state.pixels_above, state.pixels_below) == (100, 600)
+    assert [tab.title for tab in state.tabs] == ["Other", "Current"]
+    assert state.element_tree is element_tree
+    assert state.screenshot == base64.b64encode(b"test").decode("utf-8")
+
+@pytest.mark.asyncio
+async def test_take_screenshot_encodes_in_browser(make_context):
+    """
+    Test that a jpeg, downscaled, grayscale screenshot is captured with Page.captureScreenshot over CDP
+    and that the context falls back to playwright screenshots when CDP is not available.
+    """
+    class DummyCDPSession:
+        def __init__(self):
+            self.calls = []
+        async def send(self, method, params=None):
+            self.calls.append((method, params))
+            return {"data": "ZW5jb2RlZA=="}
+    cdp_session = DummyCDPSession()
+    page = Mock()
+    async def evaluate(script, full_page):
+        return {"x": 0, "y": 300, "width": 1280, "height": 1100, "dpr": 2}
+    page.evaluate = evaluate
+    async def new_cdp_session(_page):
+        return cdp_session
+    page.context.new_cdp_session = Mock(side_effect=new_cdp_session)
+    config = BrowserContextConfig(
+        screenshot_format="jpeg", screenshot_quality=60, screenshot_max_width=1280, screenshot_grayscale=True
+    )
+    context = make_context(page, config=config)
+    assert await context._take_screenshot(page) == "ZW5jb2RlZA=="
+    assert await context._take_screenshot(page) == "ZW5jb2RlZA=="
+    assert page.context.new_cdp_session.call_count == 1, "Expected the CDP session to be reused"
+    methods = [method for method, _ in cdp_session.calls[:3]]
+    assert methods == ["Emulation.setEmulatedVisionDeficiency", "Page.captureScreenshot", "Emulation.setEmulatedVisionDeficiency"]
+    params = cdp_session.calls[1][1]
+    assert params["format"] == "jpeg" and params["quality"] == 60
+    assert params["clip"] == {"x": 0, "y": 300, "width": 1280, "height": 1100, "scale": 0.5}
+    # Without CDP (e.g. firefox) playwright encodes the jpeg
+    page.context.new_cdp_session = Mock(side_effect=RuntimeError("CDP session is only available in Chromium"))
+    screenshot_kwargs = {}
+    async def screenshot(**kwargs):
+        screenshot_kwargs.update(kwargs)
+        return b"jpeg"
+    page.screenshot = screenshot
+    context._cdp_sessions.clear()
+    assert await context._take_screenshot(page) == base64.b64encode(b"jpeg").decode("utf-8")
+    assert screenshot_kwargs["type"] == "jpeg" and screenshot_kwargs["quality"] == 60
+
+@pytest.mark.asyncio
+async def test_update_state_skips_unchanged_screenshot(make_context):
+    """
+    Test that a screenshot matching the previous one reuses the previous image and is flagged as unchanged,
+    and that a changed screenshot is kept.
+    """
+    class DummyPage:
+        url = "https://example.com"
+        screenshot_bytes = b"first"
+        async def evaluate(self, script):
+            return {"title": "Title", "pixelsAbove": 0, "pixelsBelow": 0}
+        async def title(self):
+            return "Title"
+        async def screenshot(self, full_page, animations):
+            return self.screenshot_bytes
+    page = DummyPage()
+    element_tree = DOMElementNode(tag_name="body", xpath="", attributes={}, children=[], is_visible=True, parent=None)
+    context = make_context(page, element_tree=element_tree)
+    first = await context._update_state()
+    assert not first.screenshot_unchanged and first.screenshot_hash
+    second = await context._update_state()
+    assert second.screenshot_unchanged
+    assert second.screenshot is first.screenshot, "Expected the unchanged screenshot to share the previous image"
+    page.screenshot_bytes = b"second"
+    third = await context._update_state()
+    assert not third.screenshot_unchanged
+    assert third.screenshot == base64.b64encode(b"second").decode("utf-8")
+
+def test_screenshot_hash_ignores_encoding_noise():
+    """
+    Test that the perceptual hash of a screenshot survives re-encoding, and changes with a visible change.
+    """
+    Image = pytest.importorskip("PIL.Image")
+    ImageDraw = pytest.importorskip("PIL.ImageDraw")
+    def encode(image, image_format, **kwargs):
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format, **kwargs)
+        return base64.b64encode(buffer.getvalue()).decode("utf-8")
+    image = Image.new("RGB", (1280, 1024), "white")
+    ImageDraw.Draw(image).rectangle((37, 51, 611, 433), fill="navy")
+    ImageDraw.Draw(image).text((700, 100), "Hello world", fill="black")
+    first = encode(image, "JPEG", quality=95)
+    second = encode(image, "JPEG", quality=60)
+    assert first != second
+    assert get_screenshot_hash(first) == get_screenshot_hash(second)
+    # A menu opened next to the content
+    ImageDraw.Draw(image).rectangle((700, 592, 1099, 895), fill="darkred")
+    assert get_screenshot_hash(encode(image, "JPEG", quality=95)) != get_screenshot_hash(first)
+
+@pytest.mark.asyncio
+async def test_get_locate_element_resolves_registered_elements(make_context):
+    """
+    Test that elements of the current state are resolved from the in-page registry of buildDomTree.js
+    with one evaluate, and that stale elements and elements inside iframes fall back to CSS selectors.
+    """
+    body = DOMElementNode(tag_name="body", xpath="/body", attributes={}, children=[], is_visible=True, parent=None)
+    iframe = DOMElementNode(tag_name="iframe", xpath="html/body/iframe", attributes={}, children=[], is_visible=True, parent=body)
+    button = DOMElementNode(tag_name="button", xpath="html/body/button", attributes={}, children=[], is_visible=True,
+                            parent=body, highlight_index=0)
+    framed = DOMElementNode(tag_name="button", xpath="html/body/button", attributes={}, children=[], is_visible=True,
+                            parent=iframe, highlight_index=1)
+    registered_handle = Mock()
+    registered_handle.scroll_into_view_if_needed = AsyncMock()
+    selector_handle = Mock()
+    selector_handle.scroll_into_view_if_needed = AsyncMock()
+    page = Mock()
+    page.evaluate_handle = AsyncMock(return_value=Mock(as_element=Mock(return_value=registered_handle)))
+    page.query_selector = AsyncMock(return_value=selector_handle)
+    context = make_context(page)
+    context.session.cached_state = BrowserState(
+        element_tree=body, selector_map={0: button, 1: framed}, registry_id="doc:1", url="", title="", tabs=[]
+    )
+
+    assert await context.get_locate_element(button) is registered_handle
+    page.evaluate_handle.assert_awaited_once_with(GET_REGISTERED_ELEMENT_CALL, ["doc:1", 0])
+    page.query_selector.assert_not_awaited()
+
+    # An element of an older state is located by selector
+    stale = DOMElementNode(tag_name="button", xpath="html/body/button", attributes={}, children=[], is_visible=True,
+                           parent=body, highlight_index=0)
+    assert await context.get_locate_element(stale) is selector_handle
+    assert await context.get_registered_element(framed) is None
+    assert page.evaluate_handle.await_count == 1
+
+@pytest.mark.asyncio
+async def test_get_state_reuses_state_of_unchanged_page(make_context):
+    """
+    Test that get_state returns the cached state while the page fingerprint is unchanged, and builds a new
+    state once it changes.
+    """
+    page = Mock()
+    page.url = "https://example.com"
+    fingerprint = {"documentId": "doc", "epoch": 1, "interactive": 7, "scroll": [0, 0, 800, 600], "viewport": [800, 600]}
+    dom_service = Mock()
+    dom_service.get_fingerprint = AsyncMock(side_effect=lambda: dict(fingerprint))
+    context = make_context(page)
+    context._get_dom_service = lambda _page: dom_service
+    context._wait_for_page_and_frames_load = AsyncMock()
+    states = iter([Mock(), Mock(), Mock()])
+    context._update_state = AsyncMock(side_effect=lambda: next(states))
+
+    first = await context.get_state()
+    assert await context.get_state() is first
+    assert context._update_state.await_count == 1
+    assert await context.has_unchanged_interactive_elements()
+
+    # A mutation that does not touch the interactive elements
+    fingerprint["epoch"] = 2
+    assert await context.has_unchanged_interactive_elements()
+    second = await context.get_state()
+    assert second is not first
+    assert context._update_state.await_count == 2
+    # The page load is awaited before every fingerprint is compared
+    assert context._wait_for_page_and_frames_load.await_count == 5
+
+    # An action drops the fingerprint, the indices of the state are still checked against it
+    context.drop_cached_fingerprint()
+    assert await context.has_unchanged_interactive_elements()
+    assert await context.get_state() is not second
+    assert context._update_state.await_count == 3
+
+    fingerprint["interactive"] = 8
+    assert not await context.has_unchanged_interactive_elements()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "settled",
+    [
+        {"documentId": "next", "url": "https://example.com/next"},
+        {"epoch": 2, "interactive": 8},
+    ],
+    ids=["navigation", "xhr"],
+)
+async def test_has_unchanged_interactive_elements_waits_for_the_last_action(make_context, settled):
+    """
+    Test that the fingerprint is compared after the navigation or request started by the previous action
+    settled, not while the page still shows the elements of the cached state.
+    """
+    page = Mock()
+    page.url = "https://example.com"
+    fingerprint = {"documentId": "doc", "epoch": 1, "interactive": 7, "scroll": [0, 0, 800, 600], "viewport": [800, 600]}
+    dom_service = Mock()
+    dom_service.get_fingerprint = AsyncMock(side_effect=lambda: dict(fingerprint))
+    context = make_context(page)
+    context._get_dom_service = lambda _page: dom_service
+    context._wait_for_page_and_frames_load = AsyncMock()
+    context._update_state = AsyncMock(return_value=Mock())
+    await context.get_state()
+
+    def settle():
+        page.url = settled.pop("url", page.url)
+        fingerprint.update(settled)
+
+    # The click returned before the page reacted, the page changes while the load is awaited
+    context._wait_for_page_and_frames_load = AsyncMock(side_effect=settle)
+    assert not await context.has_unchanged_interactive_elements()
+    context._wait_for_page_and_frames_load.assert_awaited_once()
@@ -0,0 +1,93 @@
+from browser_use.dom.diff.service import DomDiff
+from browser_use.dom.views import DOMElementNode, DOMState, DOMTextNode
+
+
+def element(tag_name, xpath, parent=None, attributes=None, text=None):
+	node = DOMElementNode(
+		tag_name=tag_name,
+		xpath=xpath,
+		attributes=attributes or {},
+		children=[],
+		is_visible=True,
+		parent=parent,
+	)
+	if parent is not None:
+		parent.children.append(node)
+	if text is not None:
+		node.children.append(DOMTextNode(text=text, is_visible=True, parent=node))
+	return node
+
+
+def test_diff_reports_inserted_removed_moved_and_text_changes():
+	"""
+	Test that elements are aligned by xpath and attributes, and that left over elements with unique attributes
+	are reported as moved instead of removed and inserted.
+	"""
+	previous = element('body', '/body')
+	element('h1', '/body/h1', previous, text='Cart (1)')
+	element('button', '/body/button[1]', previous, {'id': 'checkout'}, text='Checkout')
+	element('div', '/body/div', previous, {'class': 'banner'}, text='Sale')
+
+	current = element('body', '/body')
+	heading = element('h1', '/body/h1', current, text='Cart (2)')
+	form = element('form', '/body/form', current, {'action': '/pay'})
+	checkout = element('button', '/body/form/button', form, {'id': 'checkout'}, text='Pay now')
+
+	diff = DomDiff.compare_states(DOMState(previous, {}), DOMState(current, {}))
+	assert diff.has_changes
+	assert diff.inserted == [form]
+	assert [node.attributes for node in diff.removed] == [{'class': 'banner'}]
+	assert [(change.previous.xpath, change.current) for change in diff.moved] == [('/body/button[1]', checkout)]
+	assert [(change.current, change.previous_text, change.current_text) for change in diff.text_changed] == [
+		(heading, 'Cart (1)', 'Cart (2)'),
+		(checkout, 'Checkout', 'Pay now'),
+	]
+
+
+def test_diff_of_rebuilt_tree_is_empty():
+	"""
+	Test that a rebuilt tree has no changes, with duplicate elements matched in document order and shadow root
+	elements scoped by their host.
+	"""
+
+	def build():
+		body = element('body', '/body')
+		for _ in range(3):
+			element('li', '/body/li', body, text='Item')
+		host = element('div', '/body/div', body)
+		host.shadow_root = True
+		element('button', 'button', host, text='Inside')
+		element('button', 'button', body, text='Outside')
+		return body
+
+	assert not DomDiff.compare(build(), build()).has_changes
+
+
+def test_diff_aligns_siblings_after_an_insertion():
+	"""
+	Test that an element inserted before its siblings does not report the renumbered siblings and their descendants
+	as removed and inserted, and that reordered siblings are reported as moved.
+	"""
+
+	def build(inserted):
+		body = element('body', '/body')
+		offset = 0
+		if inserted:
+			element('div', '/body/div[1]', body, {'role': 'alert'}, text='Saved')
+			offset = 1
+		for index in range(1, 4):
+			section = element('div', f'/body/div[{index + offset}]', body)
+			element('p', f'/body/div[{index + offset}]/p', section, text=f'Section {index}')
+		items = element('ul', '/body/ul', body)
+		for index in (2, 1) if inserted else (1, 2):
+			element('li', f'/body/ul/li[{index}]', items, {'data-id': str(index)}, text=f'Item {index}')
+		return body
+
+	current = build(inserted=True)
+	diff = DomDiff.compare(build(inserted=False), current)
+	assert diff.inserted == [current.children[0]]
+	assert diff.removed == []
+	assert [(change.previous.children[0].text, change.current.children[0].text) for change in diff.moved] == [
+		('Item 1', 'Item 1')
+	]
+	assert diff.text_changed == []
@@ -0,0 +1,199 @@
+import json
+from unittest.mock import AsyncMock, Mock
+
+from browser_use.dom.service import BUILD_DOM_TREE_CALL, DomService, get_script_version
+
+
+def make_page(*snapshots):
+	"""
+	Create a mocked page whose buildDomTree evaluations return the given snapshots in order.
+	Every evaluate call is recorded in page.calls as (script, args).
+	"""
+	page = Mock()
+	page.calls = []
+	remaining = list(snapshots)
+
+	async def evaluate(script, args=None):
+		page.calls.append((script, args))
+		if script == '1+1':
+			return 2
+		if args is None:
+			return None
+		return remaining.pop(0)
+
+	page.evaluate = AsyncMock(side_effect=evaluate)
+	return page
+
+
+def button(text_id, highlight_index):
+	return {
+		'tagName': 'button',
+		'attributes': {},
+		'xpath': f'button[{highlight_index + 1}]',
+		'children': [text_id],
+		'isVisible': True,
+		'isTopElement': True,
+		'isInteractive': True,
+		'isInViewport': True,
+		'highlightIndex': highlight_index,
+	}
+
+
+def text(value):
+	return {'type': 'TEXT_NODE', 'text': value, 'isVisible': True}
+
+
+def body(*children):
+	return {'tagName': 'body', 'attributes': {}, 'xpath': '/body', 'children': list(children)}
+
+
+async def test_reused_snapshot_replaces_changed_tree():
+	"""
+	Test that the id of the last snapshot is sent as the base of the next one,
+	and that a changed page replaces the cached tree.
+	"""
+	first = {'rootId': 1, 'snapshotId': 'doc:1', 'map': {'1': body('2'), '2': button('3', 0), '3': text('First')}}
+	second = {
+		'rootId': 1,
+		'snapshotId': 'doc:2',
+		'map': {'1': body('2', '4'), '2': button('3', 0), '3': text('First'), '4': button('5', 1), '5': text('Second')},
+	}
+	page = make_page(first, second)
+	dom_service = DomService(page, reuse_snapshots=True)
+
+	state = await dom_service.get_clickable_elements()
+	assert state.element_tree.clickable_elements_to_string() == '[0]<button First/>'
+
+	state = await dom_service.get_clickable_elements()
+	assert page.calls[-1][1]['baseSnapshotId'] == 'doc:1'
+	assert state.element_tree.clickable_elements_to_string() == '[0]<button First/>\n[1]<button Second/>'
+	assert dom_service._snapshot_id == 'doc:2'
+	assert state.selector_map[1].parent is state.element_tree
+
+
+async def test_reused_snapshot_reuses_unchanged_tree():
+	"""
+	Test that an unchanged snapshot reuses the cached tree without rebuilding it.
+	"""
+	full = {'rootId': 1, 'snapshotId': 'doc:1', 'map': {'1': body('2'), '2': button('3', 0), '3': text('Only')}}
+	page = make_page(full, {'snapshotId': 'doc:1', 'unchanged': True})
+	dom_service = DomService(page, reuse_snapshots=True)
+
+	first = await dom_service.get_clickable_elements()
+	second = await dom_service.get_clickable_elements()
+	assert second.element_tree is first.element_tree
+	assert second.selector_map is first.selector_map
+
+
+async def test_reused_snapshot_installs_missing_observer():
+	"""
+	Test that a page without the in-page observer gets a full snapshot and the observer is installed lazily.
+	"""
+	legacy = {'rootId': '2', 'map': {'0': text('Hello'), '1': button('0', 0), '2': body('1')}}
+	page = make_page(legacy)
+	dom_service = DomService(page, reuse_snapshots=True)
+
+	state = await dom_service.get_clickable_elements()
+	assert state.element_tree.clickable_elements_to_string() == '[0]<button Hello/>'
+	assert page.calls[-1] == (DomService.get_observer_script(), None)
+	assert dom_service._snapshot_id is None
+
+
+async def test_packed_snapshot_is_unpacked():
+	"""
+	Test that the packed columnar wire format decodes to the same tree as the regular node map.
+	"""
+	packed = {
+		'format': 'packed',
+		'rootId': 2,
+		'strings': ['Click', 'button', 'button[1]', 'type', 'submit', 'body', '/body', 'doc:1'],
+		'nodes': {
+			'id': [0, 1, 2],
+			'tag': [-1, 1, 5],
+			'xpath': [-1, 2, 6],
+			'text': [0, -1, -1],
+			'flags': [1, 15, 0],
+			'highlightIndex': [-1, 0, -1],
+			'elementId': [-1, 7, -1],
+			'attributeOffsets': [0, 0, 2, 2],
+			'attributes': [3, 4],
+			'childOffsets': [0, 0, 1, 2],
+			'children': [0, 1],
+		},
+	}
+	page = make_page(json.dumps(packed))
+	dom_service = DomService(page, packed=True)
+
+	state = await dom_service.get_clickable_elements()
+	assert page.calls[-1][1]['packed'] is True
+	assert state.element_tree.clickable_elements_to_string(include_attributes=['type']) == '[0]<button submit>Click/>'
+	button_node = state.selector_map[0]
+	assert button_node.xpath == 'button[1]'
+	assert button_node.is_visible and button_node.is_top_element and button_node.is_interactive and button_node.is_in_viewport
+	assert not button_node.shadow_root
+	assert button_node.element_id == 'doc:1'
+
+
+async def test_build_dom_tree_is_injected_once_per_document():
+	"""
+	Test that buildDomTree.js is injected into a page that predates the init script only once,
+	and later snapshots only send the call of the registered function.
+	"""
+	snapshot = {'rootId': '2', 'map': {'0': text('Hello'), '1': button('0', 0), '2': body('1')}}
+	page = Mock()
+	page.calls = []
+	page.registered_version = None
+
+	async def evaluate(script, args=None):
+		page.calls.append(script)
+		if script == '1+1':
+			return 2
+		if script == DomService.get_injection_script():
+			page.registered_version = get_script_version()
+			return None
+		assert script == BUILD_DOM_TREE_CALL
+		return snapshot if args['scriptVersion'] == page.registered_version else None
+
+	page.evaluate = AsyncMock(side_effect=evaluate)
+	dom_service = DomService(page)
+
+	for _ in range(2):
+		state = await dom_service.get_clickable_elements()
+		assert state.element_tree.clickable_elements_to_string() == '[0]<button Hello/>'
+
+	assert page.calls.count(DomService.get_injection_script()) == 1
+	assert page.calls.count(BUILD_DOM_TREE_CALL) == 3
+	assert dom_service.js_code not in page.calls
+
+
+async def test_truncated_walk_is_flagged():
+	"""
+	Test that the walk budgets are passed to the page and a truncated walk is reported in the DOM state.
+	"""
+	truncated = {'rootId': '2', 'map': {'0': text('Hello'), '1': button('0', 0), '2': body('1')}, 'truncated': True}
+	complete = {'rootId': '2', 'map': {'0': text('Hello'), '1': button('0', 0), '2': body('1')}}
+	page = make_page(truncated, complete)
+	dom_service = DomService(page, max_nodes=500, max_millis=200, time_sliced=True)
+
+	state = await dom_service.get_clickable_elements()
+	assert state.truncated
+	assert state.element_tree.clickable_elements_to_string() == '[0]<button Hello/>'
+	args = page.calls[-1][1]
+	assert (args['maxNodes'], args['maxMillis'], args['timeSliced']) == (500, 200, True)
+
+	state = await dom_service.get_clickable_elements()
+	assert not state.truncated
+
+
+async def test_hit_test_grid_size_is_passed_to_the_walk():
+	"""
+	Test that the occlusion grid is off by default and its cell size is passed to the page when set.
+	"""
+	snapshot = {'rootId': '2', 'map': {'0': text('Hello'), '1': button('0', 0), '2': body('1')}}
+	page = make_page(snapshot, snapshot)
+
+	await DomService(page).get_clickable_elements()
+	assert page.calls[-1][1]['hitTestGridSize'] == 0
+
+	await DomService(page, hit_test_grid_size=24).get_clickable_elements()
+	assert page.calls[-1][1]['hitTestGridSize'] == 24
@@ -0,0 +1,313 @@
+from unittest.mock import AsyncMock, Mock
+
+from browser_use.dom.service import DomService
+from browser_use.dom.snapshot.service import PREPARE_SCRIPT
+from browser_use.dom.snapshot.views import SNAPSHOT_COMPUTED_STYLES
+
+
+def node(name, children=(), bounds=None, node_type=1, value='', paint=0, styles=None, **options):
+	return {
+		'name': name,
+		'children': list(children),
+		'bounds': bounds,
+		'type': node_type,
+		'value': value,
+		'paint': paint,
+		'styles': styles or {},
+		**options,
+	}
+
+
+def text(value, bounds=(0, 0, 50, 10), paint=0):
+	return node('#text', bounds=bounds, node_type=3, value=value, paint=paint)
+
+
+def make_snapshot(*documents):
+	"""
+	Encode nested node specs into the columnar format of DOMSnapshot.captureSnapshot.
+	"""
+	strings = []
+
+	def intern(value):
+		if value not in strings:
+			strings.append(value)
+		return strings.index(value)
+
+	encoded = []
+	for root in documents:
+		nodes = {
+			'parentIndex': [],
+			'nodeType': [],
+			'nodeName': [],
+			'nodeValue': [],
+			'backendNodeId': [],
+			'attributes': [],
+			'shadowRootType': {'index': [], 'value': []},
+			'contentDocumentIndex': {'index': [], 'value': []},
+			'isClickable': {'index': []},
+		}
+		layout = {'nodeIndex': [], 'bounds': [], 'styles': [], 'paintOrders': [], 'offsetRects': []}
+
+		def add(spec, parent_index):
+			index = len(nodes['parentIndex'])
+			nodes['parentIndex'].append(parent_index)
+			nodes['nodeType'].append(spec['type'])
+			nodes['nodeName'].append(intern(spec['name']))
+			nodes['nodeValue'].append(intern(spec['value']) if spec['value'] else -1)
+			nodes['backendNodeId'].append(1000 * len(encoded) + index)
+			nodes['attributes'].append([intern(item) for pair in spec.get('attributes', {}).items() for item in pair])
+			if 'shadow' in spec:
+				nodes['shadowRootType']['index'].append(index)
+				nodes['shadowRootType']['value'].append(intern(spec['shadow']))
+			if 'content' in spec:
+				nodes['contentDocumentIndex']['index'].append(index)
+				nodes['contentDocumentIndex']['value'].append(spec['content'])
+			if spec.get('clickable'):
+				nodes['isClickable']['index'].append(index)
+			if spec['bounds'] is not None:
+				styles = {'display': 'block', 'visibility': 'visible', 'opacity': '1', 'position': 'static', **spec['styles']}
+				layout['nodeIndex'].append(index)
+				layout['bounds'].append(list(spec['bounds']))
+				layout['styles'].append([intern(styles.get(name, '')) for name in SNAPSHOT_COMPUTED_STYLES])
+				layout['paintOrders'].append(spec['paint'])
+				layout['offsetRects'].append(list(spec['bounds']) if spec['type'] == 1 else [])
+			for child in spec['children']:
+				add(child, index)
+
+		add(root, -1)
+		frame_id = intern(f'frame-{len(encoded)}')
+		encoded.append({'nodes': nodes, 'layout': layout, 'frameId': frame_id, 'scrollOffsetX': 0, 'scrollOffsetY': 0})
+	return {'documents': encoded, 'strings': strings}
+
+
+def make_page(snapshot, ax_trees=None):
+	"""
+	Create a mocked page whose CDP session returns the given snapshot and the accessibility trees of the
+	frames in ax_trees. Highlights drawn by the injected buildDomTree.js are recorded in page.highlights as
+	[index, box, element, iframe], with the elements as the ids of their remote objects.
+	"""
+	page = Mock()
+	page.highlights = []
+	page.injected = False
+
+	async def evaluate(script, args=None):
+		if script == '1+1':
+			return 2
+		if script == PREPARE_SCRIPT:
+			return {'width': 800, 'height': 600}
+		if script == DomService.get_injection_script():
+			page.injected = True
+			return None
+		raise AssertionError('buildDomTree.js must not run with the cdp engine')
+
+	page.evaluate = AsyncMock(side_effect=evaluate)
+	cdp_session = Mock()
+
+	async def send(method, params=None):
+		if method == 'Accessibility.getFullAXTree':
+			if params['frameId'] not in (ax_trees or {}):
+				raise Exception('No frame with given id found')
+			return {'nodes': ax_trees[params['frameId']]}
+		if method == 'DOM.resolveNode':
+			return {'object': {'objectId': f'node-{params["backendNodeId"]}'}}
+		if method == 'Runtime.callFunctionOn':
+			assert params['objectId'] == 'node-0'
+			if not page.injected:
+				return {'result': {'type': 'boolean', 'value': False}}
+			elements = [argument['objectId'] for argument in params['arguments'][2:]]
+			for index, box, target, iframe in params['arguments'][1]['value']:
+				page.highlights.append(
+					[index, box, elements[target] if target >= 0 else None, elements[iframe] if iframe >= 0 else None]
+				)
+			return {'result': {'type': 'boolean', 'value': True}}
+		if method == 'Runtime.releaseObjectGroup':
+			return {}
+		return snapshot
+
+	cdp_session.send = AsyncMock(side_effect=send)
+	page.context.new_cdp_session = AsyncMock(return_value=cdp_session)
+	return page
+
+
+async def test_cdp_snapshot_engine_builds_dom_tree():
+	"""
+	Test that the CDP snapshot engine applies the checks of buildDomTree.js: interactive and top elements are
+	highlighted, covered and hidden elements are not, XPaths stop at shadow roots and restart in iframes.
+	"""
+	frame = node(
+		'#document',
+		[
+			node(
+				'HTML',
+				[
+					node(
+						'BODY',
+						[
+							node('BUTTON', [text('In frame')], bounds=(5, 5, 50, 20)),
+						],
+						bounds=(0, 0, 300, 200),
+					)
+				],
+				bounds=(0, 0, 300, 200),
+			)
+		],
+		node_type=9,
+	)
+	main = node(
+		'#document',
+		[
+			node(
+				'HTML',
+				[
+					node(
+						'BODY',
+						[
+							node(
+								'DIV',
+								[
+									node('BUTTON', [text('Click')], bounds=(10, 10, 100, 30), paint=2),
+									node('SPAN', [text('Listener')], bounds=(200, 10, 100, 30), paint=2, clickable=True),
+								],
+								bounds=(0, 0, 800, 100),
+								paint=1,
+							),
+							node('A'),
+							node('DIV', [text('Hidden', bounds=None)], attributes={'style': 'display: none'}),
+							node('BUTTON', [text('Covered')], bounds=(10, 200, 100, 30), paint=3),
+							node('DIV', bounds=(0, 150, 800, 200), paint=5),
+							node(
+								'DIV',
+								[
+									node(
+										'#document-fragment',
+										[node('BUTTON', [text('Shadow')], bounds=(10, 400, 100, 30), paint=6)],
+										node_type=11,
+										shadow='open',
+									),
+								],
+								bounds=(0, 400, 800, 50),
+								paint=6,
+							),
+							node('IFRAME', bounds=(100, 450, 300, 200), paint=7, content=1),
+						],
+						bounds=(0, 0, 800, 600),
+					)
+				],
+				bounds=(0, 0, 800, 600),
+			)
+		],
+		node_type=9,
+	)
+
+	page = make_page(make_snapshot(main, frame))
+	dom_service = DomService(page, engine='cdp')
+	state = await dom_service.get_clickable_elements(viewport_expansion=0)
+
+	assert state.element_tree.clickable_elements_to_string() == (
+		'[0]<button Click/>\n[1]<span Listener/>\nCovered\n[2]<button Shadow/>\n[3]<button In frame/>'
+	)
+	assert [state.selector_map[index].xpath for index in range(4)] == [
+		'html/body/div/button',
+		'html/body/div/span',
+		'',
+		'html/body/button',
+	]
+	assert state.selector_map[0].backend_node_id == 4
+	# Empty anchors are dropped, elements without layout are kept like in buildDomTree.js
+	assert [child.tag_name for child in state.element_tree.children if hasattr(child, 'tag_name')] == [
+		'div',
+		'div',
+		'button',
+		'div',
+		'div',
+		'iframe',
+	]
+	# Highlights are drawn by the injected renderer of buildDomTree.js, on the elements of the top document and
+	# at the snapshot box of iframe content, relative to the iframe element
+	assert page.injected
+	assert page.highlights[0] == [0, [10, 10, 100, 30], 'node-4', None]
+	assert page.highlights[3] == [3, [5, 5, 50, 20], None, 'node-18']
+
+
+async def test_accessibility_engine_takes_interactive_elements_from_ax_tree():
+	"""
+	Test that the accessibility engine marks the controls of the accessibility tree as interactive, skips ignored
+	and disabled nodes, and falls back to the DOM heuristics for frames without an accessibility tree.
+	"""
+	frame = node(
+		'#document',
+		[
+			node(
+				'HTML',
+				[
+					node(
+						'BODY',
+						[
+							node('BUTTON', [text('In frame')], bounds=(5, 5, 50, 20)),
+						],
+						bounds=(0, 0, 300, 200),
+					)
+				],
+				bounds=(0, 0, 300, 200),
+			)
+		],
+		node_type=9,
+	)
+	main = node(
+		'#document',
+		[
+			node(
+				'HTML',
+				[
+					node(
+						'BODY',
+						[
+							node('SPAN', [text('Custom control')], bounds=(10, 10, 100, 30), paint=1),
+							node('BUTTON', [text('Hidden')], bounds=(10, 50, 100, 30), paint=1),
+							node('BUTTON', [text('Disabled')], bounds=(10, 90, 100, 30), paint=1),
+							node('DIV', [text('Editor')], bounds=(10, 130, 100, 30), paint=1),
+							node('DIV', [text('Listener')], bounds=(10, 170, 100, 30), paint=1, clickable=True),
+							node('IFRAME', bounds=(100, 450, 300, 200), paint=2, content=1),
+						],
+						bounds=(0, 0, 800, 600),
+					)
+				],
+				bounds=(0, 0, 800, 600),
+			)
+		],
+		node_type=9,
+	)
+	ax_tree = [
+		{
+			'nodeId': '1',
+			'ignored': False,
+			'role': {'value': 'RootWebArea'},
+			'backendDOMNodeId': 0,
+			'properties': [{'name': 'focusable', 'value': {'value': True}}],
+		},
+		{'nodeId': '2', 'ignored': False, 'role': {'value': 'button'}, 'backendDOMNodeId': 3},
+		{'nodeId': '3', 'ignored': True, 'role': {'value': 'button'}, 'backendDOMNodeId': 5},
+		{
+			'nodeId': '4',
+			'ignored': False,
+			'role': {'value': 'button'},
+			'backendDOMNodeId': 7,
+			'properties': [{'name': 'disabled', 'value': {'value': True}}],
+		},
+		{
+			'nodeId': '5',
+			'ignored': False,
+			'role': {'value': 'generic'},
+			'backendDOMNodeId': 9,
+			'properties': [{'name': 'editable', 'value': {'value': 'plaintext'}}],
+		},
+	]
+
+	page = make_page(make_snapshot(main, frame), ax_trees={'frame-0': ax_tree})
+	dom_service = DomService(page, engine='accessibility')
+	state = await dom_service.get_clickable_elements(viewport_expansion=0)
+
+	assert state.element_tree.clickable_elements_to_string() == (
+		'[0]<span Custom control/>\nHidden\nDisabled\n[1]<div Editor/>\n[2]<div Listener/>\n[3]<button In frame/>'
+	)
+	assert [state.selector_map[index].backend_node_id for index in range(3)] == [3, 9, 11]
@@ -0,0 +1,114 @@
+import sys
+
+from browser_use.dom.history_tree_processor.service import HistoryTreeProcessor
+from browser_use.dom.views import DOMElementNode, DOMState, DOMTextNode
+
+
+def element(tag_name, parent=None, highlight_index=None, attributes=None):
+	node = DOMElementNode(
+		tag_name=tag_name,
+		xpath=tag_name,
+		attributes=attributes or {},
+		children=[],
+		is_visible=True,
+		parent=parent,
+		highlight_index=highlight_index,
+	)
+	if parent is not None:
+		parent.children.append(node)
+	return node
+
+
+def text(value, parent, is_visible=True):
+	node = DOMTextNode(text=value, is_visible=is_visible, parent=parent)
+	parent.children.append(node)
+	return node
+
+
+def test_clickable_elements_to_string_nested_highlights():
+	"""
+	Test that text is assigned to the nearest highlighted ancestor, nested highlighted elements
+	get their own line after their ancestor, and only visible free text is listed on its own.
+	"""
+	body = element('body')
+	text('Intro', body)
+	text('Hidden', body, is_visible=False)
+	card = element('div', body, highlight_index=0, attributes={'role': 'button'})
+	text('Card title', element('h2', card))
+	link = element('a', card, highlight_index=1)
+	text('Read more', link)
+	text('Card footer', card, is_visible=False)
+	text('Outro', body)
+
+	assert body.clickable_elements_to_string(include_attributes=['role']) == (
+		'Intro\n[0]<div button>Card title\nCard footer/>\n[1]<a Read more/>\nOutro'
+	)
+	# Free text inside a highlighted ancestor is not listed when serialising a subtree
+	assert card.children[0].clickable_elements_to_string() == ''
+	assert card.get_all_text_till_next_clickable_element() == 'Card title\nCard footer'
+
+
+def test_clickable_elements_to_string_deep_tree():
+	"""
+	Test that trees deeper than the recursion limit can be serialised.
+	"""
+	depth = sys.getrecursionlimit() + 100
+	body = element('body')
+	current = body
+	for level in range(depth):
+		current = element('div', current)
+		text(f'Level {level}', current)
+	button = element('button', current, highlight_index=0)
+	text('Submit', button)
+
+	lines = body.clickable_elements_to_string().split('\n')
+	assert len(lines) == depth + 1
+	assert lines[0] == 'Level 0'
+	assert lines[-1] == '[0]<button Submit/>'
+
+
+def test_hashes_are_rolled_top_down_and_match_history_elements():
+	"""
+	Test that branch path hashes are extended from the memoized hash of the parent, and that elements
+	still match the history elements converted from them.
+	"""
+	body = element('body')
+	form = element('form', element('div', body))
+	submit = element('button', form, highlight_index=0, attributes={'type': 'submit'})
+	reset = element('button', form, highlight_index=1, attributes={'type': 'reset'})
+
+	assert submit.hash.branch_path_hash == reset.hash.branch_path_hash
+	assert submit.hash.attributes_hash != reset.hash.attributes_hash
+	# The ancestors were hashed on the way, the sibling extended the hash of its parent
+	assert form._branch_path_hash is not None and body._branch_path_hash is None
+	assert reset._branch_path_hash == HistoryTreeProcessor._extend_branch_path_hash(form._branch_path_hash, 'button')
+
+	history_element = HistoryTreeProcessor.convert_dom_element_to_history_element(reset)
+	assert history_element.entire_parent_branch_path == ['div', 'form', 'button']
+	assert HistoryTreeProcessor.compare_history_element_and_dom_element(history_element, reset)
+	assert not HistoryTreeProcessor.compare_history_element_and_dom_element(history_element, submit)
+	assert HistoryTreeProcessor.find_history_element_in_tree(history_element, body) is reset
+
+
+def test_history_elements_are_found_in_the_element_index():
+	"""
+	Test that the element index of a state is built once, finds history elements by hash and falls back to
+	unique stable attributes when the element moved.
+	"""
+	body = element('body')
+	search = element('input', body, highlight_index=0, attributes={'name': 'q'})
+	submit = element('button', body, highlight_index=1, attributes={'type': 'submit'})
+	state = DOMState(element_tree=body, selector_map={0: search, 1: submit})
+
+	index = state.element_index
+	assert state.element_index is index
+	history_submit = HistoryTreeProcessor.convert_dom_element_to_history_element(submit)
+	assert HistoryTreeProcessor.find_history_element_in_index(history_submit, index) is submit
+
+	# The search field moved into a form, its hash changed but its name did not
+	moved_body = element('body')
+	moved_search = element('input', element('form', moved_body), highlight_index=0, attributes={'name': 'q'})
+	moved_state = DOMState(element_tree=moved_body, selector_map={0: moved_search})
+	history_search = HistoryTreeProcessor.convert_dom_element_to_history_element(search)
+	assert HistoryTreeProcessor.find_history_element_in_index(history_search, moved_state.element_index) is moved_search
+	assert HistoryTreeProcessor.find_history_element_in_index(history_submit, moved_state.element_index) is None
@@ -12,6 +12,7 @@ from browser_use.browser.views import BrowserState
 from browser_use.controller.registry.service import Registry
 from browser_use.controller.registry.views import ActionModel
 from browser_use.controller.service import Controller
+from browser_use.dom.views import DOMElementNode
 
 # run with python -m pytest tests/test_service.py
 
@@ -124,6 +125,105 @@ class TestAgent:
 			assert 'Test error' in agent._last_result[0].error
 			assert agent._last_result[0].include_in_memory == True
 
+	@pytest.mark.asyncio
+	async def test_multi_act_follows_elements_to_their_new_index(self):
+		"""
+		Test that multi_act remaps the index of an action to the new index of the same element when the numbering
+		shifted after a previous action, and stops the batch when the target element is gone or an element appeared
+		on a branch of the page that was not there before.
+		"""
+
+		def make_selector_map(element_ids, in_dialog=()):
+			# The buttons share a parent so their branch paths are real and the new elements check applies
+			body = DOMElementNode(tag_name='body', xpath='html/body', attributes={}, children=[], is_visible=True, parent=None)
+			dialog = DOMElementNode(
+				tag_name='dialog', xpath='html/body/dialog', attributes={}, children=[], is_visible=True, parent=body
+			)
+			selector_map = {}
+			for index, element_id in enumerate(element_ids):
+				parent = dialog if element_id in in_dialog else body
+				selector_map[index] = DOMElementNode(
+					tag_name='button',
+					xpath=f'{parent.xpath}/button[{index + 1}]',
+					attributes={},
+					children=[],
+					is_visible=True,
+					parent=parent,
+					highlight_index=index,
+					element_id=element_id,
+				)
+				parent.children.append(selector_map[index])
+			return selector_map
+
+		def set_new_state(selector_map):
+			agent.browser_context.get_state = AsyncMock(
+				return_value=BrowserState(url='', title='', tabs=[], element_tree=MagicMock(), selector_map=selector_map)
+			)
+			agent.controller.act.reset_mock()
+
+		with patch('browser_use.agent.service.MessageManager'):
+			agent = Agent(task='Test task', llm=MagicMock(spec=BaseChatModel))
+
+		action_model = Controller().registry.create_action_model()
+		actions = [action_model(click_element={'index': 0}), action_model(click_element={'index': 2})]
+		agent.browser_context = AsyncMock()
+		agent.browser_context.config.wait_between_actions = 0
+		agent.browser_context.has_unchanged_interactive_elements = AsyncMock(return_value=False)
+		agent.browser_context.get_selector_map = AsyncMock(return_value=make_selector_map(['a', 'b', 'c']))
+		agent.controller = AsyncMock()
+		agent.controller.act = AsyncMock(return_value=ActionResult())
+
+		# A new button appeared above the others, on the same branch of the page
+		set_new_state(make_selector_map(['new', 'a', 'b', 'c']))
+		results = await agent.multi_act(actions)
+
+		assert len(results) == 2
+		assert [call.args[0].get_index() for call in agent.controller.act.await_args_list] == [0, 3]
+		# The model output keeps the index the model chose
+		assert actions[1].get_index() == 2
+
+		# The target of the second action was removed
+		set_new_state(make_selector_map(['a', 'b']))
+		results = await agent.multi_act(actions)
+
+		assert agent.controller.act.await_count == 1
+		assert results[-1].extracted_content == 'Element 2 is gone after action 1 / 2'
+
+		# A dialog with a button appeared, it may cover the target even though the target can be followed
+		set_new_state(make_selector_map(['a', 'b', 'c', 'accept'], in_dialog=['accept']))
+		results = await agent.multi_act(actions)
+
+		assert agent.controller.act.await_count == 1
+		assert results[-1].extracted_content == 'Something new appeared after action 1 / 2'
+
+		agent.controller.act.reset_mock()
+		results = await agent.multi_act(actions, check_for_new_elements=False)
+
+		assert agent.controller.act.await_count == 2
+
+	@pytest.mark.asyncio
+	async def test_multi_act_skips_state_when_fingerprint_is_unchanged(self):
+		"""
+		Test that multi_act does not capture a new state before an indexed action when the page fingerprint
+		reports the same interactive elements as the cached state.
+		"""
+		with patch('browser_use.agent.service.MessageManager'):
+			agent = Agent(task='Test task', llm=MagicMock(spec=BaseChatModel))
+
+		action_model = Controller().registry.create_action_model()
+		actions = [action_model(click_element={'index': 0}), action_model(click_element={'index': 1})]
+		agent.browser_context = AsyncMock()
+		agent.browser_context.config.wait_between_actions = 0
+		agent.browser_context.has_unchanged_interactive_elements = AsyncMock(return_value=True)
+		agent.browser_context.get_selector_map = AsyncMock(return_value={})
+		agent.controller = AsyncMock()
+		agent.controller.act = AsyncMock(return_value=ActionResult())
+
+		results = await agent.multi_act(actions)
+
+		assert len(results) == 2
+		agent.browser_context.get_state.assert_not_awaited()
+
 
 class TestRegistry:
 	@pytest.fixture